@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, status, Depends, UploadFile, File
+from fastapi import APIRouter, HTTPException, status, Depends, UploadFile, File, Query
 from sqlalchemy.orm import Session
 import os
 from app.database.session import get_db
@@ -10,7 +10,9 @@ from app.schemas.images.image_generation import (
     StoryPlotImageInfo,
     ImageUploadResponse
 )
-from typing import List
+from typing import List, Optional
+from app.core.config import OBJECT_LIST_MAX_LIMIT
+from app.service.usage_tracking_service import set_usage_context
 
 router = APIRouter(prefix="/images/generation", tags=["image-generation"])
 
@@ -21,6 +23,7 @@ async def generate_storyplot_image_to_image(
 ):
     """StoryPlot用Image-to-Image生成エンドポイント（メイン機能）"""
     try:
+        set_usage_context("images/generation/generate-storyplot-image-to-image")
         # 遅延インポート
         from app.service.image_generator_service import image_generator_service
         
@@ -85,6 +88,7 @@ async def generate_storyplot_all_pages_image_to_image(
 ):
     """StoryPlot全ページImage-to-Image生成エンドポイント"""
     try:
+        set_usage_context("images/generation/generate-storyplot-all-pages-image-to-image")
         # 遅延インポート
         from app.service.image_generator_service import image_generator_service
         
@@ -207,10 +211,14 @@ async def upload_reference_image(file: UploadFile = File(...)):
         )
 
 @router.get("/uploaded-images", response_model=List[ImageUploadResponse])
-async def get_uploaded_images():
+async def get_uploaded_images(
+    after_id: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1, le=OBJECT_LIST_MAX_LIMIT),
+    user_id: Optional[int] = None
+):
     """アップロードされた画像のリストを取得するエンドポイント"""
     try:
-        images_info = image_generator_service.get_uploaded_images_list()
+        images_info = image_generator_service.get_uploaded_images_list(after_id, limit, user_id)
         
         return [
             ImageUploadResponse(
@@ -221,7 +229,8 @@ async def get_uploaded_images():
                 size_bytes=img['size_bytes'],
                 image_size=img['image_size'],
                 format=img['format'],
-                timestamp=img['timestamp']
+                timestamp=img['timestamp'],
+                id=img.get('id')
             )
             for img in images_info
         ]
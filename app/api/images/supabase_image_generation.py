@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, status, Depends, UploadFile, File
+from fastapi import APIRouter, HTTPException, status, Depends, UploadFile, File, Query
 from sqlalchemy.orm import Session
 import os
 from app.database.supabase_session import get_supabase_db
@@ -11,7 +11,10 @@ from app.schemas.images.image_generation import (
     StoryPlotImageInfo,
     ImageUploadResponse
 )
-from typing import List
+from typing import List, Optional
+from app.core.config import OBJECT_LIST_MAX_LIMIT
+from app.service.usage_tracking_service import set_usage_context
+from app.utils.memory_budget import memory_budget, MemoryBudgetExceeded, GENERATION_COST, budget_http_exception
 
 router = APIRouter(prefix="/images/generation", tags=["image-generation"])
 
@@ -22,6 +25,7 @@ async def generate_supabase_storyplot_image_to_image(
 ):
     """Supabase用のStoryPlot Image-to-Image生成エンドポイント（メイン機能）"""
     try:
+        set_usage_context("images/generation/generate-storyplot-image-to-image")
         # バリデーション
         if not (1 <= request.page_number <= 5):
             raise HTTPException(
@@ -50,14 +54,15 @@ async def generate_supabase_storyplot_image_to_image(
         # 絶対パスに変換
         request.reference_image_path = os.path.abspath(image_path)
         
-        image_info = image_generator_service.generate_storyplot_image_to_image(
-            db=db,
-            story_plot_id=request.story_plot_id,
-            page_number=request.page_number,
-            reference_image_path=request.reference_image_path,
-            strength=request.strength,
-            prefix=request.prefix
-        )
+        async with memory_budget.reserve(GENERATION_COST, "generation"):
+            image_info = image_generator_service.generate_storyplot_image_to_image(
+                db=db,
+                story_plot_id=request.story_plot_id,
+                page_number=request.page_number,
+                reference_image_path=request.reference_image_path,
+                strength=request.strength,
+                prefix=request.prefix
+            )
         
         return StoryPlotImageGenerationResponse(
             success=True,
@@ -65,6 +70,8 @@ async def generate_supabase_storyplot_image_to_image(
             image=StoryPlotImageInfo(**image_info)
         )
         
+    except MemoryBudgetExceeded as e:
+        raise budget_http_exception(e)
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -83,6 +90,7 @@ async def generate_supabase_storyplot_all_pages_image_to_image(
 ):
     """Supabase用のStoryPlot全ページImage-to-Image生成エンドポイント"""
     try:
+        set_usage_context("images/generation/generate-storyplot-all-pages-image-to-image")
         if not (0.0 <= request.strength <= 1.0):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -129,13 +137,15 @@ async def generate_supabase_storyplot_all_pages_image_to_image(
                 raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"参考画像が見つかりません: {image_path}")
             request.reference_image_path = os.path.abspath(image_path)
         
-        images_info = image_generator_service.generate_storyplot_all_pages_i2i(
-            db=db,
-            story_plot_id=request.story_plot_id,
-            reference_image_path=request.reference_image_path,
-            strength=request.strength,
-            prefix=request.prefix
-        )
+        # ページは順に生成するため1ページ分を確保
+        async with memory_budget.reserve(GENERATION_COST, "generation"):
+            images_info = image_generator_service.generate_storyplot_all_pages_i2i(
+                db=db,
+                story_plot_id=request.story_plot_id,
+                reference_image_path=request.reference_image_path,
+                strength=request.strength,
+                prefix=request.prefix
+            )
         
         return StoryPlotAllPagesGenerationResponse(
             success=True,
@@ -144,6 +154,8 @@ async def generate_supabase_storyplot_all_pages_image_to_image(
             total_generated=len(images_info)
         )
         
+    except MemoryBudgetExceeded as e:
+        raise budget_http_exception(e)
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -202,10 +214,14 @@ async def upload_supabase_reference_image(file: UploadFile = File(...)):
         )
 
 @router.get("/uploaded-images", response_model=List[ImageUploadResponse])
-async def get_supabase_uploaded_images():
+async def get_supabase_uploaded_images(
+    after_id: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1, le=OBJECT_LIST_MAX_LIMIT),
+    user_id: Optional[int] = None
+):
     """Supabase用のアップロードされた画像のリストを取得するエンドポイント"""
     try:
-        images_info = image_generator_service.get_uploaded_images_list()
+        images_info = image_generator_service.get_uploaded_images_list(after_id, limit, user_id)
         
         return [
             ImageUploadResponse(
@@ -216,7 +232,8 @@ async def get_supabase_uploaded_images():
                 size_bytes=img['size_bytes'],
                 image_size=img['image_size'],
                 format=img['format'],
-                timestamp=img['timestamp']
+                timestamp=img['timestamp'],
+                id=img.get('id')
             )
             for img in images_info
         ]
@@ -1,19 +1,40 @@
-import os, uuid, json, tempfile, time
+import os, uuid, json, time, asyncio
+from typing import List, Optional
 from urllib.parse import urlparse
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, status
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, status
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from sqlalchemy.orm import Session
-from app.database.supabase_session import get_supabase_db
+from app.database.supabase_session import get_supabase_db, SessionLocal
 from app.models.images.supabase_images import SupabaseUploadImages
-from app.schemas.images.images import UploadImageResponse
+from app.schemas.images.images import (
+    UploadImageResponse, DirectUploadRequest, DirectUploadResponse, FinalizeUploadRequest
+)
 from app.core.supabase_config import MAX_UPLOAD_SIZE, ALLOWED_MIME, SUPABASE_STORAGE_BUCKET
 from app.service.vision_api_service import vision_service
 from app.service.gcs_storage_service import GCSStorageService
-from app.utils.image_utils import resize_image_to_fixed_size, get_image_info
+from app.service.upload_pipeline_service import UploadPipelineService, UploadStorageError
+from app.service.vision_cache_service import vision_cache_service
+from app.service.story_generator_service import story_generator_service
+from app.service.usage_tracking_service import set_usage_context
+from app.core.config import VISION_CACHE_ENABLED, GENDER_DETECTION_ENABLED, BATCH_UPLOAD_MAX_FILES, OBJECT_LIST_MAX_LIMIT
+from app.utils.image_utils import render_upload_image
+from app.utils.worker_pool import run_in_process
+from app.utils.upload_utils import read_upload_limited, check_image_header, UploadRejectedError, HEADER_SNIFF_LIMIT
+from app.utils.memory_budget import memory_budget, estimate_image_cost, MemoryBudgetExceeded, budget_http_exception
+from app.utils.analysis_utils import build_derived_features, trim_analysis_for_meta
 
 router = APIRouter(prefix="/images", tags=["images"])
 
 # GCSサービスのインスタンス化
 gcs_storage_service = GCSStorageService()
+# GCS保存とVision解析（＋性別判定）を並行実行するパイプライン（同じ画像の解析結果はキャッシュから再利用）
+upload_pipeline_service = UploadPipelineService(
+    gcs_storage_service,
+    vision_service,
+    vision_cache_service if VISION_CACHE_ENABLED else None,
+    story_generator_service if GENDER_DETECTION_ENABLED else None,
+)
 
 # Cloud Run環境ではサービスアカウントのメタデータ認証を自動使用
 # 明示的な認証設定は不要
@@ -29,19 +50,13 @@ async def get_supabase_signed_url(image_id: int, db: Session = Depends(get_supab
             raise HTTPException(status_code=404, detail="画像が見つかりません")
         
         # ローカルストレージの場合は既存のパスをそのまま返る
-        if not image.file_path.startswith("users/"):
+        if not image.file_path.startswith(("users/", "cas/")):
             filename = urlparse(image.file_path).path.split("/")[-1]
             return {"signed_url": f"http://localhost:8000/uploads/{filename}"}
         
-        # GCSの場合、認証済みURLを生成
+        # GCSの場合、認証済みURLを取得（期限が近くなるまではキャッシュ、署名はスレッドで行う）
         try:
-            blob = gcs_storage_service.bucket.blob(image.file_path)
-            from datetime import timedelta
-            signed_url = blob.generate_signed_url(
-                version="v4",
-                expiration=timedelta(hours=1),
-                method="GET"
-            )
+            signed_url = await asyncio.to_thread(gcs_storage_service.generate_signed_url, image.file_path)
             return {"signed_url": signed_url}
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"認証済みURLの生成に失敗しました: {str(e)}")
@@ -51,15 +66,85 @@ async def get_supabase_signed_url(image_id: int, db: Session = Depends(get_supab
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"エラーが発生しました: {str(e)}")
 
+async def _resize_for_upload(content: bytes, header_info: dict, filename: Optional[str],
+                             fallback_content_type: Optional[str]) -> dict:
+    """保存用の1920x1080画像を作成（縦横比保持、透明背景）
+
+    CPU負荷が高いためプロセスプールで実行し、デコード後のビットマップとキャンバスの分を
+    メモリバジェットから確保してから実行する。失敗時は元の画像と拡張子をそのまま使う。
+    """
+    resize_start_time = time.time()
+    image_cost = estimate_image_cost(len(content), header_info["width"], header_info["height"])
+    async with memory_budget.reserve(image_cost, "resize"):
+        resized_content, resized_info = await run_in_process(render_upload_image, content, 1920, 1080)
+
+    if resized_info:
+        print(f"リサイズ後情報: {resized_info}")
+        content = resized_content
+        file_extension = resized_info["extension"]
+        content_type = resized_info["content_type"]
+    else:
+        print("リサイズ処理をスキップして元の画像を使用します")
+        file_extension = filename.split(".")[-1].lower() if filename and "." in filename else "jpg"
+        content_type = fallback_content_type
+
+    # 保存するファイル名の拡張子は実際の形式に合わせる
+    base_filename = os.path.splitext(filename or "uploaded_image")[0]
+    return {
+        "content": content,
+        "filename": f"{base_filename}.{file_extension}",
+        "content_type": content_type,
+        "image_cost": image_cost,
+        "resize_time": time.time() - resize_start_time,
+    }
+
+
+def _build_image_row(file_name: Optional[str], user_id: int, stored: dict, pipeline_result: dict,
+                     raw_analysis_path: Optional[str]) -> SupabaseUploadImages:
+    """パイプラインの結果からupload_imagesの行を作成（meta_dataは軽量化したもの）"""
+    analysis_result = pipeline_result["analysis_result"]
+    upload_result = pipeline_result["upload_result"]
+    derived_features = build_derived_features(analysis_result)
+    return SupabaseUploadImages(
+        file_name=file_name,
+        file_path=upload_result["gcs_path"],
+        content_type=stored["content_type"],
+        size_bytes=len(stored["content"]),
+        user_id=user_id,
+        meta_data=json.dumps(trim_analysis_for_meta(analysis_result), ensure_ascii=False),
+        public_url=upload_result["public_url"],
+        derived_features=derived_features,
+        face_count=derived_features["face_count"],
+        text_hint=derived_features["text_hint"],
+        raw_analysis_path=raw_analysis_path
+    )
+
+async def _discard_stored_upload(user_id: int, file_path: str, raw_analysis_path: Optional[str] = None,
+                                 raw_upload_task: Optional[asyncio.Future] = None) -> None:
+    """DBに保存できなかった画像と解析結果JSONをGCSから削除（行から参照されないオブジェクトを残さない）"""
+    if raw_upload_task is not None:
+        # 保存中の解析結果JSONが削除後に書き込まれないよう完了を待つ
+        await asyncio.gather(raw_upload_task, return_exceptions=True)
+    try:
+        await asyncio.to_thread(gcs_storage_service.release_object, file_path, user_id, [raw_analysis_path])
+    except Exception as e:
+        print(f"⚠️ 保存済みファイルの削除に失敗: {file_path} {e}")
+
 # 画像アップロードをするエンドポイント（Supabase用）
 @router.post("/upload", response_model=UploadImageResponse)
 async def upload_supabase_image(
     file: UploadFile = File(...), 
     user_id: int = Form(...),
+    feature_profile: Optional[str] = Form(None),
     db: Session = Depends(get_supabase_db)
 ):
-    """Supabase用の画像ファイルアップロードエンドポイント"""
+    """Supabase用の画像ファイルアップロードエンドポイント
+
+    feature_profile: Vision APIで取得する機能（minimal / standard / full、省略時は設定値）
+    """
     
+    set_usage_context("images/upload", user_id)
+
     # ファイルのバリデーションチェック
     if not file.content_type or file.content_type not in ALLOWED_MIME:
         raise HTTPException(
@@ -67,6 +152,8 @@ async def upload_supabase_image(
             detail=f"サポートされていないファイル形式です。許可されている形式: {', '.join(ALLOWED_MIME)}"
         )
     
+    # DB保存前に失敗した場合に削除するGCSのオブジェクト
+    file_path, raw_analysis_path, raw_upload_task, row_committed = None, None, None, False
     try:
         # ⏱️ 全体の処理時間計測開始
         total_start_time = time.time()
@@ -76,153 +163,83 @@ async def upload_supabase_image(
         
         # ⏱️ ファイル読み込み時間計測
         read_start_time = time.time()
-        content = await file.read()
+        # 上限を超えた時点で読み込みを打ち切り、ヘッダーで画像形式と解像度を検査
+        try:
+            content, header_info = await read_upload_limited(file, MAX_UPLOAD_SIZE)
+        except UploadRejectedError as rejected:
+            raise HTTPException(status_code=rejected.status_code, detail=rejected.message)
         read_time = time.time() - read_start_time
         print(f"⏱️ ファイル読み込み時間: {read_time:.3f}秒")
-        print(f"読み込んだファイルサイズ: {len(content)} bytes")
-        
-        if len(content) > MAX_UPLOAD_SIZE:
-            raise HTTPException(
-                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-                detail=f"ファイルサイズが大きすぎます。最大{MAX_UPLOAD_SIZE // (1024*1024)}MBまでです。"
-            )
+        print(f"読み込んだファイルサイズ: {len(content)} bytes, ヘッダー情報: {header_info}")
+
+        # Vision解析用の縮小画像は余白のない元画像から作る
+        original_content = content
 
         # ⏱️ リサイズ処理時間計測
-        resize_start_time = time.time()
         print("=== 画像リサイズ処理開始 ===")
-        # 画像を1920x1080の固定サイズにリサイズ（縦横比保持、透明背景）
-        try:
-            # インポート確認
-            from app.utils.image_utils import resize_image_to_fixed_size, get_image_info
-            print("画像ユーティリティのインポート成功")
-            
-            original_info = get_image_info(content)
-            print(f"元画像情報: {original_info}")
-            
-            resized_content = resize_image_to_fixed_size(content, 1920, 1080)
-            resized_info = get_image_info(resized_content)
-            print(f"リサイズ後情報: {resized_info}")
-            
-            # リサイズ後のコンテンツを使用
-            content = resized_content
-            resize_time = time.time() - resize_start_time
-            print(f"⏱️ 画像リサイズ時間: {resize_time:.3f}秒")
-            print("=== 画像リサイズ処理完了 ===")
-        except ImportError as e:
-            resize_time = time.time() - resize_start_time
-            print(f"⏱️ 画像リサイズ時間（スキップ）: {resize_time:.3f}秒")
-            print(f"画像ユーティリティのインポートエラー: {e}")
-            print("リサイズ処理をスキップして元の画像を使用します")
-        except Exception as e:
-            resize_time = time.time() - resize_start_time
-            print(f"⏱️ 画像リサイズ時間（エラー）: {resize_time:.3f}秒")
-            print(f"画像リサイズ処理エラー: {e}")
-            print("リサイズ処理をスキップして元の画像を使用します")
+        stored = await _resize_for_upload(content, header_info, file.filename, file.content_type)
+        content = stored["content"]
+        content_type = stored["content_type"]
+        image_cost = stored["image_cost"]
+        resize_time = stored["resize_time"]
+        print(f"⏱️ 画像リサイズ時間: {resize_time:.3f}秒")
+        print("=== 画像リサイズ処理完了 ===")
 
-        # ファイル拡張子を決定（リサイズ成功時はPNG、失敗時は元の拡張子）
-        try:
-            # リサイズ処理が成功した場合はPNG
-            file_extension = "png"
-            print("ファイル拡張子をPNGに設定")
-        except:
-            # リサイズ処理が失敗した場合は元の拡張子
-            file_extension = file.filename.split(".")[-1].lower() if "." in file.filename else "jpg"
-            print(f"ファイル拡張子を元のまま設定: {file_extension}")
-        
-        # ⏱️ GCSアップロード時間計測
-        upload_start_time = time.time()
-        # ストレージタイプに応じて保存先を決定
-        # 現在はGCSを使用（将来的にSupabaseストレージに移行可能）
+        # ⏱️ GCSアップロードとVision API解析を並行実行
         try:
-            # GCSサービスを使用（user_idが必要）
-            content_type = "image/png" if file_extension == "png" else file.content_type
-            upload_result = gcs_storage_service.upload_image(
-                file_content=content,
-                filename=file.filename or "uploaded_image",
-                user_id=user_id,
-                content_type=content_type
-            )
-            
-            if not upload_result["success"]:
-                print(f"GCSアップロード失敗: {upload_result['error']}")
-                raise HTTPException(status_code=500, detail="画像のアップロードに失敗しました")
-            
-            file_path = upload_result["gcs_path"]
-            public_url = upload_result["public_url"]
-            upload_time = time.time() - upload_start_time
-            print(f"⏱️ GCSアップロード時間: {upload_time:.3f}秒")
-                
-        except Exception as gcs_error:
-            upload_time = time.time() - upload_start_time
-            print(f"⏱️ GCSアップロード時間（エラー）: {upload_time:.3f}秒")
+            # 元画像・保存用画像と、解析用画像の作成・Vision送信分を確保
+            async with memory_budget.reserve(image_cost + len(content), "upload_vision"):
+                pipeline_result = await upload_pipeline_service.run(
+                    content=content,
+                    filename=stored["filename"],
+                    user_id=user_id,
+                    content_type=content_type,
+                    analysis_source=original_content,
+                    feature_profile=feature_profile,
+                )
+        except UploadStorageError as gcs_error:
             print(f"GCSエラー: {str(gcs_error)}")
             raise HTTPException(status_code=500, detail=f"画像のアップロードに失敗しました: {str(gcs_error)}")
-        
+
+        upload_result = pipeline_result["upload_result"]
+        analysis_result = pipeline_result["analysis_result"]
+        file_path = upload_result["gcs_path"]
+        public_url = upload_result["public_url"]
+
         # デバッグ情報
         print(f"ファイルパス: {file_path}")
         print(f"GCS public_url: {public_url}")
+        print(f"Vision API解析結果: {analysis_result}")
         
-        # ⏱️ Vision API解析時間計測
-        vision_start_time = time.time()
-        # Vision API解析
-        analysis_result = None
-        temp_file_path = None
-        try:
-            print("Vision API解析を開始...")
-            # 一時ファイルを作成（クロスプラットフォーム対応）
-            with tempfile.NamedTemporaryFile(delete=False, suffix=f".{file_extension}") as temp_file:
-                temp_file.write(content)
-                temp_file_path = temp_file.name
-            
-            analysis_result = await vision_service.analyze_image(temp_file_path)
-            vision_time = time.time() - vision_start_time
-            print(f"⏱️ Vision API解析時間: {vision_time:.3f}秒")
-            print(f"Vision API解析結果: {analysis_result}")
-        except Exception as e:
-            vision_time = time.time() - vision_start_time
-            print(f"⏱️ Vision API解析時間（エラー）: {vision_time:.3f}秒")
-            print(f"Vision API解析エラー: {str(e)}")
-            # Vision API解析に失敗してもアップロードは続行
-            analysis_result = {
-                "error": f"Vision API解析に失敗しました: {str(e)}",
-                "labels": [],
-                "text": [],
-                "objects": [],
-                "faces": [],
-                "safe_search": {},
-                "colors": [],
-                "analysis_timestamp": None
-            }
-        finally:
-            # 一時ファイルを削除
-            if temp_file_path and os.path.exists(temp_file_path):
-                try:
-                    os.unlink(temp_file_path)
-                    print(f"一時ファイルを削除しました: {temp_file_path}")
-                except Exception as e:
-                    print(f"一時ファイル削除エラー: {str(e)}")
-        
-        # meta_dataの準備
-        meta_data_json = None
-        if analysis_result:
-            meta_data_json = json.dumps(analysis_result, ensure_ascii=False)
-            print(f"meta_data JSON: {meta_data_json}")
-        
-        # データベースに保存
-        new_image = SupabaseUploadImages(
-            file_name=file.filename,
-            file_path=file_path,
-            content_type=file.content_type,
-            size_bytes=len(content),
-            user_id=user_id,
-            meta_data=meta_data_json,
-            public_url=public_url
+        # 解析結果全体はGCSに保存し、DBには軽量化したmeta_dataと要約だけを保存
+        raw_analysis_path = gcs_storage_service.raw_analysis_path(file_path, user_id)
+        raw_upload_task = asyncio.ensure_future(
+            asyncio.to_thread(gcs_storage_service.upload_json, analysis_result, raw_analysis_path)
         )
+
+        # ⏱️ DB保存時間計測
+        db_start_time = time.time()
+        # データベースに保存
+        new_image = _build_image_row(file.filename, user_id, stored, pipeline_result, raw_analysis_path)
+        print(f"meta_data JSON: {new_image.meta_data}")
         db.add(new_image)
         db.commit()
+        row_committed = True
         db.refresh(new_image)
+        db_time = time.time() - db_start_time
+        print(f"⏱️ DB保存時間: {db_time:.3f}秒")
+
+        # 解析結果全体の保存に失敗した場合はパスを外す（meta_dataは残っている）
+        raw_upload_result = await raw_upload_task
+        if not raw_upload_result["success"]:
+            print(f"⚠️ 解析結果のGCS保存に失敗: {raw_upload_result['error']}")
+            new_image.raw_analysis_path = None
+            db.commit()
 
         print(f"保存された画像のmeta_data: {new_image.meta_data}")
+
+        total_time = time.time() - total_start_time
+        print(f"⏱️ 合計処理時間: {total_time:.3f}秒")
         
         # レスポンスに公開URLを含める
         response_data = {
@@ -233,7 +250,14 @@ async def upload_supabase_image(
             "size_bytes": new_image.size_bytes,
             "uploaded_at": new_image.created_at.isoformat(),  # SupabaseBaseのcreated_atを使用
             "meta_data": new_image.meta_data,
-            "public_url": new_image.public_url
+            "public_url": new_image.public_url,
+            "timing_details": {
+                "file_read": round(read_time, 3),
+                "resize": round(resize_time, 3),
+                **pipeline_result["timings"],
+                "db_save": round(db_time, 3),
+                "total": round(total_time, 3),
+            }
         }
         
         # デバッグ用ログ
@@ -246,30 +270,390 @@ async def upload_supabase_image(
     # エラーが発生した場合は保存したファイルを削除
     except HTTPException:
         raise
+    except MemoryBudgetExceeded as e:
+        print(f"⚠️ {e}")
+        raise budget_http_exception(e)
     except Exception as e:
         print(f"アップロード処理中にエラーが発生しました: {str(e)}")
         import traceback
         print(f"エラーの詳細: {traceback.format_exc()}")
+        db.rollback()
+        if file_path and not row_committed:
+            await _discard_stored_upload(user_id, file_path, raw_analysis_path, raw_upload_task)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"画像のアップロードに失敗しました: {str(e)}"
         )
 
+# 複数画像をまとめてアップロードするエンドポイント（Supabase用）
+@router.post("/upload/batch")
+async def upload_supabase_images_batch(
+    files: List[UploadFile] = File(...),
+    user_id: int = Form(...),
+    feature_profile: Optional[str] = Form(None),
+):
+    """Supabase用の複数画像アップロードエンドポイント（結果をNDJSONで順次返す）
+
+    リサイズ（プロセスプール）は1枚ずつ順に行い、リサイズが終わった画像から
+    GCS保存・Vision解析を並行して始める（2枚目のリサイズと1枚目の保存・解析が重なる）。
+    各画像の保存・解析が終わり次第 {"type": "file", "status": "processed", ...} を1行ずつ返し、
+    最後に全画像のupload_images行を1回のINSERTで保存して {"type": "summary", ...} を返す
+    （DBへの保存結果はsummaryで確定する。保存に失敗した画像のGCSのファイルは削除する）。
+    クライアントが切断した場合は処理中のタスクを止め、DBに保存されなかった画像を削除する。
+    レスポンスのストリーミング中に使うため、DBセッションはリクエストの依存性とは別に作成する。
+    """
+    if len(files) > BATCH_UPLOAD_MAX_FILES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"一度にアップロードできる画像は{BATCH_UPLOAD_MAX_FILES}枚までです"
+        )
+
+    # 形式とサイズだけ先に検査し、読み込みは各画像のリサイズの直前に1枚ずつ行う
+    # （フォームのファイルはレスポンスの送信が終わるまで閉じられない。全画像を同時にメモリに載せない）
+    entries = []
+    for index, file in enumerate(files):
+        entry = {"index": index, "file_name": file.filename, "content_type": file.content_type, "file": file}
+        if not file.content_type or file.content_type not in ALLOWED_MIME:
+            entry["error"] = f"サポートされていないファイル形式です。許可されている形式: {', '.join(ALLOWED_MIME)}"
+        elif file.size is not None and file.size > MAX_UPLOAD_SIZE:
+            entry["error"] = f"ファイルサイズが大きすぎます。最大{MAX_UPLOAD_SIZE // (1024*1024)}MBまでです。"
+        entries.append(entry)
+
+    # 切断時に止める保存・解析のタスク
+    child_tasks: List[asyncio.Task] = []
+
+    async def process_entry(entry: dict, stored: dict) -> dict:
+        """GCS保存・Vision解析と解析結果全体の保存（DBへの保存は最後にまとめて行う）"""
+        start_time = time.time()
+        async with memory_budget.reserve(stored["image_cost"] + len(stored["content"]), "upload_vision"):
+            pipeline_result = await upload_pipeline_service.run(
+                content=stored["content"],
+                filename=stored["filename"],
+                user_id=user_id,
+                content_type=stored["content_type"],
+                analysis_source=entry["content"],
+                feature_profile=feature_profile,
+            )
+        # 元画像はもう使わないため解放
+        entry.pop("content", None)
+
+        file_path = pipeline_result["upload_result"]["gcs_path"]
+        raw_analysis_path = gcs_storage_service.raw_analysis_path(file_path, user_id)
+        # DBに保存できなかった場合に削除するパス
+        entry["file_path"], entry["raw_analysis_path"] = file_path, raw_analysis_path
+        raw_upload_result = await asyncio.to_thread(
+            gcs_storage_service.upload_json, pipeline_result["analysis_result"], raw_analysis_path
+        )
+        if not raw_upload_result["success"]:
+            print(f"⚠️ 解析結果のGCS保存に失敗: {raw_upload_result['error']}")
+            raw_analysis_path = entry["raw_analysis_path"] = None
+
+        entry["row"] = _build_image_row(entry["file_name"], user_id, stored, pipeline_result, raw_analysis_path)
+        return {
+            "file_path": file_path,
+            "public_url": pipeline_result["upload_result"]["public_url"],
+            "timing_details": {
+                "resize": round(stored["resize_time"], 3),
+                **pipeline_result["timings"],
+                "upload_total": round(time.time() - start_time, 3),
+            },
+        }
+
+    async def run_stages(queue: asyncio.Queue) -> None:
+        """リサイズを順に行い、終わった画像から保存・解析のタスクを起動する"""
+        async def finish(entry: dict, task: asyncio.Task) -> None:
+            try:
+                result = await task
+                await queue.put({"type": "file", "index": entry["index"], "file_name": entry["file_name"],
+                                 "status": "processed", **result})
+            except Exception as e:
+                entry.pop("content", None)
+                await queue.put(_batch_error_line(entry, e))
+
+        finish_tasks = []
+        for entry in entries:
+            if "error" in entry:
+                await queue.put({"type": "file", "index": entry["index"], "file_name": entry["file_name"],
+                                 "status": "error", "error": entry["error"]})
+                continue
+            try:
+                # 読み込み中だけ元画像の分を確保（リサイズ以降のステージの見積もりに元画像が含まれる）
+                read_cost = min(entry["file"].size or MAX_UPLOAD_SIZE, MAX_UPLOAD_SIZE)
+                async with memory_budget.reserve(read_cost, "batch_read"):
+                    entry["content"], header_info = await read_upload_limited(entry["file"], MAX_UPLOAD_SIZE)
+                stored = await _resize_for_upload(
+                    entry["content"], header_info, entry["file_name"], entry["content_type"]
+                )
+            except UploadRejectedError as rejected:
+                await queue.put({"type": "file", "index": entry["index"], "file_name": entry["file_name"],
+                                 "status": "error", "error": rejected.message})
+                continue
+            except Exception as e:
+                entry.pop("content", None)
+                await queue.put(_batch_error_line(entry, e))
+                continue
+            task = asyncio.ensure_future(process_entry(entry, stored))
+            finish_task = asyncio.ensure_future(finish(entry, task))
+            child_tasks.extend([task, finish_task])
+            finish_tasks.append(finish_task)
+        await asyncio.gather(*finish_tasks)
+
+    async def stream_results():
+        set_usage_context("images/upload/batch", user_id)
+        total_start_time = time.time()
+        queue: asyncio.Queue = asyncio.Queue()
+        stages_task = asyncio.ensure_future(run_stages(queue))
+        child_tasks.append(stages_task)
+        try:
+            for _ in entries:
+                yield json.dumps(await queue.get(), ensure_ascii=False) + "\n"
+            await stages_task
+        finally:
+            # 切断された場合は保存・解析中のタスクも止める（保存済みファイルの削除はcleanup_batchで行う）
+            for task in child_tasks:
+                if not task.done():
+                    task.cancel()
+
+        # 保存・解析に成功した画像の行を1回のINSERTでまとめて保存
+        rows = [entry["row"] for entry in entries if "row" in entry]
+        summary = {"type": "summary", "total": len(entries), "succeeded": len(rows), "images": []}
+        db_start_time = time.time()
+        db = SessionLocal()
+        try:
+            if rows:
+                db.add_all(rows)
+                db.commit()
+                for entry in entries:
+                    if "row" in entry:
+                        entry["committed"] = True
+            summary["images"] = [
+                {"index": entry["index"], "id": entry["row"].id, "file_path": entry["row"].file_path}
+                for entry in entries if "row" in entry
+            ]
+        except Exception as e:
+            db.rollback()
+            print(f"一括アップロードのDB保存エラー: {str(e)}")
+            summary.update({
+                "succeeded": 0,
+                "error": f"データベースへの保存に失敗しました（アップロードした画像は削除します）: {str(e)}"
+            })
+        finally:
+            db.close()
+        summary["timing_details"] = {
+            "db_save": round(time.time() - db_start_time, 3),
+            "total": round(time.time() - total_start_time, 3),
+        }
+        yield json.dumps(summary, ensure_ascii=False) + "\n"
+
+    async def cleanup_batch() -> None:
+        """レスポンス終了後（切断時も実行される）の後片付け
+
+        止めたタスクの終了を待ってから、DBに保存されなかった画像と解析結果JSONをGCSから削除する。
+        """
+        await asyncio.gather(*child_tasks, return_exceptions=True)
+        for entry in entries:
+            entry.pop("content", None)
+            if entry.get("file_path") and not entry.get("committed"):
+                await _discard_stored_upload(user_id, entry["file_path"], entry.get("raw_analysis_path"))
+
+    return StreamingResponse(
+        stream_results(), media_type="application/x-ndjson", background=BackgroundTask(cleanup_batch)
+    )
+
+
+def _batch_error_line(entry: dict, error: Exception) -> dict:
+    """一括アップロードで失敗した画像の結果行"""
+    if isinstance(error, MemoryBudgetExceeded):
+        message = "サーバーが混み合っています。しばらくしてから再度お試しください。"
+    else:
+        message = f"画像のアップロードに失敗しました: {str(error)}"
+    print(f"一括アップロード中にエラーが発生しました ({entry['file_name']}): {str(error)}")
+    return {"type": "file", "index": entry["index"], "file_name": entry["file_name"], "status": "error", "error": message}
+
+# GCSへの直接アップロードURLを発行するエンドポイント（Supabase用）
+@router.post("/upload/direct", response_model=DirectUploadResponse)
+async def create_direct_upload(request: DirectUploadRequest):
+    """画像をAPIを経由せずGCSへ直接アップロードするためのURLを発行するエンドポイント
+
+    1. このエンドポイントで users/{user_id}/uploads/incoming/ 以下への署名付きPUT URL（またはresumableセッション）を受け取る
+    2. クライアントが返された headers を付けて upload_url へ画像をPUTする
+    3. /upload/finalize に object_path を渡し、リサイズ・Vision解析・DB保存をサーバー側で行う
+    """
+    if request.content_type not in ALLOWED_MIME:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"サポートされていないファイル形式です。許可されている形式: {', '.join(ALLOWED_MIME)}"
+        )
+    if request.size_bytes is not None and request.size_bytes > MAX_UPLOAD_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"ファイルサイズが大きすぎます。最大{MAX_UPLOAD_SIZE // (1024*1024)}MBまでです。"
+        )
+    if request.mode not in ("signed_put", "resumable"):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="modeは signed_put / resumable のいずれかです")
+
+    try:
+        return await asyncio.to_thread(
+            gcs_storage_service.create_direct_upload,
+            user_id=request.user_id,
+            filename=request.file_name,
+            content_type=request.content_type,
+            size_bytes=request.size_bytes,
+            mode=request.mode,
+            origin=request.origin,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"アップロードURLの発行に失敗しました: {str(e)}")
+
+# 直接アップロードされた画像を処理するエンドポイント（Supabase用）
+@router.post("/upload/finalize", response_model=UploadImageResponse)
+async def finalize_direct_upload(request: FinalizeUploadRequest, db: Session = Depends(get_supabase_db)):
+    """GCSに直接アップロードされた画像をリサイズ・解析してupload_imagesに保存するエンドポイント
+
+    処理後の保存用画像は通常のアップロードと同じ場所に保存し、incoming/ の元画像は削除する。
+    同じオブジェクトの同時・二重のfinalizeは目印（claim_incoming_object）で弾き、409を返す。
+    元画像の読み込み中はその分をメモリバジェットから確保する（リサイズ以降は各ステージの見積もりに含まれる）。
+    """
+    set_usage_context("images/upload/finalize", request.user_id)
+    if not gcs_storage_service.is_incoming_path(request.object_path, request.user_id):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="このユーザーのアップロード先ではありません")
+
+    # 他のリクエストが同じオブジェクトを処理中・処理済みなら受け付けない
+    claim_path = await asyncio.to_thread(gcs_storage_service.claim_incoming_object, request.object_path, request.user_id)
+    if claim_path is None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="この画像は既に処理中です")
+
+    # DB保存前に失敗した場合に削除するGCSのオブジェクト
+    file_path, raw_analysis_path, row_committed = None, None, False
+    incoming_deleted = False
+    try:
+        total_start_time = time.time()
+
+        # ⏱️ GCSからの読み込み（サイズを先に確認し、バジェットを確保してから取得）
+        read_start_time = time.time()
+        object_info = await asyncio.to_thread(gcs_storage_service.get_object_info, request.object_path)
+        if object_info is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="アップロードされた画像が見つかりません")
+        if object_info["size"] and object_info["size"] > MAX_UPLOAD_SIZE:
+            await asyncio.to_thread(gcs_storage_service.delete_object, request.object_path)
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"ファイルサイズが大きすぎます。最大{MAX_UPLOAD_SIZE // (1024*1024)}MBまでです。"
+            )
+        async with memory_budget.reserve(object_info["size"] or MAX_UPLOAD_SIZE, "finalize_read"):
+            content = await asyncio.to_thread(gcs_storage_service.download_image, request.object_path)
+        try:
+            image_format, size = check_image_header(content[:HEADER_SNIFF_LIMIT])
+        except UploadRejectedError as rejected:
+            await asyncio.to_thread(gcs_storage_service.delete_object, request.object_path)
+            raise HTTPException(status_code=rejected.status_code, detail=rejected.message)
+        header_info = {"format": image_format, "width": size[0] if size else None, "height": size[1] if size else None}
+        read_time = time.time() - read_start_time
+
+        file_name = request.file_name or os.path.basename(request.object_path)
+        stored = await _resize_for_upload(content, header_info, file_name, object_info["content_type"])
+
+        try:
+            async with memory_budget.reserve(stored["image_cost"] + len(stored["content"]), "upload_vision"):
+                pipeline_result = await upload_pipeline_service.run(
+                    content=stored["content"],
+                    filename=stored["filename"],
+                    user_id=request.user_id,
+                    content_type=stored["content_type"],
+                    analysis_source=content,
+                    feature_profile=request.feature_profile,
+                )
+        except UploadStorageError as gcs_error:
+            raise HTTPException(status_code=500, detail=f"画像のアップロードに失敗しました: {str(gcs_error)}")
+
+        file_path = pipeline_result["upload_result"]["gcs_path"]
+        raw_analysis_path = gcs_storage_service.raw_analysis_path(file_path, request.user_id)
+        raw_upload_result = await asyncio.to_thread(
+            gcs_storage_service.upload_json, pipeline_result["analysis_result"], raw_analysis_path
+        )
+        if not raw_upload_result["success"]:
+            print(f"⚠️ 解析結果のGCS保存に失敗: {raw_upload_result['error']}")
+            raw_analysis_path = None
+
+        db_start_time = time.time()
+        new_image = _build_image_row(file_name, request.user_id, stored, pipeline_result, raw_analysis_path)
+        db.add(new_image)
+        db.commit()
+        row_committed = True
+        db.refresh(new_image)
+        db_time = time.time() - db_start_time
+
+        # 処理済みの元画像は削除（保存用画像は別に保存済み）
+        incoming_deleted = await asyncio.to_thread(gcs_storage_service.delete_object, request.object_path)
+
+        return {
+            "id": new_image.id,
+            "file_name": new_image.file_name,
+            "file_path": new_image.file_path,
+            "content_type": new_image.content_type,
+            "size_bytes": new_image.size_bytes,
+            "uploaded_at": new_image.created_at.isoformat(),
+            "meta_data": new_image.meta_data,
+            "public_url": new_image.public_url,
+            "timing_details": {
+                "gcs_read": round(read_time, 3),
+                "resize": round(stored["resize_time"], 3),
+                **pipeline_result["timings"],
+                "db_save": round(db_time, 3),
+                "total": round(time.time() - total_start_time, 3),
+            }
+        }
+
+    except HTTPException:
+        raise
+    except MemoryBudgetExceeded as e:
+        print(f"⚠️ {e}")
+        raise budget_http_exception(e)
+    except Exception as e:
+        db.rollback()
+        print(f"直接アップロードの処理中にエラーが発生しました: {str(e)}")
+        if file_path and not row_committed:
+            await _discard_stored_upload(request.user_id, file_path, raw_analysis_path)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"画像の処理に失敗しました: {str(e)}"
+        )
+    finally:
+        # 失敗した場合はincoming/の画像が残るため、目印を外して再度finalizeできるようにする
+        # （保存後に元画像を削除できなかった場合は二重に保存されないよう目印を残す。どちらも後で一括削除される）
+        if incoming_deleted or not row_committed:
+            await asyncio.to_thread(gcs_storage_service.release_incoming_claim, claim_path)
+
 # 画像一覧取得エンドポイント（Supabase用）
 @router.get("/", response_model=list[UploadImageResponse])
-def get_supabase_images(db: Session = Depends(get_supabase_db)):
-    """Supabase用の画像一覧取得エンドポイント"""
+def get_supabase_images(
+    after_id: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1, le=OBJECT_LIST_MAX_LIMIT),
+    user_id: Optional[int] = None,
+    db: Session = Depends(get_supabase_db)
+):
+    """Supabase用の画像一覧取得エンドポイント
+
+    id順に after_id より後を limit 件返す（次のページは最後の id を after_id に指定）。
+    limit を省略した場合は全件。
+    """
     
-    images = db.query(SupabaseUploadImages).all()
+    query = db.query(SupabaseUploadImages)
+    if user_id is not None:
+        query = query.filter(SupabaseUploadImages.user_id == user_id)
+    if after_id:
+        query = query.filter(SupabaseUploadImages.id > after_id)
+    query = query.order_by(SupabaseUploadImages.id)
+    if limit:
+        query = query.limit(limit)
+    images = query.all()
     result = []
     for img in images:
         # GCSの場合はstorage.googleapis.com形式のURLを使用
         public_url = img.public_url
         if img.public_url and img.public_url.startswith("https://storage.cloud.google.com/"):
             try:
-                from app.service.gcs_storage_service import GCSStorageService
-                gcs_service = GCSStorageService()
-                public_url = gcs_service.get_public_url(img.file_path)
+                public_url = gcs_storage_service.get_public_url(img.file_path)
             except Exception as e:
                 print(f"公開URL生成エラー: {e}")
                 # エラーの場合は元のURLをstorage.googleapis.com形式に変換
@@ -320,6 +704,47 @@ def get_supabase_image(image_id: int, db: Session = Depends(get_supabase_db)):
         "public_url": public_url
     }
 
+# 解析結果全体の取得エンドポイント（GCSから必要な時だけ読み込む）
+@router.get("/{image_id}/raw-analysis")
+async def get_raw_analysis(image_id: int, db: Session = Depends(get_supabase_db)):
+    """アップロード時のVision解析結果全体（バウンディングボックス・OCR全文を含む）を返すエンドポイント"""
+    
+    image = db.query(SupabaseUploadImages).filter(SupabaseUploadImages.id == image_id).first()
+    if not image:
+        raise HTTPException(status_code=404, detail="画像が見つかりません")
+    
+    # 要約カラム導入前の画像はmeta_dataが解析結果全体
+    if not image.raw_analysis_path:
+        return json.loads(image.meta_data) if image.meta_data else {}
+    
+    try:
+        return await asyncio.to_thread(gcs_storage_service.download_json, image.raw_analysis_path)
+    except Exception as e:
+        print(f"解析結果の取得エラー: {e}")
+        raise HTTPException(status_code=500, detail=f"解析結果の取得に失敗しました: {str(e)}")
+
+# 画像削除エンドポイント（Supabase用）
+@router.delete("/{image_id}")
+async def delete_supabase_image(image_id: int, db: Session = Depends(get_supabase_db)):
+    """Supabase用の画像削除エンドポイント
+
+    同じ内容の画像を共有している場合（コンテンツアドレス方式）は、参照が0件になった時だけGCSから削除する。
+    """
+    image = db.query(SupabaseUploadImages).filter(SupabaseUploadImages.id == image_id).first()
+    if not image:
+        raise HTTPException(status_code=404, detail="画像が見つかりません")
+    if image.story_settings:
+        raise HTTPException(status_code=409, detail="この画像を使った物語設定があるため削除できません")
+
+    file_path, raw_analysis_path, user_id = image.file_path, image.raw_analysis_path, image.user_id
+    db.delete(image)
+    db.commit()
+
+    if file_path.startswith(("users/", "cas/")):
+        await asyncio.to_thread(gcs_storage_service.release_object, file_path, user_id, [raw_analysis_path])
+
+    return {"message": "画像が削除されました"}
+
 # 署名付きURL生成エンドポイント
 @router.get("/{image_id}/signed-url")
 def get_signed_url_for_image(image_id: int, db: Session = Depends(get_supabase_db)):
@@ -1,4 +1,4 @@
-import os, uuid, json, tempfile
+import os, uuid, json
 from urllib.parse import urlparse
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, status
 from sqlalchemy.orm import Session
@@ -211,20 +211,11 @@ async def upload_image(
         
         # Vision API解析
         analysis_result = None
-        temp_file_path = None
         if VISION_API_ENABLED:
             try:
                 print("Vision API解析を開始...")
-                # GCSの場合は一時的にローカルに保存してから解析
-                if STORAGE_TYPE == "gcs":
-                    # 一時ファイルを作成（クロスプラットフォーム対応）
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=f".{file_extension}") as temp_file:
-                        temp_file.write(content)
-                        temp_file_path = temp_file.name
-                    
-                    analysis_result = await vision_service.analyze_image(temp_file_path)
-                else:
-                    analysis_result = await vision_service.analyze_image(file_path)
+                # 保存先に関係なくメモリ上の画像データをそのまま解析
+                analysis_result = await vision_service.analyze_image_bytes(content)
                 print(f"Vision API解析結果: {analysis_result}")
             except Exception as e:
                 print(f"Vision API解析エラー: {str(e)}")
@@ -239,14 +230,6 @@ async def upload_image(
                     "colors": [],
                     "analysis_timestamp": None
                 }
-            finally:
-                # 一時ファイルを削除
-                if temp_file_path and os.path.exists(temp_file_path):
-                    try:
-                        os.unlink(temp_file_path)
-                        print(f"一時ファイルを削除しました: {temp_file_path}")
-                    except Exception as e:
-                        print(f"一時ファイル削除エラー: {str(e)}")
         else:
             print("Vision API解析は無効化されています")
         
@@ -0,0 +1,48 @@
+from fastapi import APIRouter
+from typing import Dict, Any, Optional
+from app.service.model_router_service import model_router_service
+from app.service.usage_tracking_service import usage_tracking_service
+from app.service.vision_api_service import vision_service
+from app.service.vision_cache_service import vision_cache_service
+from app.service.signed_url_cache_service import signed_url_cache
+from app.utils.memory_budget import memory_budget
+
+router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+# モデルティア別メトリクス取得エンドポイント
+@router.get("/model-tiers", response_model=Dict[str, Any])
+def get_model_tier_metrics():
+    """ティアごとのレイテンシ・トークン数・フォールバック回数を返すエンドポイント"""
+    return model_router_service.get_metrics()
+
+# モデル呼び出しの使用量・コスト集計取得エンドポイント
+@router.get("/usage", response_model=Dict[str, Any])
+def get_model_usage_summary(user_id: Optional[int] = None):
+    """エンドポイント別・ユーザー別・モデル別のトークン数・レイテンシ・推定コストを返すエンドポイント"""
+    return usage_tracking_service.get_summary(user_id)
+
+# Visionマイクロバッチのメトリクス取得エンドポイント
+@router.get("/vision-batch", response_model=Dict[str, Any])
+def get_vision_batch_metrics():
+    """batch_annotate_imagesでまとめて送ったバッチ数・平均バッチサイズを返すエンドポイント"""
+    if not vision_service.batcher:
+        return {"enabled": False}
+    return {"enabled": True, **vision_service.batcher.get_metrics()}
+
+# Vision解析キャッシュのメトリクス取得エンドポイント
+@router.get("/vision-cache", response_model=Dict[str, Any])
+def get_vision_cache_metrics():
+    """メモリ・DBのヒット数とヒット率を返すエンドポイント"""
+    return vision_cache_service.get_metrics()
+
+# 画像処理メモリバジェットのメトリクス取得エンドポイント
+@router.get("/memory-budget", response_model=Dict[str, Any])
+def get_memory_budget_metrics():
+    """推定メモリ使用量・ピーク・待ち行列・503の件数を返すエンドポイント"""
+    return memory_budget.get_metrics()
+
+# 署名付きURLキャッシュのメトリクス取得エンドポイント
+@router.get("/signed-url-cache", response_model=Dict[str, Any])
+def get_signed_url_cache_metrics():
+    """ヒット率・署名回数・平均署名時間・裏での更新回数を返すエンドポイント"""
+    return signed_url_cache.get_metrics()
@@ -4,6 +4,7 @@ from app.database.supabase_session import get_supabase_db
 from app.models.story.supabase_story_setting import SupabaseStorySetting
 from app.models.story.supabase_story_plot import SupabaseStoryPlot
 from app.service.story_generator_service import StoryGeneratorService
+from app.service.usage_tracking_service import set_usage_context
 from pydantic import BaseModel
 from typing import Dict, Any
 import traceback
@@ -64,6 +65,7 @@ async def supabase_story_generator(
         # user_idを自動取得
         user_id = story_setting.upload_image.user_id
         print(f"User ID: {user_id}")
+        set_usage_context("story/story_generator", user_id)
         
         # データ変換時間を計測
         convert_start = time.time()
@@ -202,6 +204,7 @@ async def supabase_select_theme(
             )
         
         user_id = story_setting.upload_image.user_id
+        set_usage_context("story/select_theme", user_id)
         
         # 選択されたテーマのストーリープロットを取得
         story_plot = db.query(SupabaseStoryPlot).filter(
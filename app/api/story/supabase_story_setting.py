@@ -1,9 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, defer
 from app.database.supabase_session import get_supabase_db
 from app.models.story.supabase_story_setting import SupabaseStorySetting
 from app.models.images.supabase_images import SupabaseUploadImages
-from app.service.story_generator_service import story_generator_service
+from app.service.story_generator_service import story_generator_service, STORY_SETTING_VISION_FEATURES
+from app.service.vision_api_service import vision_service
+from app.utils.analysis_utils import build_derived_features, derived_features_to_analysis
+from app.service.usage_tracking_service import set_usage_context
 import json
 
 router = APIRouter(prefix="/story", tags=["story"])
@@ -15,8 +18,10 @@ async def create_supabase_story_setting_from_image(
 ):
     """Supabase用の画像IDを指定して、meta_dataの解析結果から物語設定を作成または更新するエンドポイント"""
 
-    # 画像レコードを取得
-    upload_image = db.query(SupabaseUploadImages).filter(
+    # 画像レコードを取得（meta_dataは要約がない場合だけ読み込む）
+    upload_image = db.query(SupabaseUploadImages).options(
+        defer(SupabaseUploadImages.meta_data)
+    ).filter(
         SupabaseUploadImages.id == upload_image_id
     ).first()
     
@@ -26,9 +31,16 @@ async def create_supabase_story_setting_from_image(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"画像ID {upload_image_id} が見つかりません"
         )
+    set_usage_context("story/story_settings", upload_image.user_id)
+
+    # アップロード時の要約（derived_features）で足りる場合はmeta_dataをパースしない
+    derived_features = upload_image.derived_features
+    use_derived = bool(derived_features) and not vision_service.missing_features(
+        derived_features, STORY_SETTING_VISION_FEATURES
+    )
 
     # meta_dataが存在しない場合はエラー
-    if not upload_image.meta_data:
+    if not use_derived and not upload_image.meta_data:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"画像ID {upload_image_id} のmeta_dataが見つかりません"
@@ -36,16 +48,43 @@ async def create_supabase_story_setting_from_image(
     
     try:
         action = "作成"  # デフォルト値（例外時のスコープエラー回避）
-        # meta_dataをパース
-        meta_data_json = json.loads(upload_image.meta_data)
+        if use_derived:
+            meta_data_json = derived_features_to_analysis(derived_features)
+            analysis_error = derived_features.get("error")
+        else:
+            # meta_dataをパース
+            meta_data_json = json.loads(upload_image.meta_data)
+            analysis_error = meta_data_json.get("error")
 
         # エラーがある場合はスキップ
-        if meta_data_json.get("error"):
+        if analysis_error:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"画像解析にエラーがあります: {meta_data_json.get('error')}"
+                detail=f"画像解析にエラーがあります: {analysis_error}"
             )
         
+        if not use_derived:
+            # アップロード時に取得していない機能があれば画像を再解析して追加
+            def load_analysis_image() -> bytes:
+                from app.service.gcs_storage_service import GCSStorageService
+                from app.utils.image_utils import create_analysis_rendition
+                content = GCSStorageService().download_image(upload_image.file_path)
+                rendition, _ = create_analysis_rendition(content)
+                return rendition if rendition is not None else content
+
+            meta_data_json, features_added = await vision_service.ensure_features(
+                meta_data_json, STORY_SETTING_VISION_FEATURES, load_analysis_image
+            )
+
+            # 要約を作り直して次回以降はmeta_dataをパースしない
+            derived_features = build_derived_features(meta_data_json)
+            if features_added:
+                upload_image.meta_data = json.dumps(meta_data_json, ensure_ascii=False)
+            upload_image.derived_features = derived_features
+            upload_image.face_count = derived_features["face_count"]
+            upload_image.text_hint = derived_features["text_hint"]
+            db.commit()
+
         # 物語設定を自動生成（app/service/story_generator_service.py）
         story_setting_data = story_generator_service.generate_story_setting_from_analysis(
             meta_data_json, 
@@ -1,4 +1,5 @@
 import os
+import json
 from pathlib import Path
 
 # プロジェクトのルートディレクトリ
@@ -18,9 +19,147 @@ ALLOWED_MIME = {"image/jpeg", "image/png", "image/webp"}
 # Vision API関連の設定
 VISION_API_ENABLED = os.getenv("VISION_API_ENABLED", "true").lower() == "true"
 
+# Vision APIに送る解析用画像（縮小したRGBのJPEG、保存する画像とは別）
+VISION_ANALYSIS_MAX_SIDE = int(os.getenv("VISION_ANALYSIS_MAX_SIDE", "1024"))
+VISION_ANALYSIS_JPEG_QUALITY = int(os.getenv("VISION_ANALYSIS_JPEG_QUALITY", "85"))
+
+# Vision APIで取得する機能のプロファイル（minimal / standard / full）
+VISION_FEATURE_PROFILE = os.getenv("VISION_FEATURE_PROFILE", "standard")
+
+# 物語設定の推定ルール（主人公タイプ・舞台）のファイル
+STORY_SETTING_RULES_PATH = os.getenv("STORY_SETTING_RULES_PATH", str(Path(BASE_DIR, "core", "story_setting_rules.json")))
+
+# アップロード時にGeminiで性別判定を行うか（物語設定の主人公タイプに使用）
+# 1枚ごとにGeminiを呼ぶため既定は無効。有効時はVisionと並行して判定し、ルール上性別が効く画像（顔のない子供の絵など）だけ結果を使う
+GENDER_DETECTION_ENABLED = os.getenv("GENDER_DETECTION_ENABLED", "false").lower() == "true"
+
+# 主要色のローカル抽出（k-means前に縮小する長辺のピクセル数）
+DOMINANT_COLOR_SAMPLE_SIDE = int(os.getenv("DOMINANT_COLOR_SAMPLE_SIDE", "128"))
+
+# アップロードの読み込み単位と、デコード前に弾く画像の最大ピクセル数（展開爆弾対策）
+UPLOAD_READ_CHUNK_SIZE = int(os.getenv("UPLOAD_READ_CHUNK_SIZE", str(256 * 1024)))
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", str(40_000_000)))
+
+# 一括アップロード（/images/upload/batch）で一度に受け付ける画像の枚数
+BATCH_UPLOAD_MAX_FILES = int(os.getenv("BATCH_UPLOAD_MAX_FILES", "10"))
+
+# 保存用画像（1920x1080）の出力形式（png / webp）とエンコード設定
+UPLOAD_IMAGE_FORMAT = os.getenv("UPLOAD_IMAGE_FORMAT", "png").lower()
+UPLOAD_PNG_COMPRESS_LEVEL = int(os.getenv("UPLOAD_PNG_COMPRESS_LEVEL", "3"))
+UPLOAD_WEBP_QUALITY = int(os.getenv("UPLOAD_WEBP_QUALITY", "90"))
+
+# 同時に処理する画像データの推定メモリ量の上限（MB）と、空きを待つ最大秒数（超えたら503）
+MEMORY_BUDGET_MB = int(os.getenv("MEMORY_BUDGET_MB", "512"))
+MEMORY_BUDGET_MAX_WAIT_SECONDS = float(os.getenv("MEMORY_BUDGET_MAX_WAIT_SECONDS", "10"))
+
+# 画像処理などCPU負荷の高い処理を実行するプロセス数（0でスレッド実行）
+WORKER_POOL_SIZE = int(os.getenv("WORKER_POOL_SIZE", "2"))
+# ワーカープロセスの起動方式（forkはスレッド・gRPCクライアントのロック状態を引き継ぐため使わない）
+WORKER_POOL_START_METHOD = os.getenv("WORKER_POOL_START_METHOD", "forkserver")
+
+# 同時に届いたVisionリクエストをbatch_annotate_imagesでまとめて送るか（待ち時間と最大件数）
+VISION_BATCH_ENABLED = os.getenv("VISION_BATCH_ENABLED", "false").lower() == "true"
+VISION_BATCH_WINDOW_MS = int(os.getenv("VISION_BATCH_WINDOW_MS", "10"))
+VISION_BATCH_MAX_SIZE = int(os.getenv("VISION_BATCH_MAX_SIZE", "16"))
+
+# 同じ画像の解析結果を再利用するキャッシュ（メモリのLRU件数とDB保存の有無）
+VISION_CACHE_ENABLED = os.getenv("VISION_CACHE_ENABLED", "true").lower() == "true"
+VISION_CACHE_MAX_ENTRIES = int(os.getenv("VISION_CACHE_MAX_ENTRIES", "1024"))
+VISION_CACHE_PERSIST = os.getenv("VISION_CACHE_PERSIST", "true").lower() == "true"
+
 # Google Cloud Storage関連の設定
 GCS_BUCKET_NAME = os.getenv("GCS_BUCKET_NAME")
 GCS_CREDENTIALS_PATH = os.getenv("GCS_CREDENTIALS_PATH", "app/secrets/ayu1104-9462987945cd.json")
 
+# GCSのオブジェクト名の付け方（dated: users/{id}/{type}/{yyyy}/{mm}/、sharded: 年月の前にハッシュのシャードを入れる）
+GCS_OBJECT_NAMING = os.getenv("GCS_OBJECT_NAMING", "dated").lower()
+GCS_SHARD_PREFIX_LENGTH = int(os.getenv("GCS_SHARD_PREFIX_LENGTH", "2"))
+
+# GCSのオブジェクト名を画像のSHA-256から決める（同じ内容は1オブジェクトを共有し、参照はimage_object_refsで管理）
+GCS_CONTENT_ADDRESSED = os.getenv("GCS_CONTENT_ADDRESSED", "false").lower() == "true"
+GCS_IMMUTABLE_CACHE_CONTROL = os.getenv("GCS_IMMUTABLE_CACHE_CONTROL", "public, max-age=31536000, immutable")
+
+# アップロード・削除を記録するオブジェクト台帳（gcs_object_manifest）から一覧を返すか
+# 既存オブジェクトは reconcile_gcs_manifest.py --apply で台帳に取り込んでから有効にする（falseの間はバケットを直接一覧）
+GCS_MANIFEST_LISTING = os.getenv("GCS_MANIFEST_LISTING", "false").lower() == "true"
+# 一覧エンドポイントで1回に返す件数の上限
+OBJECT_LIST_MAX_LIMIT = int(os.getenv("OBJECT_LIST_MAX_LIMIT", "1000"))
+
+# 非同期GCSクライアント（一括アップロード・削除の同時実行数、コネクションプールの上限、タイムアウト秒）
+GCS_ASYNC_MAX_CONCURRENCY = int(os.getenv("GCS_ASYNC_MAX_CONCURRENCY", "16"))
+GCS_HTTP_MAX_CONNECTIONS = int(os.getenv("GCS_HTTP_MAX_CONNECTIONS", "32"))
+GCS_HTTP_TIMEOUT_SECONDS = float(os.getenv("GCS_HTTP_TIMEOUT_SECONDS", "60"))
+# 429・5xx・通信エラー時の再試行（最大試行回数と指数バックオフの初回待ち秒数）。取得・削除・アップロードが対象
+GCS_HTTP_MAX_ATTEMPTS = int(os.getenv("GCS_HTTP_MAX_ATTEMPTS", "4"))
+GCS_HTTP_RETRY_BASE_SECONDS = float(os.getenv("GCS_HTTP_RETRY_BASE_SECONDS", "0.5"))
+
+# 閲覧用の署名付きURLの有効期限（秒）とキャッシュ（期限の何秒前まで使うか、何秒前から裏で更新するか、件数、署名スレッド数）
+SIGNED_URL_CACHE_ENABLED = os.getenv("SIGNED_URL_CACHE_ENABLED", "true").lower() == "true"
+SIGNED_URL_TTL_SECONDS = int(os.getenv("SIGNED_URL_TTL_SECONDS", "3600"))
+SIGNED_URL_SAFETY_MARGIN_SECONDS = int(os.getenv("SIGNED_URL_SAFETY_MARGIN_SECONDS", "300"))
+SIGNED_URL_REFRESH_AHEAD_SECONDS = int(os.getenv("SIGNED_URL_REFRESH_AHEAD_SECONDS", "600"))
+SIGNED_URL_CACHE_MAX_ENTRIES = int(os.getenv("SIGNED_URL_CACHE_MAX_ENTRIES", "10000"))
+SIGNED_URL_SIGN_WORKERS = int(os.getenv("SIGNED_URL_SIGN_WORKERS", "8"))
+
+# クライアントからGCSへ直接アップロードするURLの有効期限（秒）
+DIRECT_UPLOAD_URL_EXPIRATION_SECONDS = int(os.getenv("DIRECT_UPLOAD_URL_EXPIRATION_SECONDS", "900"))
+# finalizeされずに incoming/ に残った直接アップロードを削除するまでの時間（cleanup_incoming_uploads.pyで削除）
+# ライフサイクルルールはユーザーごとのパスにワイルドカードで一致させられないため、スクリプトを定期実行する
+INCOMING_UPLOAD_MAX_AGE_HOURS = int(os.getenv("INCOMING_UPLOAD_MAX_AGE_HOURS", "24"))
+
+# GCSエミュレータ（fake-gcs-serverなど）のURL。設定時は匿名認証で接続する（テスト用）
+STORAGE_EMULATOR_HOST = os.getenv("STORAGE_EMULATOR_HOST")
+
 # ストレージ設定（GCS固定）
-STORAGE_TYPE = "gcs"  # GCS固定
\ No newline at end of file
+STORAGE_TYPE = "gcs"  # GCS固定
+
+""" Geminiモデルのルーティング設定 """
+
+# モデルのティア（軽量・標準）
+GEMINI_MODEL_LIGHT = os.getenv("GEMINI_MODEL_LIGHT", "gemini-2.5-flash-lite")
+GEMINI_MODEL_STANDARD = os.getenv("GEMINI_MODEL_STANDARD", "gemini-2.5-flash")
+# 思考（thinking）を行わないモデル。出力トークン上限の小さい分類タスクのフォールバックに使う
+# （思考するモデルでは思考トークンが上限を使い切り、応答が空になることがあるため）
+GEMINI_MODEL_NON_THINKING = os.getenv("GEMINI_MODEL_NON_THINKING", "gemini-2.0-flash")
+
+# レイテンシ予算の倍率（環境ごとに予算を一括で調整するため）
+GEMINI_LATENCY_BUDGET_SCALE = float(os.getenv("GEMINI_LATENCY_BUDGET_SCALE", "1.0"))
+
+# モデル呼び出し用スレッド数
+# SDKが呼び出し単位のタイムアウトに対応していない場合、予算超過した呼び出しは完了まで1スレッドを使い続け
+# 課金もされる（フォールバック先と二重に実行される）。その分を見込んで多めにする
+GEMINI_ROUTER_MAX_WORKERS = int(os.getenv("GEMINI_ROUTER_MAX_WORKERS", "8"))
+
+# 思考（thinking）モデル（gemini-2.5系）を呼び出すときに max_output_tokens へ足す思考トークン分の余裕
+# 思考トークンも出力上限に含まれるため、タスクごとの上限（回答の長さ）のままだとJSONが途中で切れる。
+# 使っているSDK（google-generativeai 0.3系）は思考予算（thinking_config）を指定できないため上限側を広げる
+# （上限は打ち切り位置で、課金は実際に生成したトークン分のみ）
+GEMINI_THINKING_TOKEN_HEADROOM = int(os.getenv("GEMINI_THINKING_TOKEN_HEADROOM", "8192"))
+# 思考を行うモデル名に含まれる文字列
+GEMINI_THINKING_MODEL_MARKERS = [m.strip() for m in os.getenv("GEMINI_THINKING_MODEL_MARKERS", "gemini-2.5").split(",") if m.strip()]
+
+# プロンプトの静的プレフィックスをコンテキストキャッシュに載せるか（APIが対応している場合のみ）
+GEMINI_CONTEXT_CACHE_ENABLED = os.getenv("GEMINI_CONTEXT_CACHE_ENABLED", "false").lower() == "true"
+GEMINI_CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL_SECONDS", "3600"))
+# 一時的なエラーでキャッシュ作成に失敗した場合の再試行間隔（秒、失敗ごとに倍にして上限まで）
+GEMINI_CONTEXT_CACHE_RETRY_SECONDS = int(os.getenv("GEMINI_CONTEXT_CACHE_RETRY_SECONDS", "30"))
+GEMINI_CONTEXT_CACHE_RETRY_MAX_SECONDS = int(os.getenv("GEMINI_CONTEXT_CACHE_RETRY_MAX_SECONDS", "1800"))
+
+# テーマ案の一括生成で1回の呼び出しにまとめる設定の最大数
+THEME_BATCH_MAX_ITEMS = int(os.getenv("THEME_BATCH_MAX_ITEMS", "10"))
+
+
+""" モデル呼び出しの使用量・コスト集計 """
+
+# モデルごとの料金（USD / 100万トークン）。GEMINI_MODEL_PRICING_JSONで上書き可能
+GEMINI_MODEL_PRICING = {
+    "gemini-2.5-flash": {"input": 0.30, "cached_input": 0.075, "output": 2.50},
+    "gemini-2.5-flash-lite": {"input": 0.10, "cached_input": 0.025, "output": 0.40},
+    "gemini-2.0-flash": {"input": 0.10, "cached_input": 0.025, "output": 0.40},
+    "gemini-2.5-flash-image-preview": {"input": 0.30, "cached_input": 0.075, "output": 30.0},
+}
+if os.getenv("GEMINI_MODEL_PRICING_JSON"):
+    GEMINI_MODEL_PRICING.update(json.loads(os.getenv("GEMINI_MODEL_PRICING_JSON")))
+
+# 呼び出しごとの使用量をmodel_usage_logsテーブルにも保存するか
+MODEL_USAGE_PERSIST = os.getenv("MODEL_USAGE_PERSIST", "false").lower() == "true"
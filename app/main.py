@@ -30,6 +30,18 @@ def read_root():
         "version": "progressive"
     }
 
+@app.on_event("shutdown")
+def shutdown_worker_pool():
+    """CPU処理用のプロセスプールを停止"""
+    from app.utils.worker_pool import shutdown_process_pool
+    shutdown_process_pool()
+
+@app.on_event("shutdown")
+def shutdown_async_gcs_client():
+    """非同期GCSクライアントの専用ループとコネクションプールを停止"""
+    from app.service.async_gcs_storage_service import async_gcs_storage_service
+    async_gcs_storage_service.shutdown()
+
 @app.get("/health")
 def health_check():
     return {"status": "healthy", "service": "story-book-backend"}
@@ -131,6 +143,16 @@ except Exception as e:
     def storybook_test():
         return {"message": "Generated storybook router not available", "error": str(e)}
 
+try:
+    from app.api.metrics.metrics import router as metrics_router
+    app.include_router(metrics_router)
+    print("✅ Metrics router loaded successfully")
+except Exception as e:
+    print(f"❌ Failed to load metrics_router: {e}")
+    @app.get("/metrics/test")
+    def metrics_test():
+        return {"message": "Metrics router not available", "error": str(e)}
+
 @app.get("/api/routes")
 def list_routes():
     """利用可能なルートの一覧を表示"""
@@ -8,6 +8,10 @@ from .story.generated_story_book import GeneratedStoryBook
 # Supabaseモデルもインポート
 from .users.supabase_users import SupabaseUsers
 from .images.supabase_images import SupabaseUploadImages
+from .images.supabase_vision_cache import SupabaseVisionAnalysisCache
+from .images.supabase_object_refs import SupabaseImageObjectRef
+from .images.supabase_object_manifest import SupabaseGCSObjectManifest
 from .story.supabase_story_setting import SupabaseStorySetting
 from .story.supabase_story_plot import SupabaseStoryPlot
-from .story.supabase_generated_story_book import SupabaseGeneratedStoryBook
\ No newline at end of file
+from .story.supabase_generated_story_book import SupabaseGeneratedStoryBook
+from .usage.supabase_model_usage import SupabaseModelUsageLog
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, ForeignKey, Text, JSON
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from app.database.supabase_base import SupabaseBase
 
@@ -18,6 +19,11 @@ class SupabaseUploadImages(SupabaseBase):
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False, comment="ユーザーID")
     meta_data = Column(Text, nullable=True, comment="画像解析結果のメタデータ")
     public_url = Column(String(1024), nullable=True, comment="公開URL（GCS等）")
+    # 物語設定の推定に使う解析結果の要約（meta_dataをパースせずに読めるように）
+    derived_features = Column(JSON().with_variant(JSONB(), "postgresql"), nullable=True, comment="解析結果の要約（ラベル・オブジェクト・色など）")
+    face_count = Column(Integer, nullable=True, comment="検出された顔の数")
+    text_hint = Column(String(255), nullable=True, comment="OCRテキストの先頭（主人公名の候補）")
+    raw_analysis_path = Column(String(512), nullable=True, comment="Vision解析結果全体のGCSパス")
 
     # リレーションシップ（既存モデルと互換性を保つ）
     user = relationship("SupabaseUsers", back_populates="upload_images")
@@ -0,0 +1,28 @@
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Index
+from app.database.supabase_base import SupabaseBase
+
+class SupabaseGCSObjectManifest(SupabaseBase):
+    """Supabase用のGCSオブジェクト台帳モデル
+
+    GCSStorageService でアップロード・削除したオブジェクトを1件1行で記録し、
+    一覧はバケットを list_blobs せずにこの表を (user_id, kind, id) のキーセットでページングして返す。
+    台帳とバケットのずれは reconcile_gcs_manifest.py で突き合わせて直す。
+    """
+    __tablename__ = "gcs_object_manifest"
+    __table_args__ = (
+        Index("ix_gcs_object_manifest_user_kind_id", "user_id", "kind", "id"),
+        Index("ix_gcs_object_manifest_kind_id", "kind", "id"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
+    object_path = Column(String(512), nullable=False, unique=True, index=True, comment="GCSオブジェクトのパス")
+    # オブジェクトはユーザー削除後もバケットに残り得るため外部キーにはしない
+    user_id = Column(Integer, nullable=True, comment="ユーザーID（パスから判定、共有オブジェクトはNULL）")
+    kind = Column(String(20), nullable=True, comment="uploads / generated / cas など（パスから判定）")
+    size_bytes = Column(BigInteger, nullable=False, comment="オブジェクトのサイズ（バイト）")
+    content_type = Column(String(100), nullable=True, comment="コンテンツタイプ")
+    width = Column(Integer, nullable=True, comment="画像の幅（ヘッダーから取得）")
+    height = Column(Integer, nullable=True, comment="画像の高さ（ヘッダーから取得）")
+    content_hash = Column(String(64), nullable=True, comment="画像バイトのSHA-256（コンテンツアドレス方式のみ）")
+    object_created_at = Column(DateTime(timezone=True), nullable=True, comment="オブジェクトの作成日時")
+    reconciled_at = Column(DateTime(timezone=True), nullable=True, comment="最後にバケットと突き合わせた日時")
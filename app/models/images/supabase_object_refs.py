@@ -0,0 +1,17 @@
+from sqlalchemy import Column, Integer, String, ForeignKey
+from app.database.supabase_base import SupabaseBase
+
+class SupabaseImageObjectRef(SupabaseBase):
+    """Supabase用のGCSオブジェクト参照モデル（コンテンツアドレス方式）
+
+    同じ内容の画像は cas/{ハッシュ先頭2文字}/{SHA-256}.{拡張子} の1オブジェクトを共有し、
+    ユーザーごとのアップロード・生成1件につき1行の参照を持つ。
+    参照が0件になったオブジェクトだけを削除する。
+    """
+    __tablename__ = "image_object_refs"
+
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
+    content_hash = Column(String(64), nullable=False, index=True, comment="画像バイトのSHA-256")
+    object_path = Column(String(512), nullable=False, index=True, comment="GCSオブジェクトのパス")
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True, comment="ユーザーID")
+    kind = Column(String(20), nullable=False, default="uploads", comment="uploads / generated")
@@ -0,0 +1,15 @@
+from sqlalchemy import Column, Integer, String, Text
+from app.database.supabase_base import SupabaseBase
+
+class SupabaseVisionAnalysisCache(SupabaseBase):
+    """Supabase用のVision API解析結果キャッシュモデル
+
+    解析用画像（正規化済みバイト）のSHA-256をキーに、解析結果を保存する
+    （同じ画像の再アップロード時にVision APIの呼び出しを省略するため）
+    """
+    __tablename__ = "vision_analysis_cache"
+
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
+    content_hash = Column(String(64), nullable=False, unique=True, index=True, comment="解析用画像のSHA-256")
+    analysis_result = Column(Text, nullable=False, comment="Vision API解析結果（JSON文字列）")
+    hit_count = Column(Integer, nullable=False, default=0, comment="キャッシュヒット回数")
@@ -0,0 +1,24 @@
+from sqlalchemy import Column, Integer, String, Float
+from app.database.supabase_base import SupabaseBase
+
+class SupabaseModelUsageLog(SupabaseBase):
+    """Supabase用のモデル呼び出し使用量ログモデル
+
+    Gemini APIの呼び出しごとにトークン数・レイテンシ・コストを記録する
+    （MODEL_USAGE_PERSIST=true の場合のみ書き込み）
+    """
+    __tablename__ = "model_usage_logs"
+
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
+    endpoint = Column(String(255), nullable=False, index=True, comment="呼び出し元エンドポイント")
+    user_id = Column(Integer, nullable=True, index=True, comment="ユーザーID")
+    model = Column(String(100), nullable=False, comment="モデル名")
+    task = Column(String(100), nullable=False, comment="タスク名")
+    prompt_tokens = Column(Integer, nullable=False, default=0, comment="入力トークン数")
+    cached_tokens = Column(Integer, nullable=False, default=0, comment="キャッシュされた入力トークン数")
+    output_tokens = Column(Integer, nullable=False, default=0, comment="出力トークン数")
+    thinking_tokens = Column(Integer, nullable=True, default=0, comment="思考トークン数（出力として課金される）")
+    latency_ms = Column(Integer, nullable=False, default=0, comment="レイテンシ（ミリ秒）")
+    retries = Column(Integer, nullable=False, default=0, comment="リトライ回数")
+    outcome = Column(String(30), nullable=False, comment="結果（success, error, timeout など）")
+    cost_usd = Column(Float, nullable=False, default=0.0, comment="推定コスト（USD）")
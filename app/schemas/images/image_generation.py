@@ -121,3 +121,4 @@ class ImageUploadResponse(BaseModel):
     image_size: tuple
     format: str
     timestamp: str
+    id: Optional[int] = None  # オブジェクト台帳のID（次のページは after_id にこの値を指定）
@@ -16,4 +16,30 @@ class UploadImageResponse(BaseModel):
     uploaded_at: datetime  # created_atのエイリアス（フロントエンド互換性のため）
     meta_data: Optional[str] = None  # JSON文字列として扱う
     public_url: Optional[str] = None  # GCSの公開URL（ストレージタイプがGCSの場合）
+    timing_details: Optional[Dict[str, float]] = None  # アップロード時の各ステージの所要時間（秒）
 
+
+# GCSへの直接アップロードURL発行時に受け取るリクエストスキーマ
+class DirectUploadRequest(BaseModel):
+    user_id: int
+    file_name: str
+    content_type: str
+    size_bytes: Optional[int] = None  # resumableの場合はセッションに固定される
+    mode: str = "signed_put"  # signed_put / resumable
+    origin: Optional[str] = None  # ブラウザから送る場合のCORS用Origin（resumableのみ）
+
+# GCSへの直接アップロードURL発行時に返すレスポンススキーマ
+class DirectUploadResponse(BaseModel):
+    mode: str
+    upload_url: str
+    method: str
+    headers: Dict[str, str]  # アップロード時にクライアントが付けるヘッダー
+    object_path: str  # finalize に渡すGCS上のパス
+    expires_at: datetime
+
+# 直接アップロードした画像の処理（finalize）時に受け取るリクエストスキーマ
+class FinalizeUploadRequest(BaseModel):
+    user_id: int
+    object_path: str
+    file_name: Optional[str] = None
+    feature_profile: Optional[str] = None
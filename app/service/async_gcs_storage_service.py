@@ -0,0 +1,280 @@
+import json
+import uuid
+import random
+import asyncio
+import threading
+from typing import Dict, Any, Optional, List, Coroutine
+from urllib.parse import quote
+import httpx
+from app.core.config import (
+    GCS_ASYNC_MAX_CONCURRENCY, GCS_HTTP_MAX_CONNECTIONS, GCS_HTTP_TIMEOUT_SECONDS,
+    GCS_HTTP_MAX_ATTEMPTS, GCS_HTTP_RETRY_BASE_SECONDS,
+)
+
+GCS_API_BASE = "https://storage.googleapis.com"
+GCS_SCOPES = ["https://www.googleapis.com/auth/devstorage.read_write"]
+# 再試行するステータスコード（レート制限・一時的なサーバーエラー）
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+# 何度送っても結果が同じになるメソッド（POSTのアップロードは呼び出し側で retry=True を指定する）
+IDEMPOTENT_METHODS = {"GET", "HEAD", "DELETE"}
+
+
+class GCSRequestError(Exception):
+    """GCS JSON APIがエラーを返した場合の例外"""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(f"GCS API エラー ({status_code}): {message}")
+        self.status_code = status_code
+
+
+class AsyncGCSStorageService:
+    """httpxのコネクションプールでGCS JSON APIを呼ぶ非同期ストレージ
+
+    httpx.AsyncClient はイベントループに紐づくため、専用スレッドのイベントループ上で
+    1つのクライアントを共有し、呼び出し元のループ（FastAPI）やスレッド（同期コード）から処理を投げる。
+    - 非同期コードからは await upload_many(...) / delete_many(...) など
+    - 同期コードからは *_sync メソッド（GCSStorageService の既存インターフェースはこれを使う）
+    一括処理の同時実行数は GCS_ASYNC_MAX_CONCURRENCY で制限する。
+    接続先のバケットは import 時に決めず、GCSStorageService の初期化時に configure で渡す
+    （.env を読み込んだ後の値を同期クライアントと揃えるため）。
+    """
+
+    def __init__(self, bucket_name: Optional[str] = None, emulator_host: Optional[str] = None,
+                 max_concurrency: int = GCS_ASYNC_MAX_CONCURRENCY):
+        self.configure(bucket_name, emulator_host)
+        self.max_concurrency = max_concurrency
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._credentials = None
+        self._auth_lock: Optional[asyncio.Lock] = None
+
+    def configure(self, bucket_name: Optional[str], emulator_host: Optional[str] = None) -> None:
+        """接続先のバケットとエミュレータを設定（最初のリクエストより前に呼ぶこと）"""
+        self.bucket_name = bucket_name
+        self.emulator_host = emulator_host
+        self.api_base = (emulator_host or GCS_API_BASE).rstrip("/")
+
+    # ===== イベントループ・クライアント管理 =====
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        """専用スレッドのイベントループを取得（初回に起動）"""
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="gcs-async-loop", daemon=True)
+                self._thread.start()
+            return self._loop
+
+    def run_sync(self, coro: Coroutine) -> Any:
+        """専用ループでコルーチンを実行して結果を待つ（同期コード用。専用ループ上から呼ばないこと）"""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop()).result()
+
+    async def _run(self, coro: Coroutine) -> Any:
+        """専用ループでコルーチンを実行し、呼び出し元のループで結果を待つ"""
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self._ensure_loop()))
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """コネクションプール付きのHTTPクライアント（専用ループ上で作成）"""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=GCS_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=GCS_HTTP_MAX_CONNECTIONS,
+                ),
+                timeout=GCS_HTTP_TIMEOUT_SECONDS,
+            )
+            self._auth_lock = asyncio.Lock()
+        return self._client
+
+    async def _auth_headers(self) -> Dict[str, str]:
+        """アクセストークンのヘッダー（エミュレータでは不要）。期限切れ時はスレッドで更新"""
+        if self.emulator_host:
+            return {}
+        async with self._auth_lock:
+            if self._credentials is None:
+                import google.auth
+                self._credentials, _ = await asyncio.to_thread(google.auth.default, scopes=GCS_SCOPES)
+            if not self._credentials.valid:
+                from google.auth.transport.requests import Request
+                await asyncio.to_thread(self._credentials.refresh, Request())
+        return {"Authorization": f"Bearer {self._credentials.token}"}
+
+    async def _request(self, method: str, url: str, retry: Optional[bool] = None, **kwargs) -> httpx.Response:
+        """GCS JSON APIを呼ぶ
+
+        retry: 429・5xx・通信エラー時に指数バックオフ（ジッター付き）で再試行するか
+            （省略時は GET / HEAD / DELETE のみ。同じ名前へのアップロードは再送しても上書きで結果が同じため、呼び出し側で指定する）
+        """
+        if not self.bucket_name:
+            raise RuntimeError("GCSのバケットが設定されていません（GCSStorageService の初期化時に configure されます）")
+        client = self._get_client()
+        if retry is None:
+            retry = method in IDEMPOTENT_METHODS
+        max_attempts = GCS_HTTP_MAX_ATTEMPTS if retry else 1
+        extra_headers = kwargs.pop("headers", {})
+        for attempt in range(1, max_attempts + 1):
+            headers = {**extra_headers, **(await self._auth_headers())}
+            try:
+                response = await client.request(method, url, headers=headers, **kwargs)
+            except httpx.TransportError as e:
+                if attempt >= max_attempts:
+                    raise
+                await self._retry_wait(attempt, f"{type(e).__name__}: {e}", method, url)
+                continue
+            if response.status_code in RETRYABLE_STATUS_CODES and attempt < max_attempts:
+                await self._retry_wait(attempt, f"status {response.status_code}", method, url,
+                                       response.headers.get("Retry-After"))
+                continue
+            if response.status_code >= 400:
+                raise GCSRequestError(response.status_code, response.text[:500])
+            return response
+
+    @staticmethod
+    async def _retry_wait(attempt: int, reason: str, method: str, url: str, retry_after: Optional[str] = None) -> None:
+        """再試行前の待ち（Retry-Afterがあればそれを優先）"""
+        delay = GCS_HTTP_RETRY_BASE_SECONDS * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, float(retry_after))
+        print(f"⚠️ GCS API 再試行 {attempt}/{GCS_HTTP_MAX_ATTEMPTS} ({method} {url.split('?')[0]}): {reason} {delay:.2f}秒後")
+        await asyncio.sleep(delay)
+
+    def _object_url(self, gcs_path: str) -> str:
+        return f"{self.api_base}/storage/v1/b/{self.bucket_name}/o/{quote(gcs_path, safe='')}"
+
+    async def _close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def shutdown(self) -> None:
+        """アプリ終了時にクライアントと専用ループを停止"""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop, self._thread = None, None
+        if loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._close(), loop).result(timeout=10)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=10)
+
+    # ===== 1件ずつの操作（専用ループ上で実行） =====
+
+    async def _upload_bytes(self, gcs_path: str, content: bytes, content_type: str,
+                            cache_control: Optional[str] = None) -> Dict[str, Any]:
+        url = f"{self.api_base}/upload/storage/v1/b/{self.bucket_name}/o"
+        if not cache_control:
+            await self._request("POST", url, retry=True, params={"uploadType": "media", "name": gcs_path},
+                                content=content, headers={"Content-Type": content_type})
+        else:
+            # メタデータ（Cache-Control）と本体を1リクエストで送る
+            boundary = uuid.uuid4().hex
+            metadata = json.dumps({"name": gcs_path, "contentType": content_type, "cacheControl": cache_control})
+            body = b"".join([
+                f"--{boundary}\r\nContent-Type: application/json; charset=UTF-8\r\n\r\n{metadata}\r\n".encode("utf-8"),
+                f"--{boundary}\r\nContent-Type: {content_type}\r\n\r\n".encode("utf-8"),
+                content,
+                f"\r\n--{boundary}--\r\n".encode("utf-8"),
+            ])
+            await self._request("POST", url, retry=True, params={"uploadType": "multipart"}, content=body,
+                                headers={"Content-Type": f"multipart/related; boundary={boundary}"})
+        return {"success": True, "gcs_path": gcs_path, "size_bytes": len(content)}
+
+    async def _delete(self, gcs_path: str) -> bool:
+        try:
+            await self._request("DELETE", self._object_url(gcs_path))
+        except GCSRequestError as e:
+            # 既に削除済みなら成功扱い
+            if e.status_code != 404:
+                raise
+        return True
+
+    async def _download(self, gcs_path: str) -> bytes:
+        response = await self._request("GET", self._object_url(gcs_path), params={"alt": "media"})
+        return response.content
+
+    async def _list_names(self, prefix: str) -> List[str]:
+        names, page_token = [], None
+        while True:
+            params = {"prefix": prefix, "fields": "items(name),nextPageToken", "maxResults": 1000}
+            if page_token:
+                params["pageToken"] = page_token
+            data = (await self._request("GET", f"{self.api_base}/storage/v1/b/{self.bucket_name}/o", params=params)).json()
+            names.extend(item["name"] for item in data.get("items", []))
+            page_token = data.get("nextPageToken")
+            if not page_token:
+                return names
+
+    # ===== 一括操作（同時実行数を制限して並行実行） =====
+
+    async def _gather_limited(self, coros: List[Coroutine]) -> List[Any]:
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def limited(coro):
+            async with semaphore:
+                return await coro
+
+        return await asyncio.gather(*(limited(coro) for coro in coros), return_exceptions=True)
+
+    async def _upload_many(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        outcomes = await self._gather_limited([
+            self._upload_bytes(item["gcs_path"], item["content"], item.get("content_type", "application/octet-stream"),
+                               item.get("cache_control"))
+            for item in items
+        ])
+        return [
+            {"success": False, "gcs_path": item["gcs_path"], "error": str(outcome)}
+            if isinstance(outcome, BaseException) else outcome
+            for item, outcome in zip(items, outcomes)
+        ]
+
+    async def _delete_many(self, gcs_paths: List[str]) -> Dict[str, Any]:
+        outcomes = await self._gather_limited([self._delete(path) for path in gcs_paths])
+        failed = [
+            {"gcs_path": path, "error": str(outcome)}
+            for path, outcome in zip(gcs_paths, outcomes) if isinstance(outcome, BaseException)
+        ]
+        return {"deleted": len(gcs_paths) - len(failed), "failed": failed}
+
+    async def _delete_prefix(self, prefix: str) -> Dict[str, Any]:
+        return await self._delete_many(await self._list_names(prefix))
+
+    # ===== 非同期インターフェース（任意のイベントループから呼べる） =====
+
+    async def upload_bytes(self, gcs_path: str, content: bytes, content_type: str,
+                           cache_control: Optional[str] = None) -> Dict[str, Any]:
+        return await self._run(self._upload_bytes(gcs_path, content, content_type, cache_control))
+
+    async def upload_many(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """複数オブジェクトを並行アップロード（items: gcs_path, content, content_type, cache_control）"""
+        return await self._run(self._upload_many(items))
+
+    async def download(self, gcs_path: str) -> bytes:
+        return await self._run(self._download(gcs_path))
+
+    async def delete_many(self, gcs_paths: List[str]) -> Dict[str, Any]:
+        """複数オブジェクトを並行削除（存在しないものは削除済み扱い）"""
+        return await self._run(self._delete_many(gcs_paths))
+
+    async def delete_prefix(self, prefix: str) -> Dict[str, Any]:
+        """プレフィックス以下のオブジェクトをすべて削除"""
+        return await self._run(self._delete_prefix(prefix))
+
+    # ===== 同期インターフェース（GCSStorageServiceなど既存の同期コード用） =====
+
+    def upload_bytes_sync(self, gcs_path: str, content: bytes, content_type: str,
+                          cache_control: Optional[str] = None) -> Dict[str, Any]:
+        return self.run_sync(self._upload_bytes(gcs_path, content, content_type, cache_control))
+
+    def upload_many_sync(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return self.run_sync(self._upload_many(items))
+
+    def delete_many_sync(self, gcs_paths: List[str]) -> Dict[str, Any]:
+        return self.run_sync(self._delete_many(gcs_paths))
+
+    def delete_prefix_sync(self, prefix: str) -> Dict[str, Any]:
+        return self.run_sync(self._delete_prefix(prefix))
+
+# シングルトンインスタンス（バケットは GCSStorageService が設定する）
+async_gcs_storage_service = AsyncGCSStorageService()
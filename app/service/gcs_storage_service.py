@@ -1,14 +1,29 @@
 import os
+import re
 import uuid
+import hashlib
 from datetime import datetime, timedelta
 from typing import Dict, Any, Optional, List
+from app.core.config import (
+    DIRECT_UPLOAD_URL_EXPIRATION_SECONDS, STORAGE_EMULATOR_HOST, MAX_UPLOAD_SIZE,
+    GCS_CONTENT_ADDRESSED, GCS_IMMUTABLE_CACHE_CONTROL, GCS_OBJECT_NAMING, GCS_SHARD_PREFIX_LENGTH,
+    GCS_MANIFEST_LISTING,
+)
+from app.service.async_gcs_storage_service import async_gcs_storage_service
+from app.service.signed_url_cache_service import signed_url_cache
+from app.service.object_manifest_service import object_manifest_service
+from google.api_core.exceptions import PreconditionFailed
 from google.cloud import storage
 from google.oauth2 import service_account
+from google.auth.credentials import AnonymousCredentials
 from dotenv import load_dotenv
 import json
 
 load_dotenv()
 
+# 年月から始まる従来のオブジェクト名（users/{id}/{type}/{yyyy}/{mm}/{残り}）
+DATED_PATH_PATTERN = re.compile(r"^users/(\d+)/([^/]+)/(\d{4})/(\d{2})/(.+)$")
+
 class GCSStorageService:
     """Google Cloud Storageを使用して画像を保存・取得するサービス（改善版）"""
 
@@ -39,8 +54,22 @@ class GCSStorageService:
             print(f"  - プロジェクトID: {project_id}")
             print(f"  - バケット名: {self.bucket_name}")
             
-            self.client = storage.Client(project=project_id)
+            # エミュレータ使用時は匿名認証（接続先はSTORAGE_EMULATOR_HOSTをクライアントが参照する）
+            self.emulator_host = STORAGE_EMULATOR_HOST
+            if self.emulator_host:
+                print(f"  - GCSエミュレータ: {self.emulator_host}")
+                self.client = storage.Client(project=project_id, credentials=AnonymousCredentials())
+            else:
+                self.client = storage.Client(project=project_id)
             self.bucket = self.client.bucket(self.bucket_name)
+            # 同じ内容の画像を1オブジェクトで共有するか
+            self.content_addressed = GCS_CONTENT_ADDRESSED
+            # 連続したキーへの書き込み集中を避けるためシャードを入れるか
+            self.object_naming = GCS_OBJECT_NAMING
+            # アップロード・一括削除はコネクションプール付きの非同期クライアントで行う
+            # （バケットは import 時の設定値ではなく、ここで読んだ値を渡して同期クライアントと揃える）
+            async_gcs_storage_service.configure(self.bucket_name, self.emulator_host)
+            self.async_storage = async_gcs_storage_service
             
             print(f"✅ GCS初期化完了")
         except Exception as e:
@@ -57,30 +86,73 @@ class GCSStorageService:
         unique_id = uuid.uuid4().hex[:8]
         return f"{prefix}_{timestamp}_{unique_id}.{extension}"
 
-    def _get_user_path(self, user_id: int, file_type: str = "uploads") -> str:
-        """ユーザー別パスを生成"""
+    def _get_user_path(self, user_id: int, file_type: str = "uploads", shard_key: Optional[str] = None) -> str:
+        """ユーザー別パスを生成
+
+        sharded の場合は shard_key（ファイル名）のハッシュから作ったシャードを年月の前に入れ、
+        同じ時期の書き込みがキー範囲の一か所に集中しないようにする。
+        """
         now = datetime.now()
         year = now.strftime("%Y")
         month = now.strftime("%m")
+        if self.object_naming == "sharded" and shard_key:
+            return f"users/{user_id}/{file_type}/{self.shard_prefix(shard_key)}/{year}/{month}"
         return f"users/{user_id}/{file_type}/{year}/{month}"
 
+    @staticmethod
+    def shard_prefix(shard_key: str, length: int = GCS_SHARD_PREFIX_LENGTH) -> str:
+        """ファイル名のハッシュの先頭（16進数）"""
+        return hashlib.md5(shard_key.encode("utf-8")).hexdigest()[:length]
+
+    @classmethod
+    def sharded_path_for(cls, gcs_path: str) -> Optional[str]:
+        """従来の年月から始まるパスに対応するシャード付きのパス（対象外のパスはNone）
+
+        シャードはファイル名（年月以下の最初の要素）から作るため、アップロード時に付くシャードと一致する。
+        """
+        match = DATED_PATH_PATTERN.match(gcs_path)
+        if not match:
+            return None
+        user_id, file_type, year, month, rest = match.groups()
+        shard_key = rest.split("/")[0] if file_type == "uploads" else rest.split("/")[-1]
+        return f"users/{user_id}/{file_type}/{cls.shard_prefix(shard_key)}/{year}/{month}/{rest}"
+
+    def resolve_object_path(self, path_or_url: str) -> str:
+        """file_path / public_url / gs:// のどの形式でもバケット内のオブジェクト名を返す
+
+        DBには年月形式・シャード形式・コンテンツアドレス形式のパスやURLが混在するため、
+        GCSを読む処理はすべてここを通して解決する。
+        """
+        for prefix in (
+            f"https://storage.googleapis.com/{self.bucket_name}/",
+            f"https://{self.bucket_name}.storage.googleapis.com/",
+            f"gs://{self.bucket_name}/",
+        ):
+            if path_or_url.startswith(prefix):
+                return path_or_url[len(prefix):].split("?")[0]
+        return path_or_url.lstrip("/")
+
     def upload_image(self, file_content: bytes, filename: str, user_id: int, content_type: str = "image/jpeg") -> Dict[str, Any]:
         """画像をGoogle Cloud Storageにアップロード（改善版）"""
         try:
-            # ファイル名を生成
             file_extension = filename.split(".")[-1].lower() if "." in filename else "jpg"
-            unique_filename = self.generate_unique_filename("uploaded_image", file_extension)
-            
-            # ユーザー別パスを生成
-            user_path = self._get_user_path(user_id, "uploads")
-            gcs_path = f"{user_path}/{unique_filename}"
-            
-            # ファイルをアップロード
-            blob = self.bucket.blob(gcs_path)
-            blob.upload_from_string(
-                file_content,
-                content_type=content_type
-            )
+            content_hash, deduplicated = None, False
+            if self.content_addressed:
+                # 内容のハッシュから決まるパスに保存（既にあればメタデータの追加だけ）
+                gcs_path, content_hash, deduplicated = self._store_content_addressed(file_content, file_extension, content_type)
+                self._add_object_ref(user_id, content_hash, gcs_path, "uploads")
+                unique_filename = os.path.basename(gcs_path)
+            else:
+                # ファイル名を生成
+                unique_filename = self.generate_unique_filename("uploaded_image", file_extension)
+                
+                # ユーザー別パスを生成
+                user_path = self._get_user_path(user_id, "uploads", shard_key=unique_filename)
+                gcs_path = f"{user_path}/{unique_filename}"
+                
+                # ファイルをアップロード
+                self.async_storage.upload_bytes_sync(gcs_path, file_content, content_type)
+            object_manifest_service.record_content(gcs_path, file_content, content_type, content_hash)
             
             # storage.googleapis.com形式のURLを生成（正しいGCSの公開URL形式）
             public_url = f"https://storage.googleapis.com/{self.bucket_name}/{gcs_path}"
@@ -93,7 +165,9 @@ class GCSStorageService:
                 "size_bytes": len(file_content),
                 "content_type": content_type,
                 "timestamp": datetime.now().isoformat(),
-                "user_id": user_id
+                "user_id": user_id,
+                "content_hash": content_hash,
+                "deduplicated": deduplicated
             }
             
         except Exception as e:
@@ -106,20 +180,22 @@ class GCSStorageService:
     def upload_generated_image(self, file_content: bytes, filename: str, user_id: int, story_id: Optional[int] = None, content_type: str = "image/png") -> Dict[str, Any]:
         """生成された画像をGoogle Cloud Storageにアップロード（改善版）"""
         try:
-            # ストーリー別パスを生成
-            if story_id:
-                user_path = self._get_user_path(user_id, "generated")
-                gcs_path = f"{user_path}/{story_id}/pages/{filename}"
+            content_hash, deduplicated = None, False
+            if self.content_addressed:
+                file_extension = filename.split(".")[-1].lower() if "." in filename else "png"
+                gcs_path, content_hash, deduplicated = self._store_content_addressed(file_content, file_extension, content_type)
+                self._add_object_ref(user_id, content_hash, gcs_path, "generated")
             else:
-                user_path = self._get_user_path(user_id, "generated")
-                gcs_path = f"{user_path}/temp/{filename}"
-            
-            # ファイルをアップロード
-            blob = self.bucket.blob(gcs_path)
-            blob.upload_from_string(
-                file_content,
-                content_type=content_type
-            )
+                # ストーリー別パスを生成
+                user_path = self._get_user_path(user_id, "generated", shard_key=filename)
+                if story_id:
+                    gcs_path = f"{user_path}/{story_id}/pages/{filename}"
+                else:
+                    gcs_path = f"{user_path}/temp/{filename}"
+                
+                # ファイルをアップロード
+                self.async_storage.upload_bytes_sync(gcs_path, file_content, content_type)
+            object_manifest_service.record_content(gcs_path, file_content, content_type, content_hash)
             
             # storage.googleapis.com形式のURLを生成（正しいGCSの公開URL形式）
             public_url = f"https://storage.googleapis.com/{self.bucket_name}/{gcs_path}"
@@ -133,7 +209,9 @@ class GCSStorageService:
                 "content_type": content_type,
                 "timestamp": datetime.now().isoformat(),
                 "user_id": user_id,
-                "story_id": story_id
+                "story_id": story_id,
+                "content_hash": content_hash,
+                "deduplicated": deduplicated
             }
             
         except Exception as e:
@@ -143,40 +221,386 @@ class GCSStorageService:
                 "filename": filename
             }
 
+    def upload_generated_images(self, images: List[Dict[str, Any]], user_id: int, story_id: Optional[int] = None,
+                                content_type: str = "image/png") -> List[Dict[str, Any]]:
+        """生成された複数ページの画像を並行してアップロード（images: filename, file_content）
+
+        コンテンツアドレス方式では参照の登録が必要なため1件ずつ upload_generated_image を使う。
+        """
+        if self.content_addressed:
+            return [
+                self.upload_generated_image(image["file_content"], image["filename"], user_id, story_id, content_type)
+                for image in images
+            ]
+
+        items = []
+        for image in images:
+            user_path = self._get_user_path(user_id, "generated", shard_key=image["filename"])
+            subdir = f"{story_id}/pages" if story_id else "temp"
+            items.append({
+                "gcs_path": f"{user_path}/{subdir}/{image['filename']}",
+                "content": image["file_content"],
+                "content_type": content_type,
+            })
+
+        outcomes = self.async_storage.upload_many_sync(items)
+        object_manifest_service.record_many([
+            object_manifest_service.build_entry(
+                item["gcs_path"], len(item["content"]), content_type,
+                *object_manifest_service.image_dimensions(item["content"])
+            )
+            for item, outcome in zip(items, outcomes) if outcome["success"]
+        ])
+
+        results = []
+        for image, item, outcome in zip(images, items, outcomes):
+            if not outcome["success"]:
+                results.append({"success": False, "error": outcome["error"], "filename": image["filename"]})
+                continue
+            results.append({
+                "success": True,
+                "filename": image["filename"],
+                "gcs_path": item["gcs_path"],
+                "public_url": f"https://storage.googleapis.com/{self.bucket_name}/{item['gcs_path']}",
+                "size_bytes": len(image["file_content"]),
+                "content_type": content_type,
+                "timestamp": datetime.now().isoformat(),
+                "user_id": user_id,
+                "story_id": story_id,
+                "content_hash": None,
+                "deduplicated": False
+            })
+        return results
+
+    @staticmethod
+    def content_addressed_path(content_hash: str, extension: str) -> str:
+        """コンテンツアドレス方式のオブジェクト名（先頭2文字で分散）"""
+        return f"cas/{content_hash[:2]}/{content_hash}.{extension}"
+
+    @staticmethod
+    def is_content_addressed_path(gcs_path: str) -> bool:
+        return gcs_path.startswith("cas/")
+
+    def raw_analysis_path(self, gcs_path: str, user_id: int) -> str:
+        """画像の解析結果全体（JSON）の保存先
+
+        通常は画像と同じ場所に置く。コンテンツアドレス方式の画像は他のユーザーと共有されるため、
+        アップロードしたユーザーのパス以下にアップロードごとの名前で置く（他のアップロードに上書きされず、
+        release_object・ユーザーの一括削除で一緒に消える）。
+        """
+        if not self.is_content_addressed_path(gcs_path):
+            return f"{os.path.splitext(gcs_path)[0]}.analysis.json"
+        content_name = os.path.splitext(os.path.basename(gcs_path))[0]
+        filename = f"{content_name[:16]}_{uuid.uuid4().hex[:8]}.analysis.json"
+        return f"{self._get_user_path(user_id, 'uploads', shard_key=filename)}/analysis/{filename}"
+
+    def _store_content_addressed(self, file_content: bytes, extension: str, content_type: str):
+        """内容のSHA-256から決まるパスに保存
+
+        既に同じオブジェクトがあればアップロードしない。内容が変わらないため
+        長期間の immutable な Cache-Control を付ける。
+
+        Returns:
+            (GCSパス, SHA-256, 既存オブジェクトを再利用したか)
+        """
+        content_hash = hashlib.sha256(file_content).hexdigest()
+        gcs_path = self.content_addressed_path(content_hash, extension)
+        blob = self.bucket.blob(gcs_path)
+        if blob.exists():
+            return gcs_path, content_hash, True
+
+        blob.cache_control = GCS_IMMUTABLE_CACHE_CONTROL
+        try:
+            # 同じ内容が同時にアップロードされた場合は先に作られた方を使う
+            blob.upload_from_string(file_content, content_type=content_type, if_generation_match=0)
+        except PreconditionFailed:
+            return gcs_path, content_hash, True
+        return gcs_path, content_hash, False
+
+    def _add_object_ref(self, user_id: int, content_hash: str, gcs_path: str, kind: str) -> None:
+        """オブジェクトの参照を追加（失敗した場合は共有オブジェクトが消されないようアップロード自体を失敗にする）"""
+        from app.database.supabase_session import SessionLocal
+        from app.models.images.supabase_object_refs import SupabaseImageObjectRef
+
+        db = SessionLocal()
+        try:
+            db.add(SupabaseImageObjectRef(content_hash=content_hash, object_path=gcs_path, user_id=user_id, kind=kind))
+            db.commit()
+        finally:
+            db.close()
+
+    def release_object(self, gcs_path: str, user_id: int, related_paths: Optional[List[str]] = None) -> bool:
+        """ユーザーの画像を1件削除（コンテンツアドレス方式では参照が0件になった時だけオブジェクトを削除）
+
+        related_paths: 同じ画像に付随するオブジェクト（解析結果のJSONなど）。本体と一緒に削除する
+            （ユーザーのパス以下にあるものは共有オブジェクトの参照が残っていても削除する）
+        """
+        paths = [gcs_path] + [path for path in (related_paths or []) if path]
+        if not self.is_content_addressed_path(gcs_path):
+            return all([self.delete_object(path) for path in paths])
+
+        own_paths = [path for path in paths[1:] if not self.is_content_addressed_path(path)]
+        own_deleted = all([self.delete_object(path) for path in own_paths])
+        paths = [path for path in paths if path not in own_paths]
+
+        from app.database.supabase_session import SessionLocal
+        from app.models.images.supabase_object_refs import SupabaseImageObjectRef
+
+        db = SessionLocal()
+        try:
+            ref = db.query(SupabaseImageObjectRef).filter(
+                SupabaseImageObjectRef.object_path == gcs_path,
+                SupabaseImageObjectRef.user_id == user_id
+            ).first()
+            if ref:
+                db.delete(ref)
+                db.commit()
+            remaining = db.query(SupabaseImageObjectRef).filter(
+                SupabaseImageObjectRef.object_path == gcs_path
+            ).count()
+        finally:
+            db.close()
+
+        if remaining > 0:
+            print(f"共有オブジェクトの参照が残っているため削除しません: {gcs_path} (残り{remaining}件)")
+            return own_deleted
+        return all([self.delete_object(path) for path in paths]) and own_deleted
+
+    def _release_user_objects(self, user_id: int, kind: str) -> None:
+        """ユーザーの参照をまとめて外し、参照が残らないオブジェクトを削除"""
+        from app.database.supabase_session import SessionLocal
+        from app.models.images.supabase_object_refs import SupabaseImageObjectRef
+
+        db = SessionLocal()
+        try:
+            refs = db.query(SupabaseImageObjectRef).filter(
+                SupabaseImageObjectRef.user_id == user_id,
+                SupabaseImageObjectRef.kind == kind
+            )
+            paths = {ref.object_path for ref in refs}
+            refs.delete(synchronize_session=False)
+            db.commit()
+            still_referenced = {
+                row[0] for row in db.query(SupabaseImageObjectRef.object_path).filter(
+                    SupabaseImageObjectRef.object_path.in_(paths)
+                ).distinct()
+            } if paths else set()
+        finally:
+            db.close()
+
+        for gcs_path in paths - still_referenced:
+            self.delete_object(gcs_path)
+
+    def _get_user_object_paths(self, user_id: int, kind: str) -> List[str]:
+        """コンテンツアドレス方式でユーザーが参照しているオブジェクトのパス"""
+        from app.database.supabase_session import SessionLocal
+        from app.models.images.supabase_object_refs import SupabaseImageObjectRef
+
+        db = SessionLocal()
+        try:
+            rows = db.query(SupabaseImageObjectRef.object_path).filter(
+                SupabaseImageObjectRef.user_id == user_id,
+                SupabaseImageObjectRef.kind == kind
+            ).distinct().all()
+            return [row[0] for row in rows]
+        finally:
+            db.close()
+
+    def create_direct_upload(self, user_id: int, filename: str, content_type: str, size_bytes: Optional[int] = None,
+                             mode: str = "signed_put", origin: Optional[str] = None) -> Dict[str, Any]:
+        """クライアントがGCSへ直接アップロードするためのURLを発行
+
+        オブジェクトは users/{user_id}/uploads/incoming/ 以下に限定し、処理は finalize で行う。
+        finalizeされなかったオブジェクトは cleanup_incoming_uploads.py で削除する（INCOMING_UPLOAD_MAX_AGE_HOURS）。
+        - signed_put: V4署名付きPUT URL（Content-Typeとサイズ上限ヘッダーを署名に含める）
+        - resumable: 再開可能アップロードのセッションURL（大きなファイル・不安定な回線向け）
+        エミュレータは署名付きURLに対応しないため、常にresumableを使う。
+        """
+        file_extension = filename.split(".")[-1].lower() if "." in filename else "jpg"
+        unique_filename = self.generate_unique_filename("direct_upload", file_extension)
+        gcs_path = f"{self._get_incoming_prefix(user_id)}{unique_filename}"
+        blob = self.bucket.blob(gcs_path)
+        expires_at = datetime.now() + timedelta(seconds=DIRECT_UPLOAD_URL_EXPIRATION_SECONDS)
+
+        if mode == "resumable" or self.emulator_host:
+            upload_url = blob.create_resumable_upload_session(
+                content_type=content_type,
+                size=size_bytes,
+                origin=origin,
+            )
+            return {
+                "mode": "resumable",
+                "upload_url": upload_url,
+                "method": "PUT",
+                "headers": {"Content-Type": content_type},
+                "object_path": gcs_path,
+                "expires_at": expires_at.isoformat(),
+            }
+
+        # サイズ上限はGCS側で検査させる（クライアントは同じヘッダーを付けて送る）
+        headers = {"Content-Type": content_type, "x-goog-content-length-range": f"0,{MAX_UPLOAD_SIZE}"}
+        upload_url = blob.generate_signed_url(
+            version="v4",
+            expiration=timedelta(seconds=DIRECT_UPLOAD_URL_EXPIRATION_SECONDS),
+            method="PUT",
+            content_type=content_type,
+            headers={"x-goog-content-length-range": headers["x-goog-content-length-range"]},
+        )
+        return {
+            "mode": "signed_put",
+            "upload_url": upload_url,
+            "method": "PUT",
+            "headers": headers,
+            "object_path": gcs_path,
+            "expires_at": expires_at.isoformat(),
+        }
+
+    def _get_incoming_prefix(self, user_id: int) -> str:
+        """直接アップロードされた未処理の画像を置くパス"""
+        return f"users/{user_id}/uploads/incoming/"
+
+    def is_incoming_path(self, gcs_path: str, user_id: int) -> bool:
+        """ユーザー自身の直接アップロード先のパスか（finalizeで他のオブジェクトを処理させない）"""
+        return gcs_path.startswith(self._get_incoming_prefix(user_id)) and ".." not in gcs_path
+
+    def _get_finalizing_prefix(self, user_id: int) -> str:
+        """finalize中の目印を置くパス（incoming/の外に置き、目印自体をfinalizeさせない）"""
+        return f"users/{user_id}/uploads/finalizing/"
+
+    def unlisted_path_patterns(self, user_id: Optional[int] = None) -> List[str]:
+        """画像一覧に出さないパス（finalize前の直接アップロードとfinalizeの目印）のLIKEパターン
+
+        user_idを省略すると全ユーザーのパスに一致する。
+        """
+        user_part = "%" if user_id is None else str(user_id)
+        return [f"users/{user_part}/uploads/incoming/%", f"users/{user_part}/uploads/finalizing/%"]
+
+    def claim_incoming_object(self, gcs_path: str, user_id: int) -> Optional[str]:
+        """直接アップロードされた画像のfinalizeを開始する（同じオブジェクトの二重処理を防ぐ）
+
+        目印のオブジェクトを if_generation_match=0 で作成し、既に処理中なら None を返す。
+        返した目印は処理の成否にかかわらず release_incoming_claim で削除する。
+        """
+        claim_path = f"{self._get_finalizing_prefix(user_id)}{gcs_path[len(self._get_incoming_prefix(user_id)):]}"
+        try:
+            self.bucket.blob(claim_path).upload_from_string(b"", content_type="text/plain", if_generation_match=0)
+        except PreconditionFailed:
+            return None
+        return claim_path
+
+    def release_incoming_claim(self, claim_path: str) -> None:
+        """finalize中の目印を削除（残った目印も cleanup_incoming_uploads.py で削除される）"""
+        try:
+            self.bucket.blob(claim_path).delete()
+        except Exception as e:
+            print(f"⚠️ finalizeの目印の削除に失敗: {claim_path} {e}")
+
+    def get_object_info(self, gcs_path: str) -> Optional[Dict[str, Any]]:
+        """オブジェクトのサイズとContent-Typeを取得（存在しなければNone）"""
+        blob = self.bucket.get_blob(self.resolve_object_path(gcs_path))
+        if blob is None:
+            return None
+        return {"size": blob.size, "content_type": blob.content_type}
+
+    def delete_object(self, gcs_path: str) -> bool:
+        """オブジェクトを1件削除"""
+        try:
+            gcs_path = self.resolve_object_path(gcs_path)
+            signed_url_cache.invalidate(gcs_path)
+            self.bucket.blob(gcs_path).delete()
+            object_manifest_service.remove_many([gcs_path])
+            return True
+        except Exception as e:
+            print(f"オブジェクト削除エラー: {str(e)}")
+            return False
+
+    def download_image(self, gcs_path: str) -> bytes:
+        """GCS上の画像をバイトデータとして取得（公開URLも可）"""
+        blob = self.bucket.blob(self.resolve_object_path(gcs_path))
+        return blob.download_as_bytes()
+
+    def upload_json(self, data: Dict[str, Any], gcs_path: str) -> Dict[str, Any]:
+        """JSONデータをGoogle Cloud Storageに保存（画像解析結果の全体など）"""
+        try:
+            payload = json.dumps(data, ensure_ascii=False).encode("utf-8")
+            blob = self.bucket.blob(gcs_path)
+            blob.upload_from_string(
+                payload,
+                content_type="application/json"
+            )
+            object_manifest_service.record_many([
+                object_manifest_service.build_entry(gcs_path, len(payload), "application/json")
+            ])
+            return {"success": True, "gcs_path": gcs_path}
+        except Exception as e:
+            return {"success": False, "error": str(e), "gcs_path": gcs_path}
+
+    def download_json(self, gcs_path: str) -> Dict[str, Any]:
+        """GCS上のJSONデータを取得"""
+        blob = self.bucket.blob(self.resolve_object_path(gcs_path))
+        return json.loads(blob.download_as_bytes())
+
     def delete_user_images(self, user_id: int, file_type: str = "uploads") -> bool:
         """ユーザーの画像を一括削除"""
         try:
             user_path = f"users/{user_id}/{file_type}"
-            blobs = self.bucket.list_blobs(prefix=user_path)
-            
-            for blob in blobs:
-                blob.delete()
+            signed_url_cache.invalidate_prefix(f"{user_path}/")
+            # 1件ずつではなく同時実行数を制限して並行削除
+            result = self.async_storage.delete_prefix_sync(f"{user_path}/")
+            # 削除できなかったオブジェクトは台帳に残す
+            object_manifest_service.remove_user_objects(
+                user_id, file_type, keep_paths=[failure["gcs_path"] for failure in result["failed"]]
+            )
+            if result["failed"]:
+                print(f"ユーザー画像削除エラー: {len(result['failed'])}件失敗 {result['failed'][:3]}")
+                return False
+
+            # コンテンツアドレス方式の画像は参照を外し、他のユーザーが使っていなければ削除
+            if self.content_addressed:
+                self._release_user_objects(user_id, file_type)
             
             return True
         except Exception as e:
             print(f"ユーザー画像削除エラー: {str(e)}")
             return False
 
-    def get_user_images(self, user_id: int, file_type: str = "uploads") -> List[Dict[str, Any]]:
-        """ユーザーの画像一覧を取得"""
+    def get_user_images(self, user_id: int, file_type: str = "uploads", after_id: Optional[int] = None,
+                        limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """ユーザーの画像一覧を取得
+
+        GCS_MANIFEST_LISTING が有効な場合はバケットを一覧せずオブジェクト台帳から取得し、
+        台帳のid（after_id）とlimitでページングする。無効な場合はバケットを直接一覧する（ページングなし）。
+        どちらも画像だけを返し、解析結果のJSON・finalize前の直接アップロード・finalizeの目印は含めない。
+        """
+        if GCS_MANIFEST_LISTING:
+            return self._get_user_images_from_manifest(user_id, file_type, after_id, limit)
         try:
             user_path = f"users/{user_id}/{file_type}"
-            blobs = self.bucket.list_blobs(prefix=user_path)
+            blobs = list(self.bucket.list_blobs(prefix=user_path))
+            # コンテンツアドレス方式の画像はユーザーのパス以下にないため参照から取得
+            if self.content_addressed:
+                for gcs_path in self._get_user_object_paths(user_id, file_type):
+                    blob = self.bucket.get_blob(gcs_path)
+                    if blob is not None:
+                        blobs.append(blob)
+            
+            excluded_prefixes = [self._get_incoming_prefix(user_id), self._get_finalizing_prefix(user_id)]
+            blobs = [
+                blob for blob in blobs
+                if (blob.content_type or "").startswith("image/")
+                and not any(blob.name.startswith(prefix) for prefix in excluded_prefixes)
+            ]
+
+            # 認証済みURLはキャッシュから取り、ないものだけまとめて署名
+            signed_urls = self.generate_signed_urls([blob.name for blob in blobs])
             
             images = []
             for blob in blobs:
-                # 認証済みURLを生成
-                signed_url = blob.generate_signed_url(
-                    version="v4",
-                    expiration=timedelta(hours=1),
-                    method="GET"
-                )
-                
                 images.append({
                     "name": blob.name,
                     "size": blob.size,
                     "created": blob.time_created.isoformat(),
-                    "public_url": signed_url
+                    "public_url": signed_urls.get(blob.name)
                 })
             
             return images
@@ -184,6 +608,47 @@ class GCSStorageService:
             print(f"ユーザー画像取得エラー: {str(e)}")
             return []
 
+    def _get_user_images_from_manifest(self, user_id: int, file_type: str, after_id: Optional[int],
+                                       limit: Optional[int]) -> List[Dict[str, Any]]:
+        """オブジェクト台帳からユーザーの画像一覧を取得"""
+        try:
+            rows = object_manifest_service.list_objects(
+                file_type, user_id=user_id, after_id=after_id, limit=limit, images_only=True,
+                include_object_refs=self.content_addressed,
+                exclude_path_patterns=self.unlisted_path_patterns(user_id)
+            )
+            signed_urls = self.generate_signed_urls([row["object_path"] for row in rows])
+            return [
+                {
+                    "id": row["id"],
+                    "name": row["object_path"],
+                    "size": row["size_bytes"],
+                    "content_type": row["content_type"],
+                    "width": row["width"],
+                    "height": row["height"],
+                    "created": (row["object_created_at"] or row["created_at"]).isoformat(),
+                    "public_url": signed_urls.get(row["object_path"])
+                }
+                for row in rows
+            ]
+        except Exception as e:
+            print(f"ユーザー画像取得エラー: {str(e)}")
+            return []
+
+    def _sign_url(self, gcs_path: str, method: str, expiration: timedelta) -> str:
+        """V4署名付きURLを生成（キャッシュの署名関数）"""
+        return self.bucket.blob(gcs_path).generate_signed_url(version="v4", expiration=expiration, method=method)
+
+    def generate_signed_url(self, gcs_path: str, method: str = "GET") -> str:
+        """署名付きURLを取得（期限が近くなるまではキャッシュしたURLを返す）"""
+        return signed_url_cache.get(self.resolve_object_path(gcs_path), self._sign_url, method)
+
+    def generate_signed_urls(self, gcs_paths: List[str], method: str = "GET") -> Dict[str, Optional[str]]:
+        """複数オブジェクトの署名付きURLをまとめて取得（キー: 指定したパス、署名に失敗したものはNone）"""
+        resolved = {gcs_path: self.resolve_object_path(gcs_path) for gcs_path in gcs_paths}
+        signed = signed_url_cache.get_many(list(resolved.values()), self._sign_url, method)
+        return {gcs_path: signed.get(object_path) for gcs_path, object_path in resolved.items()}
+
     def get_public_url(self, file_path: str) -> str:
         """ファイルパスからGCSのstorage.googleapis.com形式URLを生成"""
         try:
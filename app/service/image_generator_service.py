@@ -13,11 +13,26 @@ from dotenv import load_dotenv
 from sqlalchemy.orm import Session
 from app.models.story.stroy_plot import StoryPlot
 from app.models.story.story_setting import StorySetting
-from app.core.config import STORAGE_TYPE
+from app.core.config import STORAGE_TYPE, GCS_MANIFEST_LISTING
 from app.service.gcs_storage_service import GCSStorageService
+from app.service.object_manifest_service import object_manifest_service
+from app.service.model_router_service import build_model
+from app.service.usage_tracking_service import usage_tracking_service, extract_usage, set_usage_user
 
 load_dotenv()
 
+# 全画像生成リクエストで共通の静的プレフィックス（アスペクト比と文字なしの指示）
+IMAGE_SYSTEM_INSTRUCTION = (
+    "Image format: 16:9 aspect ratio (landscape orientation), horizontal composition. "
+    "MANDATORY: The image must be exactly 16:9 ratio, wide and landscape, NOT portrait or square. "
+    "The composition should be horizontal with elements spread across the width. "
+    "CRITICAL REQUIREMENTS: Absolutely NO text, NO letters, NO words, NO writing, NO captions, "
+    "NO speech bubbles, NO signs, NO labels, NO symbols, NO numbers, NO typography, "
+    "NO written language of any kind. This must be a pure visual illustration only. "
+    "The image should be completely text-free and contain only visual elements, characters, "
+    "objects, and scenes without any written content whatsoever."
+)
+
 class ImageGeneratorService:
     """Gemini APIを使用して高品質な画像を生成するサービス"""
 
@@ -30,7 +45,9 @@ class ImageGeneratorService:
         # Gemini クライアントを初期化
         genai.configure(api_key=api_key)
         self.client = genai
-        self.model = genai.GenerativeModel('gemini-2.5-flash-image-preview')
+        # 共通指示はsystem_instructionとしてモデル側に持たせる（SDK非対応時はプロンプト先頭に付与）
+        self.model_name = 'gemini-2.5-flash-image-preview'
+        self.model, self.uses_system_instruction = build_model(self.model_name, IMAGE_SYSTEM_INSTRUCTION)
         
         # GCS固定設定
         # ローカルディレクトリは不要
@@ -56,6 +73,24 @@ class ImageGeneratorService:
         return f"{prefix}_{timestamp}_{unique_id}.{extension}"
 
 
+    def _compose_image_prompt(self, prompt: str) -> str:
+        """動的プロンプトに共通指示を付与（system_instruction適用時はそのまま）"""
+        if self.uses_system_instruction:
+            return prompt
+        # 静的プレフィックスを先頭に置き、暗黙のプレフィックスキャッシュが効くようにする
+        return f"{IMAGE_SYSTEM_INSTRUCTION}\n\n{prompt}"
+
+    def _generate_content(self, contents: Any, task: str = "image_generation", retries: int = 0) -> Any:
+        """generate_contentを実行し、使用量・レイテンシ・結果を記録"""
+        start_time = time.time()
+        try:
+            response = self.model.generate_content(contents)
+        except Exception:
+            usage_tracking_service.record(self.model_name, task, {}, time.time() - start_time, retries=retries, outcome="error")
+            raise
+        usage_tracking_service.record(self.model_name, task, extract_usage(response), time.time() - start_time, retries=retries)
+        return response
+
     def save_image_to_storage(self, image_data: bytes, filename: str, user_id: int = 2, story_id: Optional[int] = None, content_type: str = "image/png") -> Dict[str, Any]:
         """画像をGoogle Cloud Storageに保存"""
         return self.gcs_service.upload_generated_image(
@@ -66,15 +101,14 @@ class ImageGeneratorService:
             content_type=content_type
         )
 
-    def generate_single_image(self, prompt: str, prefix: str = "storybook_image") -> Dict[str, Any]:
+    def generate_single_image(self, prompt: str, prefix: str = "storybook_image", user_id: int = 2) -> Dict[str, Any]:
         """単一の画像を生成"""
         try:
-            # プロンプトにアスペクト比を追加
-            enhanced_prompt = f"{prompt}. Image format: 16:9 aspect ratio (landscape orientation), horizontal composition. MANDATORY: The image must be exactly 16:9 ratio, wide and landscape, NOT portrait or square. The composition should be horizontal with elements spread across the width."
-            print(f"画像生成開始: {enhanced_prompt}")
+            # アスペクト比などの共通指示は静的プレフィックスとして付与
+            print(f"画像生成開始: {prompt}")
             
             # 画像生成のリクエストを作成
-            response = self.model.generate_content(enhanced_prompt)
+            response = self._generate_content(self._compose_image_prompt(prompt))
             
             if hasattr(response, 'candidates') and response.candidates:
                 candidate = response.candidates[0]
@@ -94,7 +128,7 @@ class ImageGeneratorService:
                                 save_result = self.save_image_to_storage(
                                     image_data=image_data,
                                     filename=filename,
-                                    user_id=2,  # デフォルトユーザーID
+                                    user_id=user_id,
                                     content_type="image/png"
                                 )
                                 
@@ -142,25 +176,10 @@ class ImageGeneratorService:
             success = False
             for attempt in range(max_retries):
                 try:
-                    # プロンプトに文字なしの指示とアスペクト比を追加
-                    enhanced_prompt = (
-                        f"{prompt}. "
-                        f"Image format: 16:9 aspect ratio (landscape orientation), horizontal composition. "
-                        f"MANDATORY: The image must be exactly 16:9 ratio, wide and landscape, NOT portrait or square. "
-                        f"The composition should be horizontal with elements spread across the width. "
-                        f"CRITICAL REQUIREMENTS: Absolutely NO text, NO letters, NO words, NO writing, NO captions, "
-                        f"NO speech bubbles, NO signs, NO labels, NO symbols, NO numbers, NO typography, "
-                        f"NO written language of any kind. This must be a pure visual illustration only. "
-                        f"The image should be completely text-free and contain only visual elements, characters, "
-                        f"objects, and scenes without any written content whatsoever."
-                    )
+                    print(f"\n📝 プロンプト {i}/{len(prompts)} (試行 {attempt + 1}/{max_retries}): {prompt[:50]}...")
                     
-                    print(f"\n📝 プロンプト {i}/{len(prompts)} (試行 {attempt + 1}/{max_retries}): {enhanced_prompt[:50]}...")
-                    
-                    response = self.client.models.generate_content(
-                        model="gemini-2.5-flash-image-preview",
-                        contents=[enhanced_prompt]
-                    )
+                    # 文字なしの指示とアスペクト比は静的プレフィックスとして付与
+                    response = self._generate_content(self._compose_image_prompt(prompt), retries=attempt)
                     
                     if hasattr(response, 'candidates') and response.candidates:
                         candidate = response.candidates[0]
@@ -189,7 +208,7 @@ class ImageGeneratorService:
                                                 "image_size": Image.open(BytesIO(image_data)).size,
                                                 "format": "png", # Gemini APIはPNGを返すため
                                                 "timestamp": datetime.now().isoformat(),
-                                                "prompt": enhanced_prompt
+                                                "prompt": prompt
                                             }
                                             generated_images.append(image_info)
                                             print(f"✅ 画像 {i} 生成成功: {filename}")
@@ -253,15 +272,7 @@ class ImageGeneratorService:
             prompt = (
                 f"Create a beautiful children's book illustration for: {page_content}. "
                 f"Style: children's book illustration, warm and friendly, bright colors, "
-                f"simple and clean design, suitable for children. "
-                f"Image format: 16:9 aspect ratio (landscape orientation), horizontal composition. "
-                f"MANDATORY: The image must be exactly 16:9 ratio, wide and landscape, NOT portrait or square. "
-                f"The composition should be horizontal with elements spread across the width. "
-                f"CRITICAL REQUIREMENTS: Absolutely NO text, NO letters, NO words, NO writing, NO captions, "
-                f"NO speech bubbles, NO signs, NO labels, NO symbols, NO numbers, NO typography, "
-                f"NO written language of any kind. This must be a pure visual illustration only. "
-                f"The image should be completely text-free and contain only visual elements, characters, "
-                f"objects, and scenes without any written content whatsoever."
+                f"simple and clean design, suitable for children."
             )
             prompts.append(prompt)
         
@@ -269,7 +280,7 @@ class ImageGeneratorService:
         
         for i, prompt in enumerate(prompts, 1):
             try:
-                response = self.model.generate_content(prompt)
+                response = self._generate_content(self._compose_image_prompt(prompt))
                 
                 if hasattr(response, 'candidates') and response.candidates:
                     candidate = response.candidates[0]
@@ -324,6 +335,8 @@ class ImageGeneratorService:
             story_plot = db.query(StoryPlot).filter(StoryPlot.id == story_plot_id).first()
             if not story_plot:
                 raise ValueError(f"StoryPlot ID {story_plot_id} が見つかりません")
+            # 使用量をこのストーリーのユーザーに集計
+            set_usage_user(story_plot.user_id)
             
             # 指定されたページの内容を取得
             page_content = None
@@ -355,22 +368,14 @@ class ImageGeneratorService:
                 f"Character: {protagonist_name} (a {protagonist_type}), "
                 f"Setting: {setting_place}. "
                 f"Style: children's book illustration, warm and friendly, bright colors, "
-                f"simple and clean design, suitable for children, consistent character design. "
-                f"Image format: 16:9 aspect ratio (landscape orientation), horizontal composition. "
-                f"MANDATORY: The image must be exactly 16:9 ratio, wide and landscape, NOT portrait or square. "
-                f"The composition should be horizontal with elements spread across the width. "
-                f"CRITICAL REQUIREMENTS: Absolutely NO text, NO letters, NO words, NO writing, NO captions, "
-                f"NO speech bubbles, NO signs, NO labels, NO symbols, NO numbers, NO typography, "
-                f"NO written language of any kind. This must be a pure visual illustration only. "
-                f"The image should be completely text-free and contain only visual elements, characters, "
-                f"objects, and scenes without any written content whatsoever."
+                f"simple and clean design, suitable for children, consistent character design."
             )
             
             print(f"🎨 StoryPlot画像生成開始 (ID: {story_plot_id}, ページ: {page_number})")
             print(f"📝 プロンプト: {enhanced_prompt[:100]}...")
             
             # 画像生成を実行
-            response = self.model.generate_content(enhanced_prompt)
+            response = self._generate_content(self._compose_image_prompt(enhanced_prompt))
             
             if hasattr(response, 'candidates') and response.candidates:
                 candidate = response.candidates[0]
@@ -550,21 +555,8 @@ class ImageGeneratorService:
         """Image-to-Image生成"""
         try:
             
-            # プロンプトに文字なしの指示とアスペクト比を追加（強化版）
-            enhanced_prompt = (
-                f"{prompt}. "
-                f"Image format: 16:9 aspect ratio (landscape orientation), horizontal composition. "
-                f"MANDATORY: The image must be exactly 16:9 ratio, wide and landscape, NOT portrait or square. "
-                f"The composition should be horizontal with elements spread across the width. "
-                f"CRITICAL REQUIREMENTS: Absolutely NO text, NO letters, NO words, NO writing, NO captions, "
-                f"NO speech bubbles, NO signs, NO labels, NO symbols, NO numbers, NO typography, "
-                f"NO written language of any kind. This must be a pure visual illustration only. "
-                f"The image should be completely text-free and contain only visual elements, characters, "
-                f"objects, and scenes without any written content whatsoever."
-            )
-            
             print(f"🎨 Image-to-Image生成開始")
-            print(f"📝 プロンプト: {enhanced_prompt[:50]}...")
+            print(f"📝 プロンプト: {prompt[:50]}...")
             print(f"🖼️ 参考画像: {reference_image_path}")
             print(f"💪 強度: {strength}")
             
@@ -595,18 +587,18 @@ class ImageGeneratorService:
             # Gemini APIでImage-to-Image生成
             # 参考画像をBase64エンコードしてAPIに送信
             # Image-to-Image生成のためのプロンプトを作成
-            i2i_prompt = f"Based on this reference image, create a new illustration with the following description: {enhanced_prompt}. " \
+            i2i_prompt = f"Based on this reference image, create a new illustration with the following description: {prompt}. " \
                         f"Maintain the style and composition similar to the reference image with {strength*100}% similarity. " \
                         f"Reference image characteristics should be preserved while adapting to the new scene."
             
             
-            response = self.model.generate_content([
-                i2i_prompt,
+            response = self._generate_content([
+                self._compose_image_prompt(i2i_prompt),
                 {
                     "mime_type": mime_type,
                     "data": reference_image_base64
                 }
-            ])
+            ], task="image_to_image")
             
             # 詳細なレスポンスログ
             print(f"🔍 Gemini API レスポンス詳細:")
@@ -671,7 +663,7 @@ class ImageGeneratorService:
                                         "image_size": Image.open(BytesIO(image_data)).size,
                                         "format": "png", # Gemini APIはPNGを返すため
                                         "timestamp": datetime.now().isoformat(),
-                                        "prompt": enhanced_prompt,
+                                        "prompt": prompt,
                                         "reference_image_path": reference_image_path,
                                         "strength": strength
                                     }
@@ -705,6 +697,8 @@ class ImageGeneratorService:
             story_plot = db.query(StoryPlot).filter(StoryPlot.id == story_plot_id).first()
             if not story_plot:
                 raise ValueError(f"StoryPlot ID {story_plot_id} が見つかりません")
+            # 使用量をこのストーリーのユーザーに集計
+            set_usage_user(story_plot.user_id)
             
             # 指定されたページの内容を取得
             page_content = self._get_page_content(story_plot, page_number)
@@ -776,7 +770,7 @@ class ImageGeneratorService:
         story_plot: StoryPlot,
         reference_image_path: str = None
     ) -> str:
-        """StoryPlotデータを活用したプロンプトを作成（アップロード画像の特徴を反映）"""
+        """StoryPlotデータを活用した動的プロンプトを作成（文字なしの指示はIMAGE_SYSTEM_INSTRUCTION）"""
         
         # テーマ情報を取得
         theme_info = ""
@@ -809,12 +803,7 @@ class ImageGeneratorService:
             f"{keywords_info}"
             f"{reference_style_info}"
             f"Style: children's book illustration, warm and friendly, bright colors, "
-            f"simple and clean design, suitable for children, consistent character design. "
-            f"CRITICAL REQUIREMENTS: Absolutely NO text, NO letters, NO words, NO writing, NO captions, "
-            f"NO speech bubbles, NO signs, NO labels, NO symbols, NO numbers, NO typography, "
-            f"NO written language of any kind. This must be a pure visual illustration only. "
-            f"The image should be completely text-free and contain only visual elements, characters, "
-            f"objects, and scenes without any written content whatsoever."
+            f"simple and clean design, suitable for children, consistent character design."
         )
         
         return enhanced_prompt
@@ -918,8 +907,15 @@ class ImageGeneratorService:
             print(f"❌ 参考画像アップロードエラー: {e}")
             raise e
 
-    def get_uploaded_images_list(self) -> List[Dict[str, Any]]:
-        """GCSからアップロードされた画像のリストを取得"""
+    def get_uploaded_images_list(self, after_id: Optional[int] = None, limit: Optional[int] = None,
+                                 user_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """GCSからアップロードされた画像のリストを取得
+
+        GCS_MANIFEST_LISTING が有効な場合はバケットを一覧せず、オブジェクト台帳から
+        id順に after_id より後を limit 件取得する。
+        """
+        if GCS_MANIFEST_LISTING:
+            return self._get_uploaded_images_from_manifest(after_id, limit, user_id)
         try:
             uploaded_images = []
             
@@ -950,5 +946,32 @@ class ImageGeneratorService:
             print(f"❌ アップロード画像一覧取得エラー: {e}")
             raise e
 
+    def _get_uploaded_images_from_manifest(self, after_id: Optional[int], limit: Optional[int],
+                                           user_id: Optional[int]) -> List[Dict[str, Any]]:
+        """オブジェクト台帳からアップロード画像のリストを取得"""
+        try:
+            rows = object_manifest_service.list_objects(
+                "uploads", user_id=user_id, after_id=after_id, limit=limit, images_only=True,
+                exclude_path_patterns=self.gcs_service.unlisted_path_patterns(user_id)
+            )
+            uploaded_images = [
+                {
+                    "id": row["id"],
+                    "filename": os.path.basename(row["object_path"]),
+                    "filepath": row["object_path"],
+                    "size_bytes": row["size_bytes"],
+                    "image_size": (row["width"] or 0, row["height"] or 0),
+                    "format": row["content_type"].split("/")[-1],
+                    "timestamp": (row["object_created_at"] or row["created_at"]).isoformat(),
+                    "public_url": self.gcs_service.get_public_url(row["object_path"])
+                }
+                for row in rows
+            ]
+            print(f"📁 アップロード画像一覧（台帳）: {len(uploaded_images)}枚")
+            return uploaded_images
+        except Exception as e:
+            print(f"❌ アップロード画像一覧取得エラー: {e}")
+            raise e
+
 # シングルトンインスタンス
 image_generator_service = ImageGeneratorService()
@@ -0,0 +1,401 @@
+import time
+import inspect
+import threading
+from collections import deque
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Dict, Any, Optional, List, Tuple
+import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+from app.core.config import (
+    GEMINI_MODEL_LIGHT,
+    GEMINI_MODEL_STANDARD,
+    GEMINI_MODEL_NON_THINKING,
+    GEMINI_LATENCY_BUDGET_SCALE,
+    GEMINI_ROUTER_MAX_WORKERS,
+    GEMINI_THINKING_TOKEN_HEADROOM,
+    GEMINI_THINKING_MODEL_MARKERS,
+    GEMINI_CONTEXT_CACHE_ENABLED,
+    GEMINI_CONTEXT_CACHE_TTL_SECONDS,
+    GEMINI_CONTEXT_CACHE_RETRY_SECONDS,
+    GEMINI_CONTEXT_CACHE_RETRY_MAX_SECONDS,
+)
+from app.service.usage_tracking_service import usage_tracking_service, extract_usage
+
+# ティアごとのモデル名
+MODEL_TIERS: Dict[str, str] = {
+    "light": GEMINI_MODEL_LIGHT,
+    "standard": GEMINI_MODEL_STANDARD,
+    "non_thinking": GEMINI_MODEL_NON_THINKING,
+}
+
+# タスクごとのルーティング設定
+# - tier: 最初に使うティア
+# - fallback_tier: レイテンシ予算超過・エラー時に切り替えるティア
+# - latency_budget: 秒（この時間を超えたらフォールバック）
+# - generation_config: タスクごとの出力トークン上限など
+#   （max_output_tokens は回答の長さ。思考モデルでは GEMINI_THINKING_TOKEN_HEADROOM を足して呼び出す）
+TASK_ROUTES: Dict[str, Dict[str, Any]] = {
+    # テーマ案（短いJSON）→ 軽量モデルで十分
+    "theme_options": {
+        "tier": "light",
+        "fallback_tier": "standard",
+        "latency_budget": 10.0,
+        "generation_config": {"max_output_tokens": 2048, "temperature": 0.9},
+    },
+    # 複数設定分のテーマ案をまとめて生成（オフラインの一括生成用）
+    "theme_options_batch": {
+        "tier": "light",
+        "fallback_tier": "standard",
+        "latency_budget": 45.0,
+        "generation_config": {"max_output_tokens": 16384, "temperature": 0.9},
+    },
+    # 物語本文（5ページ）→ 標準モデル
+    "story": {
+        "tier": "standard",
+        "fallback_tier": "light",
+        "latency_budget": 30.0,
+        "generation_config": {"max_output_tokens": 8192, "temperature": 0.8},
+    },
+    # テーマ案＋物語本文（非推奨の一括生成）
+    "complete_story": {
+        "tier": "standard",
+        "fallback_tier": "light",
+        "latency_budget": 60.0,
+        "generation_config": {"max_output_tokens": 16384, "temperature": 0.8},
+    },
+    # 性別判定などの分類タスク → 軽量モデル・短い出力
+    # 出力上限が小さいため、思考トークンで上限を使い切る思考モデル（standard）にはフォールバックしない
+    "classification": {
+        "tier": "light",
+        "fallback_tier": "non_thinking",
+        "latency_budget": 8.0,
+        "generation_config": {"max_output_tokens": 64, "temperature": 0.0},
+    },
+}
+
+
+def supports_system_instruction() -> bool:
+    """インストール済みSDKがsystem_instructionに対応しているか"""
+    try:
+        return "system_instruction" in inspect.signature(genai.GenerativeModel.__init__).parameters
+    except (TypeError, ValueError):
+        return False
+
+
+def supports_request_timeout() -> bool:
+    """インストール済みSDKのgenerate_contentが呼び出し単位のタイムアウト（request_options）に対応しているか"""
+    try:
+        return "request_options" in inspect.signature(genai.GenerativeModel.generate_content).parameters
+    except (TypeError, ValueError):
+        return False
+
+
+def is_thinking_model(model_name: str) -> bool:
+    """思考トークンが max_output_tokens に含まれるモデルか"""
+    return any(marker in model_name for marker in GEMINI_THINKING_MODEL_MARKERS)
+
+
+def generation_config_for(model_name: str, generation_config: Dict[str, Any]) -> Dict[str, Any]:
+    """モデルに合わせたgeneration_config（思考モデルは出力上限に思考トークン分の余裕を足す）"""
+    if not is_thinking_model(model_name) or "max_output_tokens" not in generation_config:
+        return generation_config
+    return {**generation_config, "max_output_tokens": generation_config["max_output_tokens"] + GEMINI_THINKING_TOKEN_HEADROOM}
+
+
+def build_model(model_name: str, system_instruction: Optional[str] = None) -> Tuple[genai.GenerativeModel, bool]:
+    """静的プレフィックスをsystem_instructionとして持つモデルを作成
+
+    Returns:
+        (モデル, system_instructionを適用できたか)
+    """
+    if system_instruction and supports_system_instruction():
+        return genai.GenerativeModel(model_name, system_instruction=system_instruction), True
+    return genai.GenerativeModel(model_name), False
+
+
+class ModelLatencyBudgetExceeded(Exception):
+    """レイテンシ予算を超過した場合の例外"""
+    pass
+
+
+class ModelRouterService:
+    """タスクごとにGeminiモデルのティアとgeneration_configを振り分けるサービス"""
+
+    def __init__(self):
+        # (ティア, 静的プレフィックス) ごとのモデルインスタンス（遅延生成）
+        self._models: Dict[Tuple[str, Optional[str]], Tuple[genai.GenerativeModel, bool]] = {}
+        # コンテキストキャッシュ（期限付き）
+        self._cached_contents: Dict[Tuple[str, str], Tuple[genai.GenerativeModel, float]] = {}
+        self._context_cache_unsupported = not GEMINI_CONTEXT_CACHE_ENABLED or not hasattr(genai, "caching")
+        # 作成できないプレフィックス（最小トークン数未満など）、作成中のキー、一時エラー後の再試行時刻と失敗回数
+        self._cache_rejected: set = set()
+        self._cache_creating: set = set()
+        self._cache_retry: Dict[Tuple[str, str], Tuple[float, int]] = {}
+        self._models_lock = threading.Lock()
+        # 予算超過時に呼び出しを打ち切るためのスレッドプール
+        self.executor = ThreadPoolExecutor(max_workers=GEMINI_ROUTER_MAX_WORKERS)
+        # 予算をSDKの呼び出しタイムアウトとして渡せるか（渡せない場合、予算超過した呼び出しは裏で完了まで続く）
+        self._request_timeout_supported = supports_request_timeout()
+        # ティア別メトリクス
+        self._metrics_lock = threading.Lock()
+        self._metrics: Dict[str, Dict[str, Any]] = {}
+        # 呼び出しごとのトークン使用量（直近分のみ保持）
+        self._recent_calls: deque = deque(maxlen=200)
+
+    def _get_model(self, tier: str, system_instruction: Optional[str] = None) -> Tuple[genai.GenerativeModel, bool]:
+        """ティアと静的プレフィックスに対応するモデルを取得（なければ作成）
+
+        Returns:
+            (モデル, 静的プレフィックスをモデル側に持たせられたか)
+        """
+        if system_instruction:
+            cached_model = self._get_cached_content_model(tier, system_instruction)
+            if cached_model is not None:
+                return cached_model, True
+
+        with self._models_lock:
+            key = (tier, system_instruction)
+            entry = self._models.get(key)
+            if entry is None:
+                entry = build_model(MODEL_TIERS[tier], system_instruction)
+                self._models[key] = entry
+            return entry
+
+    def _get_cached_content_model(self, tier: str, system_instruction: str) -> Optional[genai.GenerativeModel]:
+        """静的プレフィックスをコンテキストキャッシュに載せたモデルを取得（非対応・失敗時はNone）
+
+        作成（ネットワーク呼び出し）はロックの外で行い、作成中は他の呼び出しはsystem_instructionで進める。
+        """
+        if self._context_cache_unsupported:
+            return None
+
+        key = (tier, system_instruction)
+        now = time.time()
+        with self._models_lock:
+            entry = self._cached_contents.get(key)
+            if entry and entry[1] > now:
+                return entry[0]
+            retry_at, _ = self._cache_retry.get(key, (0.0, 0))
+            if key in self._cache_rejected or key in self._cache_creating or retry_at > now:
+                return None
+            self._cache_creating.add(key)
+
+        try:
+            cached = genai.caching.CachedContent.create(
+                model=MODEL_TIERS[tier],
+                system_instruction=system_instruction,
+                ttl=timedelta(seconds=GEMINI_CONTEXT_CACHE_TTL_SECONDS),
+            )
+            model = genai.GenerativeModel.from_cached_content(cached_content=cached)
+            with self._models_lock:
+                # 期限切れ直前の利用を避けるため少し早めに作り直す
+                self._cached_contents[key] = (model, time.time() + GEMINI_CONTEXT_CACHE_TTL_SECONDS * 0.9)
+                self._cache_retry.pop(key, None)
+            print(f"✅ コンテキストキャッシュ作成: {MODEL_TIERS[tier]}")
+            return model
+        except (AttributeError, NotImplementedError, google_exceptions.MethodNotImplemented) as e:
+            # SDK・APIがキャッシュに対応していない場合はプロセス全体で使わない
+            print(f"⚠️ コンテキストキャッシュ非対応のためsystem_instructionを使用: {e}")
+            self._context_cache_unsupported = True
+            return None
+        except google_exceptions.InvalidArgument as e:
+            # 最小トークン数に満たない等、このプレフィックスでは作成できない
+            print(f"⚠️ このプレフィックスはコンテキストキャッシュに載せられないためsystem_instructionを使用: {e}")
+            with self._models_lock:
+                self._cache_rejected.add(key)
+            return None
+        except Exception as e:
+            # 一時的なエラーは失敗ごとに間隔を倍にして再試行
+            with self._models_lock:
+                _, failures = self._cache_retry.get(key, (0.0, 0))
+                delay = min(GEMINI_CONTEXT_CACHE_RETRY_SECONDS * (2 ** failures), GEMINI_CONTEXT_CACHE_RETRY_MAX_SECONDS)
+                self._cache_retry[key] = (time.time() + delay, failures + 1)
+            print(f"⚠️ コンテキストキャッシュ作成失敗のため{delay}秒間system_instructionを使用: {e}")
+            return None
+        finally:
+            with self._models_lock:
+                self._cache_creating.discard(key)
+
+    def generate(self, task: str, contents: Any, system_instruction: Optional[str] = None) -> Any:
+        """タスクに応じたティアでgenerate_contentを実行（予算超過時はフォールバック）
+
+        Args:
+            task: TASK_ROUTESのキー
+            contents: 呼び出しごとに変わる動的な部分
+            system_instruction: 全呼び出しで共通の静的プレフィックス
+        """
+        route = TASK_ROUTES.get(task, TASK_ROUTES["story"])
+        tiers = [route["tier"]]
+        if route.get("fallback_tier") and route["fallback_tier"] != route["tier"]:
+            tiers.append(route["fallback_tier"])
+
+        budget = route["latency_budget"] * GEMINI_LATENCY_BUDGET_SCALE
+        last_error: Optional[Exception] = None
+
+        for index, tier in enumerate(tiers):
+            is_last = index == len(tiers) - 1
+            try:
+                # 最後のティアは予算なしで完了まで待つ
+                return self._call_tier(
+                    task, tier, contents, system_instruction,
+                    route["generation_config"], None if is_last else budget, attempt=index
+                )
+            except Exception as e:
+                last_error = e
+                if not is_last:
+                    print(f"⚠️ {task}: {tier}ティア失敗のため{tiers[index + 1]}ティアにフォールバック ({e})")
+                    self._record(tier, fallback=True)
+
+        raise last_error
+
+    def _call_tier(self, task: str, tier: str, contents: Any, system_instruction: Optional[str],
+                   generation_config: Dict[str, Any], budget: Optional[float], attempt: int = 0) -> Any:
+        """1ティア分の呼び出し（レイテンシとトークンを記録）"""
+        model, has_prefix = self._get_model(tier, system_instruction)
+        if system_instruction and not has_prefix:
+            # SDKがsystem_instruction非対応の場合は静的プレフィックスを先頭に付ける（暗黙のプレフィックスキャッシュ対象）
+            contents = [system_instruction] + (contents if isinstance(contents, list) else [contents])
+
+        generation_config = generation_config_for(MODEL_TIERS[tier], generation_config)
+        start_time = time.time()
+        request_options = {"timeout": budget} if budget and self._request_timeout_supported else None
+        future = self.executor.submit(
+            self._generate_streaming, model, contents, generation_config, start_time, request_options
+        )
+
+        try:
+            response, ttft = future.result(timeout=budget)
+        except FutureTimeoutError:
+            # 実行中のスレッドは cancel() では止まらない。SDKにタイムアウトを渡せた場合は呼び出し自体も
+            # 打ち切られるが、渡せない場合は完了までスレッドを使い続け課金もされる（abandonedとして記録）
+            latency = time.time() - start_time
+            self._record(tier, latency=latency, timeout=True, abandoned=not self._request_timeout_supported)
+            usage_tracking_service.record(MODEL_TIERS[tier], task, {}, latency, retries=attempt, outcome="timeout")
+            raise ModelLatencyBudgetExceeded(f"{MODEL_TIERS[tier]} がレイテンシ予算 {budget:.1f}秒 を超過しました")
+        except Exception:
+            latency = time.time() - start_time
+            self._record(tier, latency=latency, error=True)
+            usage_tracking_service.record(MODEL_TIERS[tier], task, {}, latency, retries=attempt, outcome="error")
+            raise
+
+        latency = time.time() - start_time
+        usage = extract_usage(response)
+        prompt_tokens = usage["prompt_tokens"]
+        cached_tokens = usage["cached_tokens"]
+        output_tokens = usage["output_tokens"]
+        thinking_tokens = usage["thinking_tokens"]
+        usage_tracking_service.record(MODEL_TIERS[tier], task, usage, latency, retries=attempt)
+        self._record(
+            tier,
+            latency=latency,
+            ttft=ttft,
+            prompt_tokens=prompt_tokens,
+            cached_tokens=cached_tokens,
+            output_tokens=output_tokens,
+            thinking_tokens=thinking_tokens,
+        )
+        with self._metrics_lock:
+            self._recent_calls.append({
+                "task": task,
+                "model": MODEL_TIERS[tier],
+                "prompt_tokens": prompt_tokens,
+                "cached_tokens": cached_tokens,
+                "output_tokens": output_tokens,
+                "thinking_tokens": thinking_tokens,
+                "ttft_ms": round(ttft * 1000, 0) if ttft is not None else None,
+                "latency_ms": round(latency * 1000, 0),
+                "static_prefix": "model" if has_prefix else ("inline" if system_instruction else "none"),
+            })
+        print(f"⏱️ {task} ({MODEL_TIERS[tier]}) 応答時間: {latency:.3f}秒 / 入力トークン: {prompt_tokens} (キャッシュ: {cached_tokens})")
+        return response
+
+    @staticmethod
+    def _generate_streaming(model: genai.GenerativeModel, contents: Any, generation_config: Dict[str, Any],
+                            start_time: float, request_options: Optional[Dict[str, Any]] = None) -> Tuple[Any, Optional[float]]:
+        """ストリーミングで呼び出し、最初のチャンクまでの時間（TTFT）を計測"""
+        kwargs = {"request_options": request_options} if request_options else {}
+        response = model.generate_content(contents, generation_config=generation_config, stream=True, **kwargs)
+        ttft = None
+        for _ in response:
+            if ttft is None:
+                ttft = time.time() - start_time
+        return response, ttft
+
+    def _record(self, tier: str, latency: Optional[float] = None, ttft: Optional[float] = None,
+                prompt_tokens: int = 0, cached_tokens: int = 0, output_tokens: int = 0,
+                thinking_tokens: int = 0, error: bool = False, timeout: bool = False, fallback: bool = False, abandoned: bool = False) -> None:
+        """ティア別メトリクスを更新"""
+        with self._metrics_lock:
+            m = self._metrics.setdefault(tier, {
+                "model": MODEL_TIERS[tier],
+                "calls": 0,
+                "errors": 0,
+                "timeouts": 0,
+                "abandoned": 0,
+                "fallbacks": 0,
+                "prompt_tokens": 0,
+                "cached_tokens": 0,
+                "output_tokens": 0,
+                "thinking_tokens": 0,
+                "total_latency": 0.0,
+                "total_ttft": 0.0,
+                "ttft_samples": 0,
+                "max_latency": 0.0,
+                "recent_latencies": deque(maxlen=200),
+            })
+            if fallback:
+                m["fallbacks"] += 1
+                return
+            m["calls"] += 1
+            if error:
+                m["errors"] += 1
+            if timeout:
+                m["timeouts"] += 1
+            if abandoned:
+                m["abandoned"] += 1
+            m["prompt_tokens"] += prompt_tokens
+            m["cached_tokens"] += cached_tokens
+            m["output_tokens"] += output_tokens
+            m["thinking_tokens"] += thinking_tokens
+            if ttft is not None:
+                m["total_ttft"] += ttft
+                m["ttft_samples"] += 1
+            if latency is not None:
+                m["total_latency"] += latency
+                m["max_latency"] = max(m["max_latency"], latency)
+                m["recent_latencies"].append(latency)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """ティア別メトリクスのスナップショットを返す"""
+        with self._metrics_lock:
+            snapshot = {}
+            for tier, m in self._metrics.items():
+                recent: List[float] = sorted(m["recent_latencies"])
+                snapshot[tier] = {
+                    "model": m["model"],
+                    "calls": m["calls"],
+                    "errors": m["errors"],
+                    "timeouts": m["timeouts"],
+                    "abandoned": m["abandoned"],
+                    "fallbacks": m["fallbacks"],
+                    "prompt_tokens": m["prompt_tokens"],
+                    "cached_tokens": m["cached_tokens"],
+                    "output_tokens": m["output_tokens"],
+                    "thinking_tokens": m["thinking_tokens"],
+                    "avg_prompt_tokens": round(m["prompt_tokens"] / m["calls"], 1) if m["calls"] else 0,
+                    "avg_ttft_ms": round(m["total_ttft"] / m["ttft_samples"] * 1000, 0) if m["ttft_samples"] else 0,
+                    "avg_latency_ms": round(m["total_latency"] / m["calls"] * 1000, 0) if m["calls"] else 0,
+                    "p50_latency_ms": round(recent[len(recent) // 2] * 1000, 0) if recent else 0,
+                    "p95_latency_ms": round(recent[min(len(recent) - 1, int(len(recent) * 0.95))] * 1000, 0) if recent else 0,
+                    "max_latency_ms": round(m["max_latency"] * 1000, 0),
+                }
+            return {
+                "tiers": snapshot,
+                "routes": TASK_ROUTES,
+                "request_timeout_supported": self._request_timeout_supported,
+                "recent_calls": list(self._recent_calls),
+            }
+
+# シングルトンインスタンス
+model_router_service = ModelRouterService()
@@ -0,0 +1,197 @@
+import re
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional, List, Tuple
+from app.utils.upload_utils import sniff_image_format, sniff_image_size, HEADER_SNIFF_LIMIT
+
+# users/{id}/{種類}/... のオブジェクト（種類は uploads / generated など）
+USER_OBJECT_PATTERN = re.compile(r"^users/(\d+)/([^/]+)/")
+
+
+class ObjectManifestService:
+    """GCSオブジェクト台帳（gcs_object_manifest）の読み書き
+
+    書き込みはアップロード・削除の後に行い、失敗しても本体の処理は止めない
+    （ずれは reconcile_gcs_manifest.py で直す）。
+    一覧は id のキーセット（after_id より大きい id を limit 件）でページングする。
+    """
+
+    @staticmethod
+    def classify_path(gcs_path: str) -> Tuple[Optional[int], Optional[str]]:
+        """パスからユーザーIDと種類を判定（共有オブジェクトは (None, "cas")）"""
+        match = USER_OBJECT_PATTERN.match(gcs_path)
+        if match:
+            return int(match.group(1)), match.group(2)
+        if gcs_path.startswith("cas/"):
+            return None, "cas"
+        return None, None
+
+    @staticmethod
+    def image_dimensions(content: bytes) -> Tuple[Optional[int], Optional[int]]:
+        """ヘッダーから画像の幅・高さを読む（画像でなければ (None, None)）"""
+        head = content[:HEADER_SNIFF_LIMIT]
+        image_format = sniff_image_format(head)
+        size = sniff_image_size(head, image_format) if image_format else None
+        return size if size else (None, None)
+
+    def build_entry(self, gcs_path: str, size_bytes: int, content_type: Optional[str],
+                    width: Optional[int] = None, height: Optional[int] = None, content_hash: Optional[str] = None,
+                    object_created_at: Optional[datetime] = None) -> Dict[str, Any]:
+        user_id, kind = self.classify_path(gcs_path)
+        return {
+            "object_path": gcs_path,
+            "user_id": user_id,
+            "kind": kind,
+            "size_bytes": size_bytes,
+            "content_type": content_type,
+            "width": width,
+            "height": height,
+            "content_hash": content_hash,
+            "object_created_at": object_created_at or datetime.now(timezone.utc),
+        }
+
+    def record_content(self, gcs_path: str, content: bytes, content_type: Optional[str],
+                       content_hash: Optional[str] = None) -> None:
+        """アップロードしたバイト列から台帳に記録（幅・高さはヘッダーから取得）"""
+        width, height = self.image_dimensions(content)
+        self.record_many([self.build_entry(gcs_path, len(content), content_type, width, height, content_hash)])
+
+    def record_many(self, entries: List[Dict[str, Any]]) -> None:
+        """台帳に追加（同じパスがあれば上書き）"""
+        if not entries:
+            return
+        try:
+            from app.database.supabase_session import SessionLocal
+
+            db = SessionLocal()
+            try:
+                self.upsert(db, entries)
+                db.commit()
+            finally:
+                db.close()
+        except Exception as e:
+            print(f"⚠️ オブジェクト台帳の記録エラー: {e}")
+
+    @staticmethod
+    def upsert(db, entries: List[Dict[str, Any]]) -> Dict[str, int]:
+        """既存の行は更新、ない行は追加（コミットは呼び出し側）"""
+        from app.models.images.supabase_object_manifest import SupabaseGCSObjectManifest
+
+        entries_by_path = {entry["object_path"]: entry for entry in entries}
+        existing = db.query(SupabaseGCSObjectManifest).filter(
+            SupabaseGCSObjectManifest.object_path.in_(list(entries_by_path))
+        ).all()
+        for row in existing:
+            entry = entries_by_path.pop(row.object_path)
+            # 後から分からない値（幅・高さ・ハッシュ）は既存の値を残す
+            row.update_from_dict({key: value for key, value in entry.items() if value is not None})
+        db.add_all([SupabaseGCSObjectManifest(**entry) for entry in entries_by_path.values()])
+        return {"updated": len(existing), "inserted": len(entries_by_path)}
+
+    def remove_many(self, gcs_paths: List[str]) -> None:
+        """削除したオブジェクトを台帳から外す"""
+        if not gcs_paths:
+            return
+        try:
+            from app.database.supabase_session import SessionLocal
+            from app.models.images.supabase_object_manifest import SupabaseGCSObjectManifest
+
+            db = SessionLocal()
+            try:
+                db.query(SupabaseGCSObjectManifest).filter(
+                    SupabaseGCSObjectManifest.object_path.in_(gcs_paths)
+                ).delete(synchronize_session=False)
+                db.commit()
+            finally:
+                db.close()
+        except Exception as e:
+            print(f"⚠️ オブジェクト台帳の削除エラー: {e}")
+
+    def remove_user_objects(self, user_id: int, kind: str, keep_paths: Optional[List[str]] = None) -> None:
+        """ユーザーのパス以下を一括削除した後に台帳から外す（共有オブジェクトとkeep_pathsは対象外）"""
+        try:
+            from app.database.supabase_session import SessionLocal
+            from app.models.images.supabase_object_manifest import SupabaseGCSObjectManifest
+
+            db = SessionLocal()
+            try:
+                query = db.query(SupabaseGCSObjectManifest).filter(
+                    SupabaseGCSObjectManifest.user_id == user_id,
+                    SupabaseGCSObjectManifest.kind == kind
+                )
+                if keep_paths:
+                    query = query.filter(SupabaseGCSObjectManifest.object_path.notin_(keep_paths))
+                query.delete(synchronize_session=False)
+                db.commit()
+            finally:
+                db.close()
+        except Exception as e:
+            print(f"⚠️ オブジェクト台帳の削除エラー: {e}")
+
+    def copy_entry(self, source_path: str, destination_path: str) -> None:
+        """オブジェクトをコピーした時に、幅・高さなどを引き継いで新しいパスを記録"""
+        try:
+            from app.database.supabase_session import SessionLocal
+            from app.models.images.supabase_object_manifest import SupabaseGCSObjectManifest
+
+            db = SessionLocal()
+            try:
+                source = db.query(SupabaseGCSObjectManifest).filter(
+                    SupabaseGCSObjectManifest.object_path == source_path
+                ).first()
+                if source is None:
+                    return
+                self.upsert(db, [self.build_entry(
+                    destination_path, source.size_bytes, source.content_type, source.width, source.height,
+                    source.content_hash, source.object_created_at
+                )])
+                db.commit()
+            finally:
+                db.close()
+        except Exception as e:
+            print(f"⚠️ オブジェクト台帳の記録エラー: {e}")
+
+    def list_objects(self, kind: str, user_id: Optional[int] = None, after_id: Optional[int] = None,
+                     limit: Optional[int] = None, images_only: bool = False,
+                     include_object_refs: bool = False,
+                     exclude_path_patterns: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """台帳からオブジェクト一覧を取得（id順、after_idより後をlimit件）
+
+        include_object_refs: コンテンツアドレス方式でユーザーが参照している共有オブジェクトも含める
+        exclude_path_patterns: 除外するパスのLIKEパターン（limit件の数え方が変わらないようクエリで除外する）
+        """
+        from app.database.supabase_session import SessionLocal
+        from app.models.images.supabase_object_manifest import SupabaseGCSObjectManifest as Manifest
+        from app.models.images.supabase_object_refs import SupabaseImageObjectRef
+        from sqlalchemy import and_, or_, select
+
+        db = SessionLocal()
+        try:
+            query = db.query(Manifest)
+            if user_id is None:
+                query = query.filter(Manifest.kind == kind)
+            elif include_object_refs:
+                referenced = select(SupabaseImageObjectRef.object_path).where(
+                    SupabaseImageObjectRef.user_id == user_id,
+                    SupabaseImageObjectRef.kind == kind
+                )
+                query = query.filter(or_(
+                    and_(Manifest.user_id == user_id, Manifest.kind == kind),
+                    Manifest.object_path.in_(referenced)
+                ))
+            else:
+                query = query.filter(Manifest.user_id == user_id, Manifest.kind == kind)
+            if images_only:
+                query = query.filter(Manifest.content_type.like("image/%"))
+            for pattern in exclude_path_patterns or []:
+                query = query.filter(~Manifest.object_path.like(pattern))
+            if after_id:
+                query = query.filter(Manifest.id > after_id)
+            query = query.order_by(Manifest.id)
+            if limit:
+                query = query.limit(limit)
+            return [row.to_dict() for row in query.all()]
+        finally:
+            db.close()
+
+# シングルトンインスタンス
+object_manifest_service = ObjectManifestService()
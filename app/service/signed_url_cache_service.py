@@ -0,0 +1,158 @@
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Dict, Any, Optional, List, Callable, Tuple
+from app.core.config import (
+    SIGNED_URL_CACHE_ENABLED, SIGNED_URL_TTL_SECONDS, SIGNED_URL_SAFETY_MARGIN_SECONDS,
+    SIGNED_URL_REFRESH_AHEAD_SECONDS, SIGNED_URL_CACHE_MAX_ENTRIES, SIGNED_URL_SIGN_WORKERS,
+)
+
+# 署名関数: (オブジェクトのパス, HTTPメソッド, 有効期間) -> 署名付きURL
+Signer = Callable[[str, str, timedelta], str]
+
+
+class SignedUrlCache:
+    """署名付きURLを (オブジェクト, メソッド) ごとに再利用するキャッシュ
+
+    署名（秘密鍵のRSA署名、またはIAM signBlobの往復）はリクエストごとに行うと重いため、
+    有効期限の SIGNED_URL_SAFETY_MARGIN_SECONDS 前まではキャッシュしたURLを返す。
+    - 残りが安全マージン＋先行更新の時間を切ったURLは、そのまま返しつつ裏で署名し直す
+    - 残りが安全マージンを切ったURLは使わず、その場で署名する
+    - 一覧用の get_many はキャッシュにないものをスレッドで並行して署名する
+    """
+
+    def __init__(self, enabled: bool = SIGNED_URL_CACHE_ENABLED, ttl_seconds: int = SIGNED_URL_TTL_SECONDS,
+                 safety_margin_seconds: int = SIGNED_URL_SAFETY_MARGIN_SECONDS,
+                 refresh_ahead_seconds: int = SIGNED_URL_REFRESH_AHEAD_SECONDS,
+                 max_entries: int = SIGNED_URL_CACHE_MAX_ENTRIES, sign_workers: int = SIGNED_URL_SIGN_WORKERS):
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        self.safety_margin_seconds = safety_margin_seconds
+        self.refresh_ahead_seconds = refresh_ahead_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self._refreshing = set()
+        self._executor = ThreadPoolExecutor(max_workers=sign_workers, thread_name_prefix="signed-url")
+        self._stats = {
+            "hits": 0, "misses": 0, "background_refreshes": 0, "refresh_errors": 0,
+            "signs": 0, "sign_errors": 0, "sign_seconds": 0.0, "invalidations": 0,
+        }
+
+    def get(self, gcs_path: str, signer: Signer, method: str = "GET") -> str:
+        """署名付きURLを取得（キャッシュになければ署名する。署名の失敗は例外のまま返す）"""
+        key = (gcs_path, method.upper())
+        with self._lock:
+            url = self._lookup(key, signer)
+        if url is not None:
+            return url
+        return self._sign(key, signer)
+
+    def get_many(self, gcs_paths: List[str], signer: Signer, method: str = "GET") -> Dict[str, Optional[str]]:
+        """複数オブジェクトの署名付きURLをまとめて取得（署名に失敗したものはNone）"""
+        method = method.upper()
+        urls: Dict[str, Optional[str]] = {}
+        missing = []
+        with self._lock:
+            for gcs_path in dict.fromkeys(gcs_paths):
+                url = self._lookup((gcs_path, method), signer)
+                if url is None:
+                    missing.append((gcs_path, method))
+                else:
+                    urls[gcs_path] = url
+
+        if len(missing) == 1:
+            urls[missing[0][0]] = self._sign_or_none(missing[0], signer)
+        elif missing:
+            signed = self._executor.map(lambda key: self._sign_or_none(key, signer), missing)
+            urls.update(zip((gcs_path for gcs_path, _ in missing), signed))
+        return urls
+
+    def invalidate(self, gcs_path: str) -> None:
+        """削除したオブジェクトのURLを破棄（全メソッド分）"""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == gcs_path]:
+                del self._entries[key]
+                self._stats["invalidations"] += 1
+
+    def invalidate_prefix(self, prefix: str) -> None:
+        """プレフィックス以下のオブジェクトのURLを破棄"""
+        with self._lock:
+            for key in [key for key in self._entries if key[0].startswith(prefix)]:
+                del self._entries[key]
+                self._stats["invalidations"] += 1
+
+    def _lookup(self, key: Tuple[str, str], signer: Signer) -> Optional[str]:
+        """使えるURLを返し、期限が近ければ裏で更新を予約（ロック内で呼ぶ）"""
+        entry = self._entries.get(key) if self.enabled else None
+        remaining = entry["expires_at"] - time.time() if entry else 0
+        if entry is None or remaining <= self.safety_margin_seconds:
+            self._stats["misses"] += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self._stats["hits"] += 1
+        if remaining <= self.safety_margin_seconds + self.refresh_ahead_seconds and key not in self._refreshing:
+            self._refreshing.add(key)
+            self._executor.submit(self._refresh, key, signer)
+        return entry["url"]
+
+    def _sign(self, key: Tuple[str, str], signer: Signer) -> str:
+        """署名してキャッシュに保存（有効期限は署名前の時刻から数えて短めに見積もる）"""
+        gcs_path, method = key
+        expires_at = time.time() + self.ttl_seconds
+        start_time = time.perf_counter()
+        try:
+            url = signer(gcs_path, method, timedelta(seconds=self.ttl_seconds))
+        except Exception:
+            with self._lock:
+                self._stats["sign_errors"] += 1
+            raise
+        with self._lock:
+            self._stats["signs"] += 1
+            self._stats["sign_seconds"] += time.perf_counter() - start_time
+            if self.enabled:
+                self._entries[key] = {"url": url, "expires_at": expires_at}
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return url
+
+    def _sign_or_none(self, key: Tuple[str, str], signer: Signer) -> Optional[str]:
+        try:
+            return self._sign(key, signer)
+        except Exception as e:
+            print(f"⚠️ 署名付きURL生成エラー: {key[0]} {e}")
+            return None
+
+    def _refresh(self, key: Tuple[str, str], signer: Signer) -> None:
+        """期限が近いURLを裏で署名し直す（失敗しても期限までは古いURLを使い続ける）"""
+        try:
+            self._sign(key, signer)
+            with self._lock:
+                self._stats["background_refreshes"] += 1
+        except Exception as e:
+            with self._lock:
+                self._stats["refresh_errors"] += 1
+            print(f"⚠️ 署名付きURLの更新エラー: {key[0]} {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """ヒット率・署名回数・平均署名時間などの統計"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["refreshing"] = len(self._refreshing)
+        lookups = stats["hits"] + stats["misses"]
+        stats["enabled"] = self.enabled
+        stats["hit_rate"] = round(stats["hits"] / lookups, 3) if lookups else 0.0
+        stats["avg_sign_ms"] = round(stats["sign_seconds"] / stats["signs"] * 1000, 2) if stats["signs"] else 0.0
+        stats["sign_seconds"] = round(stats["sign_seconds"], 3)
+        return stats
+
+# シングルトンインスタンス
+signed_url_cache = SignedUrlCache()
@@ -1,13 +1,182 @@
 import json
 import google.generativeai as genai
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
 import os
 from dotenv import load_dotenv
+from app.core.config import THEME_BATCH_MAX_ITEMS
+from app.service.model_router_service import model_router_service
+from app.service.story_setting_rules import story_setting_rule_index
 
 load_dotenv()
 
+# 以下のプロンプトは全リクエストで共通の静的プレフィックス（system_instruction/キャッシュ対象）
+# 呼び出しごとに変わる設定値は動的サフィックスとして別に渡す
+
+THEME_OPTIONS_SYSTEM_INSTRUCTION = """
+あなたは子供向けの絵本のストーリー企画者です。
+与えられた【基本設定】を元に、3つの異なるテーマの物語案を提案してください。
+
+【要求事項】
+1. 3つの異なるテーマ（冒険、友情、発見など）
+2. 各テーマのタイトル、概要説明、キーワード
+3. 子供が楽しめる内容
+4. 教育的な要素を含む
+
+【出力形式】
+以下のJSON形式で出力してください：
+{
+  "theme_options": {
+    "theme1": {
+      "theme_id": "adventure",
+      "title": "タイトル",
+      "description": "物語の概要（2-3文）",
+      "keywords": ["キーワード1", "キーワード2", "キーワード3"]
+    },
+    "theme2": {
+      "theme_id": "friendship",
+      "title": "タイトル",
+      "description": "物語の概要（2-3文）",
+      "keywords": ["キーワード1", "キーワード2", "キーワード3"]
+    },
+    "theme3": {
+      "theme_id": "discovery",
+      "title": "タイトル",
+      "description": "物語の概要（2-3文）",
+      "keywords": ["キーワード1", "キーワード2", "キーワード3"]
+    }
+  }
+}
+
+必ずJSON形式で出力し、他の説明文は含めないでください。
+"""
+
+THEME_OPTIONS_BATCH_SYSTEM_INSTRUCTION = """
+あなたは子供向けの絵本のストーリー企画者です。
+複数の【基本設定】が item_id 付きで与えられます。設定ごとに、3つの異なるテーマの物語案を提案してください。
+
+【要求事項】
+1. 3つの異なるテーマ（冒険、友情、発見など）
+2. 各テーマのタイトル、概要説明、キーワード
+3. 子供が楽しめる内容
+4. 教育的な要素を含む
+5. 各設定は独立して考え、他の設定の内容を混ぜない
+
+【出力形式】
+与えられた全ての item_id について、以下のJSON配列で出力してください：
+[
+  {
+    "item_id": "与えられたitem_id",
+    "theme_options": {
+      "theme1": {
+        "theme_id": "adventure",
+        "title": "タイトル",
+        "description": "物語の概要（2-3文）",
+        "keywords": ["キーワード1", "キーワード2", "キーワード3"]
+      },
+      "theme2": {...},
+      "theme3": {...}
+    }
+  }
+]
+
+必ずJSON形式で出力し、他の説明文は含めないでください。
+"""
+
+COMPLETE_STORY_SYSTEM_INSTRUCTION = """
+あなたは子供向けの絵本のストーリー企画者です。
+与えられた【基本設定】を元に、3つの異なるテーマの物語案と、それぞれの完全な物語本文（5ページ）を作成してください。
+
+【要求事項】
+1. 3つの異なるテーマ（冒険、友情、発見など）
+2. 各テーマで5ページの完全な物語本文
+3. 子供が楽しめる内容
+4. 教育的な要素を含む
+5. 読みやすく、感情に訴える文章
+
+【出力形式】
+以下のJSON形式で出力してください：
+{
+  "theme_options": {
+    "theme1": {
+      "theme_id": "adventure",
+      "title": "タイトル",
+      "description": "物語の概要",
+      "keywords": ["キーワード1", "キーワード2", "キーワード3"]
+    },
+    "theme2": {...},
+    "theme3": {...}
+  },
+  "generated_stories": {
+    "theme1": {
+      "title": "タイトル",
+      "story_pages": [
+        {"page_1": "1ページ目の完全な物語本文"},
+        {"page_2": "2ページ目の完全な物語本文"},
+        {"page_3": "3ページ目の完全な物語本文"},
+        {"page_4": "4ページ目の完全な物語本文"},
+        {"page_5": "5ページ目の完全な物語本文"}
+      ]
+    },
+    "theme2": {...},
+    "theme3": {...}
+  }
+}
+
+必ずJSON形式で出力し、他の説明文は含めないでください。
+"""
+
+SINGLE_STORY_SYSTEM_INSTRUCTION = """
+与えられた【基本設定】とテーマで、子供向け絵本の物語を5ページで作成してください。
+
+【出力形式】
+以下のJSON形式で出力してください：
+{
+  "title": "物語のタイトル",
+  "story_pages": [
+    {"page_1": "1ページ目の完全な物語本文"},
+    {"page_2": "2ページ目の完全な物語本文"},
+    {"page_3": "3ページ目の完全な物語本文"},
+    {"page_4": "4ページ目の完全な物語本文"},
+    {"page_5": "5ページ目の完全な物語本文"}
+  ]
+}
+
+必ずJSON形式で出力し、他の説明文は含めないでください。
+"""
+
+GENDER_SYSTEM_INSTRUCTION = """
+この画像は子供の写真か、子供が描いた絵です。
+写真の場合は写っている子供の性別を、絵の場合は描かれている主人公（人物）の性別を判定してください。
+
+以下の要素を総合的に判断してください：
+- 写真の場合: 顔の特徴、髪型、服装、表情など
+- 絵の場合: 髪型（短髪、長髪、ポニーテールなど）、服装の色（青、ピンク、赤、緑など）、
+  服装のスタイル（ズボン、スカート、ドレスなど）、アクセサリー（リボン、帽子など）、全体的な色使いや雰囲気
+子供が描いた絵ははっきりしない部分もありますが、できるだけ判定してください。
+
+以下のいずれかのみで回答してください：
+- 男の子
+- 女の子
+- 判定不可
+"""
+
+# 物語設定の推定（generate_story_setting_from_analysis）に必要なVisionの機能
+STORY_SETTING_VISION_FEATURES = ["labels", "objects", "faces", "text"]
+
+TONE_DESCRIPTIONS = {
+    "gentle": "優しく温かい雰囲気",
+    "fun": "楽しく明るい雰囲気",
+    "adventure": "冒険的でワクワクする雰囲気",
+    "mystery": "謎解きでドキドキする雰囲気"
+}
+
+AGE_DESCRIPTIONS = {
+    "preschool": "3-6歳の未就学児向け",
+    "elementary_low": "7-9歳の小学生低学年向け"
+}
+
 class StoryGeneratorService:
-    """Gemini 2.5 Flashを使用してストーリーを生成するサービス"""
+    """Geminiを使用してストーリーを生成するサービス（タスクごとにモデルのティアを切り替え）"""
 
     def __init__(self):
         # Gemini APIの設定
@@ -16,10 +185,14 @@ class StoryGeneratorService:
             raise ValueError("GEMINI_API_KEYまたはGOOGLE_API_KEYが設定されていません")
         
         genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-2.5-flash')
+        # タスクごとのモデル・generation_configはルーターで決定
+        self.router = model_router_service
+
+    def generate_theme_options_only(self, story_setting: Dict[str, Any], raise_on_error: bool = False) -> Dict[str, Any]:
+        """3つのテーマ案のみを生成（物語本文は生成しない）- 高速化版
 
-    def generate_theme_options_only(self, story_setting: Dict[str, Any]) -> Dict[str, Any]:
-        """3つのテーマ案のみを生成（物語本文は生成しない）- 高速化版"""
+        raise_on_error: エラー時にフォールバックの定型文を返さず例外を送出する（一括生成で再試行するため）
+        """
         
         protagonist_name = story_setting.get("protagonist_name", "主人公")
         protagonist_type = story_setting.get("protagonist_type", "子供")
@@ -35,16 +208,111 @@ class StoryGeneratorService:
         )
 
         try:
-            # Gemini 2.5 Flashでテーマ案のみを生成
-            response = self.model.generate_content(prompt)
+            # 軽量ティアでテーマ案のみを生成
+            response = self.router.generate("theme_options", prompt, system_instruction=THEME_OPTIONS_SYSTEM_INSTRUCTION)
             theme_data = self._parse_theme_options_response(response.text)
             return theme_data
 
         except Exception as e:
             print(f"Gemini API エラー: {e}")
+            if raise_on_error:
+                raise
             # エラー時はフォールバック
             return self._generate_fallback_theme_options(protagonist_name, protagonist_type, setting_place, tone)
 
+    def generate_theme_options_batch(self, story_settings: List[Dict[str, Any]], batch_size: Optional[int] = None,
+                                     raise_on_error: bool = False) -> List[Optional[Dict[str, Any]]]:
+        """複数の設定のテーマ案を少ない呼び出し回数でまとめて生成（一括生成・シード用）
+
+        結果は入力と同じ順番で返す。パースできなかった項目だけを分割して再試行し、
+        1件でも失敗した項目は通常の generate_theme_options_only（失敗時はフォールバック）で生成する。
+        raise_on_error の場合、最後まで生成できなかった項目はフォールバックではなくNoneにする。
+        """
+        batch_size = max(1, batch_size or THEME_BATCH_MAX_ITEMS)
+        results: List[Optional[Dict[str, Any]]] = [None] * len(story_settings)
+        items = list(enumerate(story_settings))
+
+        for start in range(0, len(items), batch_size):
+            self._generate_theme_batch(items[start:start + batch_size], results, raise_on_error)
+
+        return results
+
+    def _generate_theme_batch(self, items: List[Tuple[int, Dict[str, Any]]],
+                              results: List[Optional[Dict[str, Any]]], raise_on_error: bool = False) -> None:
+        """1回の呼び出しで複数設定のテーマ案を生成し、失敗した項目は半分に分けて再試行"""
+        if not items:
+            return
+        if len(items) == 1:
+            index, story_setting = items[0]
+            try:
+                results[index] = self.generate_theme_options_only(story_setting, raise_on_error=raise_on_error)
+            except Exception:
+                results[index] = None
+            return
+
+        failed = items
+        try:
+            response = self.router.generate(
+                "theme_options_batch",
+                self._create_theme_options_batch_prompt(items),
+                system_instruction=THEME_OPTIONS_BATCH_SYSTEM_INSTRUCTION,
+            )
+            parsed = self._parse_theme_options_batch_response(response.text)
+            failed = []
+            for index, story_setting in items:
+                theme_options = parsed.get(str(index))
+                if self._is_valid_theme_options(theme_options):
+                    results[index] = {"theme_options": theme_options}
+                else:
+                    failed.append((index, story_setting))
+        except Exception as e:
+            print(f"Gemini API エラー（テーマ一括生成 {len(items)}件）: {e}")
+
+        if not failed:
+            return
+
+        print(f"⚠️ テーマ一括生成: {len(failed)}/{len(items)}件を分割して再試行")
+        middle = len(failed) // 2
+        self._generate_theme_batch(failed[:middle], results, raise_on_error)
+        self._generate_theme_batch(failed[middle:], results, raise_on_error)
+
+    def _create_theme_options_batch_prompt(self, items: List[Tuple[int, Dict[str, Any]]]) -> str:
+        """一括生成用の動的プロンプト（item_id付きの基本設定を並べる）"""
+        blocks = []
+        for index, story_setting in items:
+            setting_block = self._create_setting_block(
+                story_setting.get("protagonist_name", "主人公"),
+                story_setting.get("protagonist_type", "子供"),
+                story_setting.get("setting_place", "公園"),
+                story_setting.get("tone", "gentle"),
+                story_setting.get("target_age", "preschool"),
+                story_setting.get("reading_level", "hiragana_only"),
+            )
+            blocks.append(f"item_id: {index}{setting_block}")
+        return "\n".join(blocks)
+
+    def _parse_theme_options_batch_response(self, response_text: str) -> Dict[str, Any]:
+        """一括生成のレスポンスをパースして {item_id: theme_options} を返す"""
+        data = self._parse_theme_options_response(response_text)
+        if isinstance(data, dict):
+            data = data.get("items", [])
+
+        parsed = {}
+        for entry in data:
+            if isinstance(entry, dict) and "item_id" in entry:
+                parsed[str(entry["item_id"])] = entry.get("theme_options")
+        return parsed
+
+    def _is_valid_theme_options(self, theme_options: Any) -> bool:
+        """theme1〜theme3が揃い、タイトルを持つか"""
+        if not isinstance(theme_options, dict):
+            return False
+        for key in ("theme1", "theme2", "theme3"):
+            theme = theme_options.get(key)
+            if not isinstance(theme, dict) or not theme.get("title"):
+                return False
+        return True
+
     def generate_complete_story(self, story_setting: Dict[str, Any]) -> Dict[str, Any]:
         """テーマ案と物語本文を一緒に生成（非推奨 - 遅い）"""
         
@@ -62,8 +330,8 @@ class StoryGeneratorService:
         )
 
         try:
-            # Gemini 2.5 Flashで完全なストーリーを生成
-            response = self.model.generate_content(prompt)
+            # 標準ティアで完全なストーリーを生成
+            response = self.router.generate("complete_story", prompt, system_instruction=COMPLETE_STORY_SYSTEM_INSTRUCTION)
             story_data = self._parse_complete_story_response(response.text)
             return story_data
 
@@ -72,8 +340,12 @@ class StoryGeneratorService:
             # エラー時はフォールバック
             return self._generate_fallback_complete_story(protagonist_name, protagonist_type, setting_place, tone)
 
-    def generate_single_story(self, story_setting: Dict[str, Any], selected_theme: str) -> Dict[str, Any]:
-        """選択されたテーマの物語本文を生成"""
+    def generate_single_story(self, story_setting: Dict[str, Any], selected_theme: str,
+                              raise_on_error: bool = False) -> Dict[str, Any]:
+        """選択されたテーマの物語本文を生成
+
+        raise_on_error: エラー時にフォールバックの定型文を返さず例外を送出する（一括生成で再試行するため）
+        """
         
         protagonist_name = story_setting.get("protagonist_name", "主人公")
         protagonist_type = story_setting.get("protagonist_type", "子供")
@@ -89,150 +361,31 @@ class StoryGeneratorService:
         )
 
         try:
-            # Gemini 2.5 Flashで単一ストーリーを生成
-            response = self.model.generate_content(prompt)
+            # 標準ティアで単一ストーリーを生成
+            response = self.router.generate("story", prompt, system_instruction=SINGLE_STORY_SYSTEM_INSTRUCTION)
             story_data = self._parse_single_story_response(response.text)
             return story_data
 
         except Exception as e:
             print(f"Gemini API エラー: {e}")
+            if raise_on_error:
+                raise
             # エラー時はフォールバック
             return self._generate_fallback_single_story(protagonist_name, protagonist_type, setting_place, selected_theme)
 
     def _create_theme_options_prompt(self, protagonist_name: str, protagonist_type: str, 
                                     setting_place: str, tone: str, target_age: str, reading_level: str) -> str:
-        """テーマ案のみ生成用のプロンプトを作成（物語本文は生成しない）"""
-        
-        tone_descriptions = {
-            "gentle": "優しく温かい雰囲気",
-            "fun": "楽しく明るい雰囲気", 
-            "adventure": "冒険的でワクワクする雰囲気",
-            "mystery": "謎解きでドキドキする雰囲気"
-        }
-        
-        age_descriptions = {
-            "preschool": "3-6歳の未就学児向け",
-            "elementary_low": "7-9歳の小学生低学年向け"
-        }
-
-        prompt = f"""
-あなたは子供向けの絵本のストーリー企画者です。
-以下の設定を元に、3つの異なるテーマの物語案を提案してください。
-
-【基本設定】
-- 主人公: {protagonist_name}（{protagonist_type}）
-- 舞台: {setting_place}
-- 雰囲気: {tone_descriptions.get(tone, '優しく温かい雰囲気')}
-- 対象年齢: {age_descriptions.get(target_age, '3-6歳の未就学児向け')}
-- 読みやすさ: {reading_level}
-
-【要求事項】
-1. 3つの異なるテーマ（冒険、友情、発見など）
-2. 各テーマのタイトル、概要説明、キーワード
-3. 子供が楽しめる内容
-4. 教育的な要素を含む
-
-【出力形式】
-以下のJSON形式で出力してください：
-{{
-  "theme_options": {{
-    "theme1": {{
-      "theme_id": "adventure",
-      "title": "タイトル",
-      "description": "物語の概要（2-3文）",
-      "keywords": ["キーワード1", "キーワード2", "キーワード3"]
-    }},
-    "theme2": {{
-      "theme_id": "friendship",
-      "title": "タイトル",
-      "description": "物語の概要（2-3文）",
-      "keywords": ["キーワード1", "キーワード2", "キーワード3"]
-    }},
-    "theme3": {{
-      "theme_id": "discovery",
-      "title": "タイトル",
-      "description": "物語の概要（2-3文）",
-      "keywords": ["キーワード1", "キーワード2", "キーワード3"]
-    }}
-  }}
-}}
-
-必ずJSON形式で出力し、他の説明文は含めないでください。
-"""
-
-        return prompt
+        """テーマ案のみ生成用の動的プロンプトを作成（指示文と出力形式はTHEME_OPTIONS_SYSTEM_INSTRUCTION）"""
+        return self._create_setting_block(protagonist_name, protagonist_type, setting_place, tone, target_age, reading_level)
 
     def _create_complete_story_prompt(self, protagonist_name: str, protagonist_type: str, 
                                     setting_place: str, tone: str, target_age: str, reading_level: str) -> str:
-        """完全なストーリー生成用のプロンプトを作成"""
-        
-        tone_descriptions = {
-            "gentle": "優しく温かい雰囲気",
-            "fun": "楽しく明るい雰囲気", 
-            "adventure": "冒険的でワクワクする雰囲気",
-            "mystery": "謎解きでドキドキする雰囲気"
-        }
-        
-        age_descriptions = {
-            "preschool": "3-6歳の未就学児向け",
-            "elementary_low": "7-9歳の小学生低学年向け"
-        }
-
-        prompt = f"""
-あなたは子供向けの絵本のストーリー企画者です。
-以下の設定を元に、3つの異なるテーマの物語案と、それぞれの完全な物語本文（5ページ）を作成してください。
-
-【基本設定】
-- 主人公: {protagonist_name}（{protagonist_type}）
-- 舞台: {setting_place}
-- 雰囲気: {tone_descriptions.get(tone, '優しく温かい雰囲気')}
-- 対象年齢: {age_descriptions.get(target_age, '3-6歳の未就学児向け')}
-- 読みやすさ: {reading_level}
-
-【要求事項】
-1. 3つの異なるテーマ（冒険、友情、発見など）
-2. 各テーマで5ページの完全な物語本文
-3. 子供が楽しめる内容
-4. 教育的な要素を含む
-5. 読みやすく、感情に訴える文章
-
-【出力形式】
-以下のJSON形式で出力してください：
-{{
-  "theme_options": {{
-    "theme1": {{
-      "theme_id": "adventure",
-      "title": "タイトル",
-      "description": "物語の概要",
-      "keywords": ["キーワード1", "キーワード2", "キーワード3"]
-    }},
-    "theme2": {{...}},
-    "theme3": {{...}}
-  }},
-  "generated_stories": {{
-    "theme1": {{
-      "title": "タイトル",
-      "story_pages": [
-        {{"page_1": "1ページ目の完全な物語本文"}},
-        {{"page_2": "2ページ目の完全な物語本文"}},
-        {{"page_3": "3ページ目の完全な物語本文"}},
-        {{"page_4": "4ページ目の完全な物語本文"}},
-        {{"page_5": "5ページ目の完全な物語本文"}}
-      ]
-    }},
-    "theme2": {{...}},
-    "theme3": {{...}}
-  }}
-}}
-
-必ずJSON形式で出力し、他の説明文は含めないでください。
-"""
-
-        return prompt
+        """完全なストーリー生成用の動的プロンプトを作成（指示文と出力形式はCOMPLETE_STORY_SYSTEM_INSTRUCTION）"""
+        return self._create_setting_block(protagonist_name, protagonist_type, setting_place, tone, target_age, reading_level)
 
     def _create_single_story_prompt(self, protagonist_name: str, protagonist_type: str, 
                                   setting_place: str, tone: str, target_age: str, reading_level: str, selected_theme: str) -> str:
-        """単一ストーリー生成用のプロンプトを作成"""
+        """単一ストーリー生成用の動的プロンプトを作成（出力形式はSINGLE_STORY_SYSTEM_INSTRUCTION）"""
         
         prompt = f"""
 以下の設定で「{selected_theme}」テーマの物語を5ページで作成してください。
@@ -241,25 +394,22 @@ class StoryGeneratorService:
 - 主人公: {protagonist_name}（{protagonist_type}）
 - 舞台: {setting_place}
 - テーマ: {selected_theme}
-
-【出力形式】
-以下のJSON形式で出力してください：
-{{
-  "title": "物語のタイトル",
-  "story_pages": [
-    {{"page_1": "1ページ目の完全な物語本文"}},
-    {{"page_2": "2ページ目の完全な物語本文"}},
-    {{"page_3": "3ページ目の完全な物語本文"}},
-    {{"page_4": "4ページ目の完全な物語本文"}},
-    {{"page_5": "5ページ目の完全な物語本文"}}
-  ]
-}}
-
-必ずJSON形式で出力し、他の説明文は含めないでください。
 """
 
         return prompt
 
+    def _create_setting_block(self, protagonist_name: str, protagonist_type: str,
+                              setting_place: str, tone: str, target_age: str, reading_level: str) -> str:
+        """【基本設定】ブロックを作成"""
+        return f"""
+【基本設定】
+- 主人公: {protagonist_name}（{protagonist_type}）
+- 舞台: {setting_place}
+- 雰囲気: {TONE_DESCRIPTIONS.get(tone, '優しく温かい雰囲気')}
+- 対象年齢: {AGE_DESCRIPTIONS.get(target_age, '3-6歳の未就学児向け')}
+- 読みやすさ: {reading_level}
+"""
+
     def _parse_theme_options_response(self, response_text: str) -> Dict[str, Any]:
         """テーマ案のみのレスポンスをパース"""
         try:
@@ -444,86 +594,13 @@ class StoryGeneratorService:
         if isinstance(raw_faces, list):
             faces = raw_faces
 
-        # 推定ロジック（より詳細な判定）
-        protagonist_type = "子供"
-        
-        # facesの情報を取得（人間の顔が検出されているかチェック）
-        has_human_face = len(faces) > 0
-        
-        # 性別判定を試みる（失敗しても「子供」のままで問題なし）
-        # 人間の顔が検出されている場合、または子供の絵の場合
-        lower_labels = [l.lower() for l in labels]
-        has_human_face_or_drawing = (
-            has_human_face or 
-            any(k in lower_labels for k in ["cartoon", "animation", "animated cartoon", "fictional character", "toy", "drawing", "art", "illustration"])
-        )
-        
-        if has_human_face_or_drawing:
-            try:
-                print(f"性別判定を試行（失敗してもOK）: upload_image_id={upload_image_id}")
-                # Note: Cloud Run環境ではfile_pathが存在しないため、この処理は失敗します
-                # 失敗した場合は「子供」のままとし、後でユーザーに質問で聞きます
-                from sqlalchemy.orm import Session
-                from app.database.session import get_db
-                from app.models.images.images import UploadImages
-                
-                db_gen = get_db()
-                db = next(db_gen)
-                try:
-                    upload_image = db.query(UploadImages).filter(UploadImages.id == upload_image_id).first()
-                    if upload_image and upload_image.file_path:
-                        # 顔検出がある場合は写真用、ない場合は絵用のメソッドを使用
-                        if has_human_face:
-                            gender_result = self._detect_gender_with_gemini(upload_image.file_path)
-                        else:
-                            gender_result = self._detect_gender_from_drawing(upload_image.file_path)
-                        
-                        if gender_result in ["男の子", "女の子"]:
-                            protagonist_type = gender_result
-                            print(f"性別判定成功: {gender_result}")
-                finally:
-                    db.close()
-            except Exception as e:
-                print(f"性別判定スキップ（エラー）: {e}")
-                print("→ デフォルト「子供」を使用し、後でユーザーに質問します")
-        
-        # labelsから判定（従来のロジック）
-        if any(k in lower_labels for k in ["cat", "dog", "animal"]):
-            protagonist_type = "動物"
-        elif any(k in lower_labels for k in ["robot", "machine"]):
-            protagonist_type = "ロボット"
-        
-        # objectsからも判定（より正確な判定のため）
-        lower_objects = [o.lower() for o in objects]
-        
-        # 人間の顔が検出されている場合は、動物の着ぐるみでも「子供」として判定
-        if has_human_face:
-            # 人間の顔がある場合、動物の着ぐるみでも子供として扱う
-            if any(k in lower_objects for k in ["robot", "machine", "vehicle", "car", "truck", "airplane", "helicopter", "boat", "ship", "train", "bicycle", "motorcycle"]):
-                protagonist_type = "ロボット"
-            else:
-                protagonist_type = "子供"  # 動物の着ぐるみでも人間の顔があれば子供
-        else:
-            # 人間の顔がない場合の判定
-            # カートゥーン・アニメーション・架空キャラクターの場合は着ぐるみを着た子供の可能性が高い
-            is_cartoon_character = any(k in lower_labels for k in ["cartoon", "animation", "animated cartoon", "fictional character", "toy"])
-            
-            if is_cartoon_character and any(k in lower_objects for k in ["animal", "cat", "dog", "bird", "fish", "bear", "rabbit", "mouse", "lion", "tiger", "elephant", "monkey", "panda", "fox", "wolf", "deer", "horse", "cow", "pig", "sheep", "goat", "duck", "chicken", "frog", "turtle", "snake", "butterfly", "bee", "spider"]):
-                protagonist_type = "子供"  # カートゥーン + 動物 = 着ぐるみを着た子供
-            elif any(k in lower_objects for k in ["animal", "cat", "dog", "bird", "fish", "bear", "rabbit", "mouse", "lion", "tiger", "elephant", "monkey", "panda", "fox", "wolf", "deer", "horse", "cow", "pig", "sheep", "goat", "duck", "chicken", "frog", "turtle", "snake", "butterfly", "bee", "spider"]):
-                protagonist_type = "動物"  # リアルな動物
-            elif any(k in lower_objects for k in ["robot", "machine", "vehicle", "car", "truck", "airplane", "helicopter", "boat", "ship", "train", "bicycle", "motorcycle"]):
-                protagonist_type = "ロボット"
-
-        setting_place = "公園"
-        if any(k in lower_objects for k in ["house", "home"]):
-            setting_place = "家"
-        elif any(k in lower_objects for k in ["forest", "tree"]):
-            setting_place = "森"
-        elif any(k in lower_objects for k in ["sea", "ocean"]):
-            setting_place = "海"
-        elif any(k in lower_objects for k in ["mountain", "hill"]):
-            setting_place = "山"
+        # 主人公タイプ・舞台はルール表（app/core/story_setting_rules.json）で推定
+        # 性別はアップロード時に判定済み（meta_data["gender"]）。なければ「子供」のままとし、後でユーザーに質問する
+        # 要約（derived_features）から呼ばれた場合は顔の数だけが渡される
+        face_count = meta_data.get("face_count", len(faces))
+        inferred = story_setting_rule_index.evaluate(labels, objects, face_count, meta_data.get("gender"))
+        protagonist_type = inferred["protagonist_type"]
+        setting_place = inferred["setting_place"]
 
         protagonist_name = "主人公"
         if texts:
@@ -543,90 +620,27 @@ class StoryGeneratorService:
             "style_guideline": "優しく温かい雰囲気で、子供が楽しめる内容にする"
         }
 
-    def _detect_gender_with_gemini(self, image_path: str) -> str:
-        """Gemini APIを使って画像から性別を判定（写真用）"""
-        try:
-            import base64
-            from PIL import Image
-            
-            # 画像を読み込んでbase64エンコード
-            with open(image_path, "rb") as image_file:
-                image_data = base64.b64encode(image_file.read()).decode('utf-8')
-            
-            # Gemini APIで性別判定
-            prompt = """
-            この画像に写っている子供の性別を判定してください。
-            以下のいずれかで回答してください：
-            - 男の子
-            - 女の子
-            - 判定不可
-            
-            顔の特徴、髪型、服装、表情などを総合的に判断してください。
-            """
-            
-            # Gemini APIで画像解析
-            response = self.model.generate_content([
-                prompt,
-                {
-                    "mime_type": "image/jpeg",
-                    "data": image_data
-                }
-            ])
-            
-            result = response.text.strip()
-            
-            # 結果を正規化
-            if "男の子" in result or "男" in result:
-                return "男の子"
-            elif "女の子" in result or "女" in result:
-                return "女の子"
-            else:
-                return "子供"  # 判定不可の場合はデフォルト
-                
-        except Exception as e:
-            print(f"Gemini性別判定エラー: {e}")
-            return "子供"  # エラー時はデフォルト
+    def detect_gender(self, image_data: bytes) -> Optional[str]:
+        """Gemini APIを使って画像（写真・子供の絵のどちらでも）から性別を判定
 
-    def _detect_gender_from_drawing(self, image_path: str) -> str:
-        """Gemini APIを使って子供が描いた絵から主人公の性別を判定"""
+        アップロード時にVisionで顔・人物が見つかった場合に、メモリ上の解析用画像に対して実行する。
+        判定不可の場合は「子供」、エラー時は None を返す（保存・キャッシュしない）。
+        """
         try:
             import base64
-            from PIL import Image
-            
-            # 画像を読み込んでbase64エンコード
-            with open(image_path, "rb") as image_file:
-                image_data = base64.b64encode(image_file.read()).decode('utf-8')
-            
-            # Gemini APIで絵から性別判定
-            prompt = """
-            この画像は子供が描いた絵です。絵に描かれている主人公（人物）の性別を判定してください。
-            以下のいずれかで回答してください：
-            - 男の子
-            - 女の子
-            - 判定不可
-            
-            以下の要素を総合的に判断してください：
-            - 髪型（短髪、長髪、ポニーテールなど）
-            - 服装の色（青、ピンク、赤、緑など）
-            - 服装のスタイル（ズボン、スカート、ドレスなど）
-            - アクセサリー（リボン、帽子など）
-            - 全体的な色使いや雰囲気
-            - 絵の特徴（子供らしい描き方、色使いなど）
-            
-            子供が描いた絵なので、はっきりしない部分もありますが、できるだけ判定してください。
-            """
-            
+
+            mime_type = "image/png" if image_data[:8] == b"\x89PNG\r\n\x1a\n" else "image/jpeg"
+
             # Gemini APIで画像解析
-            response = self.model.generate_content([
-                prompt,
+            response = self.router.generate("classification", [
                 {
-                    "mime_type": "image/jpeg",
-                    "data": image_data
+                    "mime_type": mime_type,
+                    "data": base64.b64encode(image_data).decode('utf-8')
                 }
-            ])
+            ], system_instruction=GENDER_SYSTEM_INSTRUCTION)
             
             result = response.text.strip()
-            print(f"絵からの性別判定結果: {result}")
+            print(f"性別判定結果: {result}")
             
             # 結果を正規化
             if "男の子" in result or "男" in result:
@@ -637,8 +651,8 @@ class StoryGeneratorService:
                 return "子供"  # 判定不可の場合はデフォルト
                 
         except Exception as e:
-            print(f"絵からの性別判定エラー: {e}")
-            return "子供"  # エラー時はデフォルト
+            print(f"Gemini性別判定エラー: {e}")
+            return None
 
 # シングルトンインスタンス
 story_generator_service = StoryGeneratorService()
\ No newline at end of file
@@ -0,0 +1,105 @@
+import json
+from typing import Dict, Any, List, Tuple, FrozenSet, Iterable, Optional
+from app.core.config import STORY_SETTING_RULES_PATH
+
+# 判定用の特別な事実（キーワード以外）
+FACT_FACE = "face"
+FACT_GENDER = "gender"
+GENDER_VALUES = ("男の子", "女の子")
+
+
+class StorySettingRuleIndex:
+    """物語設定の推定ルール（app/core/story_setting_rules.json）をコンパイルしたインデックス
+
+    キーワードは ソース（labels / objects）ごとの辞書に展開し、キーワード → 事実名 をハッシュで引く。
+    ラベルとオブジェクトを1回ずつ走査して成り立つ事実を集め、
+    優先度順のルールのうち条件がすべて成り立つ最初のものを採用する。
+    """
+
+    def __init__(self, rules: Dict[str, Any]):
+        # {source: {keyword: frozenset(事実名)}}
+        index: Dict[str, Dict[str, set]] = {}
+        for name, keyword_set in rules.get("keyword_sets", {}).items():
+            source_index = index.setdefault(keyword_set["source"], {})
+            for keyword in keyword_set["keywords"]:
+                source_index.setdefault(keyword.lower(), set()).add(name)
+        self.keyword_index: Dict[str, Dict[str, FrozenSet[str]]] = {
+            source: {keyword: frozenset(names) for keyword, names in keywords.items()}
+            for source, keywords in index.items()
+        }
+
+        known_facts = set(rules.get("keyword_sets", {}).keys()) | {FACT_FACE, FACT_GENDER}
+        self.protagonist_rules = self._compile_rules(rules.get("protagonist_rules", []), known_facts)
+        self.place_rules = self._compile_rules(rules.get("place_rules", []), known_facts)
+        self.default_protagonist = rules.get("default_protagonist", "子供")
+        self.default_place = rules.get("default_place", "公園")
+
+    def _compile_rules(self, rules: List[Dict[str, Any]], known_facts: set) -> List[Tuple[FrozenSet[str], str]]:
+        """優先度順に並べ、条件を事実名の集合にする"""
+        compiled = []
+        for rule in sorted(rules, key=lambda r: r.get("priority", 0)):
+            conditions = frozenset(rule["when"])
+            unknown = conditions - known_facts
+            if unknown:
+                raise ValueError(f"物語設定ルールに未定義の条件があります: {sorted(unknown)}")
+            compiled.append((conditions, rule["result"]))
+        return compiled
+
+    def collect_facts(self, labels: Iterable[str], objects: Iterable[str], face_count: int = 0,
+                      gender: Optional[str] = None) -> FrozenSet[str]:
+        """ラベル・オブジェクトを1回ずつ走査して成り立つ事実を集める"""
+        facts = set()
+        label_index = self.keyword_index.get("labels", {})
+        for label in labels:
+            matched = label_index.get(label.lower())
+            if matched:
+                facts |= matched
+        object_index = self.keyword_index.get("objects", {})
+        for obj in objects:
+            matched = object_index.get(obj.lower())
+            if matched:
+                facts |= matched
+        if face_count > 0:
+            facts.add(FACT_FACE)
+        if gender in GENDER_VALUES:
+            facts.add(FACT_GENDER)
+        return frozenset(facts)
+
+    def evaluate(self, labels: Iterable[str], objects: Iterable[str], face_count: int = 0,
+                 gender: Optional[str] = None) -> Dict[str, str]:
+        """主人公タイプと舞台を推定"""
+        facts = self.collect_facts(labels, objects, face_count, gender)
+        protagonist_type = self._first_match(self.protagonist_rules, facts, self.default_protagonist)
+        if protagonist_type == "$gender":
+            protagonist_type = gender
+        setting_place = self._first_match(self.place_rules, facts, self.default_place)
+        return {"protagonist_type": protagonist_type, "setting_place": setting_place}
+
+    def needs_gender(self, labels: Iterable[str], objects: Iterable[str], face_count: int = 0) -> bool:
+        """性別が分かると主人公タイプが変わるか
+
+        性別なしの事実で優先度順にルールを見て、性別を条件に含むルールが（性別以外の条件を満たした状態で）
+        性別を使わないルールより先に来る場合だけ True（アップロード時の性別判定の結果を使うかの判断用）。
+        """
+        facts = self.collect_facts(labels, objects, face_count)
+        for conditions, _ in self.protagonist_rules:
+            if conditions <= facts:
+                return False
+            if FACT_GENDER in conditions and conditions - {FACT_GENDER} <= facts:
+                return True
+        return False
+
+    def _first_match(self, rules: List[Tuple[FrozenSet[str], str]], facts: FrozenSet[str], default: str) -> str:
+        for conditions, result in rules:
+            if conditions <= facts:
+                return result
+        return default
+
+
+def load_story_setting_rules(path: str = STORY_SETTING_RULES_PATH) -> StorySettingRuleIndex:
+    """ルールファイルを読み込んでコンパイル"""
+    with open(path, "r", encoding="utf-8") as f:
+        return StorySettingRuleIndex(json.load(f))
+
+# 起動時にコンパイルしたインデックス
+story_setting_rule_index = load_story_setting_rules()
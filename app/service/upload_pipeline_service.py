@@ -0,0 +1,207 @@
+import time
+import asyncio
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional
+from app.utils.image_utils import create_analysis_rendition
+from app.utils.color_utils import extract_dominant_colors
+from app.utils.worker_pool import run_in_process
+from app.service.story_setting_rules import story_setting_rule_index
+
+
+class UploadStorageError(Exception):
+    """GCSへのアップロードに失敗した場合の例外（画像が保存できないためリクエスト全体を失敗させる）"""
+    pass
+
+
+class UploadPipelineService:
+    """アップロード画像のGCS保存とVision API解析を並行実行するサービス
+
+    GCS保存とVision解析は互いに依存しないネットワーク処理のため asyncio.gather で同時に実行し、
+    アップロード全体の待ち時間を 合計 ではなく max(GCS, Vision) に近づける。
+    - GCSが失敗した場合: UploadStorageError を送出（DBには保存しない）
+    - Visionが失敗した場合: エラー内容をmeta_dataに入れて保存を続行
+    Visionには保存用画像ではなく、元画像から作った縮小JPEG（解析用画像）を送る。
+    キャッシュがあれば解析用画像のハッシュで過去の解析結果を再利用し、Visionの呼び出しを省略する。
+    性別判定はVision解析と並行して同じ解析用画像で実行し、物語設定のルールで性別が結果を変える場合
+    （顔のない子供の絵など）だけmeta_data["gender"]に入れる。判定の失敗はVisionの結果のキャッシュを妨げない。
+    """
+
+    def __init__(self, storage_service, vision_service, cache_service=None, gender_service=None):
+        self.storage_service = storage_service
+        self.vision_service = vision_service
+        self.cache_service = cache_service
+        # 性別判定（detect_genderを持つサービス。省略時は判定しない）
+        self.gender_service = gender_service
+
+    async def run(self, content: bytes, filename: str, user_id: int, content_type: str,
+                  analysis_source: Optional[bytes] = None, feature_profile: Optional[str] = None) -> Dict[str, Any]:
+        """GCS保存とVision解析を並行実行し、両方の結果と各ステージの所要時間を返す
+
+        Args:
+            content: 保存する画像データ
+            analysis_source: 解析用画像の元データ（リサイズ前の元画像。省略時はcontentを解析）
+            feature_profile: Visionの機能プロファイル（省略時は設定値）
+        """
+        start_time = time.time()
+        upload_outcome, analysis_outcome = await asyncio.gather(
+            self._upload(content, filename, user_id, content_type),
+            self._analyze(content, analysis_source, feature_profile),
+            return_exceptions=True,
+        )
+        parallel_time = time.time() - start_time
+
+        if isinstance(upload_outcome, BaseException):
+            raise UploadStorageError(str(upload_outcome)) from upload_outcome
+
+        upload_result, upload_time = upload_outcome
+        if isinstance(analysis_outcome, BaseException):
+            # Vision側の想定外の例外もアップロードは止めない
+            analysis_result, vision_time, rendition_time = self._error_analysis(analysis_outcome), parallel_time, 0.0
+        else:
+            analysis_result, vision_time, rendition_time = analysis_outcome
+
+        print(f"⏱️ GCS/Vision並行処理時間: {parallel_time:.3f}秒 (GCS: {upload_time:.3f}秒, Vision: {vision_time:.3f}秒)")
+        return {
+            "upload_result": upload_result,
+            "analysis_result": analysis_result,
+            "timings": {
+                "gcs_upload": round(upload_time, 3),
+                "analysis_rendition": round(rendition_time, 3),
+                "vision_analysis": round(vision_time, 3),
+                "gcs_vision_parallel": round(parallel_time, 3),
+            },
+        }
+
+    async def _upload(self, content: bytes, filename: str, user_id: int, content_type: str):
+        """GCSアップロード（同期クライアントのためスレッドで実行）"""
+        start_time = time.time()
+        upload_result = await asyncio.to_thread(
+            self.storage_service.upload_image,
+            file_content=content,
+            filename=filename,
+            user_id=user_id,
+            content_type=content_type,
+        )
+        upload_time = time.time() - start_time
+        if not upload_result["success"]:
+            print(f"GCSアップロード失敗: {upload_result['error']}")
+            raise UploadStorageError(upload_result["error"])
+        print(f"⏱️ GCSアップロード時間: {upload_time:.3f}秒")
+        return upload_result, upload_time
+
+    async def _analyze(self, content: bytes, analysis_source: Optional[bytes] = None,
+                       feature_profile: Optional[str] = None):
+        """Vision API解析（解析用の縮小画像を作って渡す。失敗時はエラー内容を含む解析結果を返す）"""
+        rendition_time = 0.0
+        rendition, rendition_info = None, {}
+        if analysis_source is not None:
+            # 縮小・JPEG化はCPU処理のためスレッドで実行（GCSアップロードと並行）
+            rendition_start_time = time.time()
+            rendition, rendition_info = await asyncio.to_thread(create_analysis_rendition, analysis_source)
+            rendition_time = time.time() - rendition_start_time
+            if rendition is not None:
+                print(f"⏱️ 解析用画像作成時間: {rendition_time:.3f}秒 ({len(content)} → {len(rendition)} bytes)")
+
+        # 解析用画像が作れなかった場合は保存用画像をそのまま解析
+        analysis_content = rendition if rendition is not None else content
+
+        features = self.vision_service.resolve_features(feature_profile)
+
+        start_time = time.time()
+        content_hash, cache_key = None, None
+        if self.cache_service:
+            content_hash = self.cache_service.compute_hash(analysis_content)
+            cache_key = self.cache_service.cache_key(content_hash, features)
+            cached_result = await asyncio.to_thread(self.cache_service.get, cache_key)
+            if cached_result is not None:
+                vision_time = time.time() - start_time
+                print(f"⏱️ Vision API解析キャッシュヒット: {vision_time:.3f}秒 ({content_hash[:12]})")
+                if self.gender_service and "gender" not in cached_result and self._needs_gender(cached_result):
+                    # 性別判定が失敗した（または無効だった）時の結果。必要な場合だけここで判定する
+                    gender_task = asyncio.ensure_future(asyncio.to_thread(self.gender_service.detect_gender, analysis_content))
+                    if await self._apply_gender(cached_result, gender_task):
+                        self.cache_service.put(cache_key, cached_result)
+                return cached_result, vision_time, rendition_time
+
+        # 主要色はVisionとは別にプロセスプールで抽出（Visionが失敗しても色は残る）
+        colors_task = asyncio.ensure_future(run_in_process(extract_dominant_colors, analysis_content))
+        # 性別判定はVisionの結果を待たずに並行して始め、使うかどうかはVisionの結果で決める
+        gender_task = None
+        if self.gender_service:
+            gender_task = asyncio.ensure_future(asyncio.to_thread(self.gender_service.detect_gender, analysis_content))
+        try:
+            analysis_result = await self.vision_service.analyze_image_bytes(analysis_content, features=features)
+            vision_time = time.time() - start_time
+            print(f"⏱️ Vision API解析時間: {vision_time:.3f}秒")
+        except Exception as e:
+            vision_time = time.time() - start_time
+            print(f"⏱️ Vision API解析時間（エラー）: {vision_time:.3f}秒")
+            print(f"Vision API解析エラー: {str(e)}")
+            analysis_result = self._error_analysis(e)
+
+        try:
+            analysis_result["colors"] = await colors_task
+        except Exception as e:
+            print(f"色抽出エラー: {str(e)}")
+
+        if gender_task:
+            if self._needs_gender(analysis_result):
+                await self._apply_gender(analysis_result, gender_task)
+            else:
+                # 結果を使わない（顔があるなど他のルールで決まる）ため待たない
+                gender_task.add_done_callback(self._discard_gender_result)
+
+        if content_hash:
+            analysis_result["content_hash"] = content_hash
+        if rendition_info:
+            # 顔のピクセル座標は解析用画像の座標系になるためサイズを残す
+            analysis_result["analysis_image"] = rendition_info
+        if cache_key:
+            # エラー結果はキャッシュ側で除外される（性別がない結果はキャッシュヒット時に必要なら再判定する）
+            self.cache_service.put(cache_key, analysis_result)
+        return analysis_result, vision_time, rendition_time
+
+    @staticmethod
+    def _needs_gender(analysis_result: Dict[str, Any]) -> bool:
+        """物語設定のルール上、この画像で性別が主人公タイプを変えるか"""
+        if analysis_result.get("error"):
+            return False
+        return story_setting_rule_index.needs_gender(
+            [label.get("description", "") for label in analysis_result.get("labels", [])],
+            [obj.get("name", "") for obj in analysis_result.get("objects", [])],
+            len(analysis_result.get("faces", []) or []),
+        )
+
+    @staticmethod
+    async def _apply_gender(analysis_result: Dict[str, Any], gender_task: asyncio.Future) -> bool:
+        """性別判定の結果を待って解析結果に入れる（失敗時は入れずに False）"""
+        gender_start_time = time.time()
+        try:
+            gender = await gender_task
+        except Exception as e:
+            print(f"性別判定エラー: {str(e)}")
+            gender = None
+        print(f"⏱️ 性別判定の待ち時間: {time.time() - gender_start_time:.3f}秒")
+        if not gender:
+            return False
+        analysis_result["gender"] = gender
+        return True
+
+    @staticmethod
+    def _discard_gender_result(task: asyncio.Future) -> None:
+        """使わない性別判定の例外を回収（未回収の例外の警告を出さない）"""
+        if not task.cancelled():
+            task.exception()
+
+    def _error_analysis(self, error: BaseException) -> Dict[str, Any]:
+        """Vision解析失敗時にmeta_dataへ保存する結果"""
+        return {
+            "error": f"Vision API解析に失敗しました: {str(error)}",
+            "labels": [],
+            "text": [],
+            "objects": [],
+            "faces": [],
+            "safe_search": {},
+            "colors": [],
+            "analysis_timestamp": datetime.now(timezone.utc).isoformat()
+        }
@@ -0,0 +1,164 @@
+import threading
+from contextvars import ContextVar
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional
+from app.core.config import GEMINI_MODEL_PRICING, MODEL_USAGE_PERSIST
+
+# リクエストごとの集計キー（エンドポイント・ユーザー）
+_usage_context: ContextVar[Dict[str, Any]] = ContextVar("model_usage_context", default={})
+
+
+def set_usage_context(endpoint: str, user_id: Optional[int] = None) -> None:
+    """現在のリクエストの集計キーを設定（エンドポイントの先頭で呼び出す）"""
+    _usage_context.set({"endpoint": endpoint, "user_id": user_id})
+
+
+def set_usage_user(user_id: Optional[int]) -> None:
+    """ユーザーIDが後から判明した場合に集計キーを更新"""
+    context = dict(_usage_context.get())
+    context["user_id"] = user_id
+    _usage_context.set(context)
+
+
+def get_usage_context() -> Dict[str, Any]:
+    """現在の集計キーを取得"""
+    context = _usage_context.get()
+    return {"endpoint": context.get("endpoint", "unknown"), "user_id": context.get("user_id")}
+
+
+def extract_usage(response: Any) -> Dict[str, int]:
+    """Geminiのレスポンスからusage_metadataを取り出す
+
+    思考モデル（gemini-2.5系）の思考トークンは candidates_token_count に含まれないため別に取り出す。
+    """
+    usage = getattr(response, "usage_metadata", None)
+    return {
+        "prompt_tokens": getattr(usage, "prompt_token_count", 0) or 0,
+        "cached_tokens": getattr(usage, "cached_content_token_count", 0) or 0,
+        "output_tokens": getattr(usage, "candidates_token_count", 0) or 0,
+        "thinking_tokens": getattr(usage, "thoughts_token_count", 0) or 0,
+    }
+
+
+def estimate_cost(model: str, prompt_tokens: int, cached_tokens: int, output_tokens: int,
+                  thinking_tokens: int = 0) -> float:
+    """トークン数から推定コスト（USD）を計算（思考トークンは出力の単価で課金される）"""
+    pricing = GEMINI_MODEL_PRICING.get(model)
+    if not pricing:
+        return 0.0
+    uncached_tokens = max(prompt_tokens - cached_tokens, 0)
+    cost = (
+        uncached_tokens * pricing.get("input", 0.0)
+        + cached_tokens * pricing.get("cached_input", pricing.get("input", 0.0))
+        + (output_tokens + thinking_tokens) * pricing.get("output", 0.0)
+    ) / 1_000_000
+    return round(cost, 8)
+
+
+class UsageTrackingService:
+    """モデル呼び出しのトークン数・レイテンシ・コストをエンドポイント別・ユーザー別に集計するサービス"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_endpoint: Dict[str, Dict[str, Any]] = {}
+        self._by_user: Dict[str, Dict[str, Any]] = {}
+        self._by_model: Dict[str, Dict[str, Any]] = {}
+        # DB保存はリクエスト処理をブロックしないよう別スレッドで行う
+        self._persist_executor = ThreadPoolExecutor(max_workers=1) if MODEL_USAGE_PERSIST else None
+
+    def record(self, model: str, task: str, usage: Dict[str, int], latency: float,
+               retries: int = 0, outcome: str = "success") -> Dict[str, Any]:
+        """1回分のモデル呼び出しを記録"""
+        context = get_usage_context()
+        entry = {
+            "endpoint": context["endpoint"],
+            "user_id": context["user_id"],
+            "model": model,
+            "task": task,
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "cached_tokens": usage.get("cached_tokens", 0),
+            "output_tokens": usage.get("output_tokens", 0),
+            "thinking_tokens": usage.get("thinking_tokens", 0),
+            "latency_ms": int(latency * 1000),
+            "retries": retries,
+            "outcome": outcome,
+        }
+        entry["cost_usd"] = estimate_cost(
+            model, entry["prompt_tokens"], entry["cached_tokens"], entry["output_tokens"], entry["thinking_tokens"]
+        )
+
+        with self._lock:
+            self._accumulate(self._by_endpoint, entry["endpoint"], entry)
+            self._accumulate(self._by_user, str(entry["user_id"]), entry)
+            self._accumulate(self._by_model, model, entry)
+
+        if self._persist_executor:
+            self._persist_executor.submit(self._persist, entry)
+
+        return entry
+
+    def _accumulate(self, table: Dict[str, Dict[str, Any]], key: str, entry: Dict[str, Any]) -> None:
+        """集計テーブルに加算"""
+        agg = table.setdefault(key, {
+            "calls": 0,
+            "successes": 0,
+            "failures": 0,
+            "retries": 0,
+            "prompt_tokens": 0,
+            "cached_tokens": 0,
+            "output_tokens": 0,
+            "thinking_tokens": 0,
+            "total_latency_ms": 0,
+            "cost_usd": 0.0,
+        })
+        agg["calls"] += 1
+        if entry["outcome"] == "success":
+            agg["successes"] += 1
+        else:
+            agg["failures"] += 1
+        agg["retries"] += entry["retries"]
+        agg["prompt_tokens"] += entry["prompt_tokens"]
+        agg["cached_tokens"] += entry["cached_tokens"]
+        agg["output_tokens"] += entry["output_tokens"]
+        agg["thinking_tokens"] += entry["thinking_tokens"]
+        agg["total_latency_ms"] += entry["latency_ms"]
+        agg["cost_usd"] = round(agg["cost_usd"] + entry["cost_usd"], 8)
+
+    def _persist(self, entry: Dict[str, Any]) -> None:
+        """使用量ログをDBに保存（失敗しても集計には影響させない）"""
+        try:
+            from app.database.supabase_session import SessionLocal
+            from app.models.usage.supabase_model_usage import SupabaseModelUsageLog
+
+            db = SessionLocal()
+            try:
+                db.add(SupabaseModelUsageLog(**entry))
+                db.commit()
+            finally:
+                db.close()
+        except Exception as e:
+            print(f"⚠️ 使用量ログ保存エラー: {e}")
+
+    def get_summary(self, user_id: Optional[int] = None) -> Dict[str, Any]:
+        """集計結果を返す（user_id指定時はそのユーザー分のみ）"""
+        with self._lock:
+            def with_average(table: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+                result = {}
+                for key, agg in table.items():
+                    result[key] = dict(agg)
+                    result[key]["avg_latency_ms"] = round(agg["total_latency_ms"] / agg["calls"], 0) if agg["calls"] else 0
+                return result
+
+            if user_id is not None:
+                return {"user_id": user_id, "usage": with_average(self._by_user).get(str(user_id), {})}
+
+            by_endpoint = with_average(self._by_endpoint)
+            return {
+                "total_cost_usd": round(sum(a["cost_usd"] for a in self._by_endpoint.values()), 8),
+                "by_endpoint": by_endpoint,
+                "by_user": with_average(self._by_user),
+                "by_model": with_average(self._by_model),
+            }
+
+# シングルトンインスタンス
+usage_tracking_service = UsageTrackingService()
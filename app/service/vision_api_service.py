@@ -5,16 +5,137 @@ from concurrent.futures import ThreadPoolExecutor
 from google.cloud import vision
 from google.oauth2 import service_account
 from google.api_core import retry as gretry
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Union, Tuple
+from app.core.config import VISION_BATCH_ENABLED, VISION_BATCH_MAX_SIZE, VISION_BATCH_WINDOW_MS, VISION_FEATURE_PROFILE
+
+# meta_dataのキーとVision APIの機能の対応
+VISION_FEATURES = {
+    "labels": {"type_": vision.Feature.Type.LABEL_DETECTION, "max_results": 10},
+    "text": {"type_": vision.Feature.Type.DOCUMENT_TEXT_DETECTION},
+    "objects": {"type_": vision.Feature.Type.OBJECT_LOCALIZATION, "max_results": 10},
+    "faces": {"type_": vision.Feature.Type.FACE_DETECTION, "max_results": 10},
+    "safe_search": {"type_": vision.Feature.Type.SAFE_SEARCH_DETECTION},
+}
+# 色情報（colors）はIMAGE_PROPERTIESではなくapp/utils/color_utils.pyでローカルに抽出する
+
+# 名前付きの機能プロファイル（足りない機能は ensure_features で後から取得）
+VISION_FEATURE_PROFILES = {
+    "minimal": ["labels", "objects", "safe_search"],
+    # 主人公タイプ・舞台のルール（story_setting_rules.json）が使う機能だけ
+    # （OCRは主人公名の候補にしか使わないため、物語設定の作成時に ensure_features で取得する）
+    "standard": ["labels", "objects", "faces"],
+    # すべての機能（OCR・セーフサーチを含む）
+    "full": list(VISION_FEATURES.keys()),
+}
+
+
+class VisionMicroBatcher:
+    """数ミリ秒の間に届いた解析リクエストをまとめて batch_annotate_images で送るバッチャー
+
+    リクエストはウィンドウ（window_seconds）が経過するか max_batch_size 件たまった時点で送信し、
+    レスポンスは元の順番でそれぞれの呼び出し元に返す。
+    最初に使われたイベントループに紐づくため、別のループからの呼び出しはバッチ化せず直接送信する。
+    """
+
+    def __init__(self, client, executor: ThreadPoolExecutor, max_batch_size: int = VISION_BATCH_MAX_SIZE,
+                 window_seconds: float = VISION_BATCH_WINDOW_MS / 1000):
+        self.client = client
+        self.executor = executor
+        # batch_annotate_imagesの上限は16件
+        self.max_batch_size = max(1, min(max_batch_size, 16))
+        self.window_seconds = window_seconds
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pending: List[Tuple[vision.AnnotateImageRequest, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        # 送信したバッチ数・件数（平均バッチサイズの確認用）
+        self.batches_sent = 0
+        self.requests_sent = 0
+
+    async def submit(self, request: vision.AnnotateImageRequest) -> vision.AnnotateImageResponse:
+        """リクエストをキューに入れ、バッチ送信後に自分のレスポンスを受け取る"""
+        loop = asyncio.get_running_loop()
+        if self._loop is None:
+            self._loop = loop
+        if loop is not self._loop:
+            responses = await loop.run_in_executor(self.executor, self._batch_annotate_sync, [request])
+            return responses[0]
+
+        future = loop.create_future()
+        self._pending.append((request, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window_seconds, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        """たまっているリクエストを最大件数ずつ送信"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        while self._pending:
+            batch = self._pending[:self.max_batch_size]
+            self._pending = self._pending[self.max_batch_size:]
+            self._loop.create_task(self._send(batch))
+
+    async def _send(self, batch: List[Tuple[vision.AnnotateImageRequest, asyncio.Future]]) -> None:
+        """1バッチを送信し、結果をそれぞれの呼び出し元に振り分ける"""
+        try:
+            responses = await self._loop.run_in_executor(
+                self.executor, self._batch_annotate_sync, [request for request, _ in batch]
+            )
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches_sent += 1
+        self.requests_sent += len(batch)
+        for index, (_, future) in enumerate(batch):
+            if future.done():
+                continue
+            if index < len(responses):
+                future.set_result(responses[index])
+            else:
+                future.set_exception(RuntimeError("Vision APIのバッチレスポンスが不足しています"))
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """送信したバッチ数・平均バッチサイズ"""
+        return {
+            "max_batch_size": self.max_batch_size,
+            "window_ms": round(self.window_seconds * 1000, 1),
+            "batches_sent": self.batches_sent,
+            "requests_sent": self.requests_sent,
+            "avg_batch_size": round(self.requests_sent / self.batches_sent, 2) if self.batches_sent else 0,
+            "pending": len(self._pending),
+        }
+
+    def _batch_annotate_sync(self, requests: List[vision.AnnotateImageRequest]) -> List[vision.AnnotateImageResponse]:
+        """同期版のバッチ解析（スレッドプールで実行）"""
+        response = self.client.batch_annotate_images(
+            requests=requests,
+            retry=gretry.Retry(deadline=30.0)
+        )
+        return list(response.responses)
+
 
 class VisionApiService:
-    def __init__(self):
+    def __init__(self, client=None, batch_enabled: bool = VISION_BATCH_ENABLED):
+        """
+        Args:
+            client: ImageAnnotatorClient互換のクライアント（省略時は認証情報から作成。スタブ差し替え用）
+            batch_enabled: 複数リクエストをbatch_annotate_imagesでまとめて送るか
+        """
         # ADC（Application Default Credentials）フォールバック対応
         self.credentials_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
         self.project_id = os.getenv("GOOGLE_CLOUD_PROJECT")
 
         # クライアント初期化（ADCフォールバック対応）
-        if self.credentials_path and os.path.exists(self.credentials_path):
+        if client is not None:
+            self.client = client
+        elif self.credentials_path and os.path.exists(self.credentials_path):
             # Service Account認証
             self.credentials = service_account.Credentials.from_service_account_file(self.credentials_path)
             self.client = vision.ImageAnnotatorClient(credentials=self.credentials)
@@ -24,72 +145,145 @@ class VisionApiService:
         
         # スレッドプールエグゼキューター（同期APIを非同期で実行するため）
         self.executor = ThreadPoolExecutor(max_workers=4)
+
+        # ピーク時のリクエストをまとめて送るマイクロバッチャー
+        self.batcher = VisionMicroBatcher(self.client, self.executor) if batch_enabled else None
     
     async def analyze_image(self, image_path: str) -> Dict[str, Any]:
-        """ Vision APIで画像を分析する関数（非同期対応） """
+        """ Vision APIで画像ファイルを分析する関数（analyze_image_bytesの薄いラッパー） """
         
         try:
             # 画像ファイルを読み込む
             with io.open(image_path, 'rb') as image_file:
                 content = image_file.read()
-            
-            # Vision APIの画像オブジェクトを作成
+        except Exception as e:
+            return self._error_result(f"Vision API解析に失敗しました: {str(e)}")
+
+        return await self.analyze_image_bytes(content)
+
+    async def analyze_image_bytes(self, content: Union[bytes, bytearray, memoryview],
+                                  profile: Optional[str] = None,
+                                  features: Optional[List[str]] = None) -> Dict[str, Any]:
+        """ メモリ上の画像データをVision APIで分析する関数（一時ファイル不要）
+
+        Args:
+            content: 画像データ
+            profile: 機能プロファイル名（minimal / standard / full、省略時はVISION_FEATURE_PROFILE）
+            features: 取得する機能のリスト（指定時はprofileより優先）
+        """
+        features = self.resolve_features(profile, features)
+        
+        try:
+            # Vision APIの画像オブジェクトを作成（protobufはbytesのみ受け付ける）
+            if not isinstance(content, bytes):
+                content = bytes(content)
             image = vision.Image(content=content)
 
             # 1回のAPI呼び出しで複数の解析を実行（効率化）
-            loop = asyncio.get_running_loop()  # 3.12対応
-            response = await loop.run_in_executor(
-                self.executor, 
-                self._analyze_image_sync, 
-                image
-            )
+            if self.batcher:
+                # 同時に届いたリクエストとまとめてbatch_annotate_imagesで送信
+                response = await self.batcher.submit(self._build_request(image, features))
+            else:
+                loop = asyncio.get_running_loop()  # 3.12対応
+                response = await loop.run_in_executor(
+                    self.executor, 
+                    self._analyze_image_sync, 
+                    image,
+                    features
+                )
             
             # 結果を整理
             analysis_result = self._parse_response(response)
+            if not analysis_result.get("error"):
+                analysis_result["features"] = features
             
             return analysis_result
         
         except Exception as e:
             # エラーが発生した場合は基本的な情報のみ返す
-            return {
-                "error": f"Vision API解析に失敗しました: {str(e)}",
-                "labels": [],
-                "text": [],
-                "objects": [],
-                "faces": [],
-                "safe_search": {},
-                "colors": [],
-                "analysis_timestamp": datetime.now(timezone.utc).isoformat()
-            }
+            return self._error_result(f"Vision API解析に失敗しました: {str(e)}")
+
+    def resolve_features(self, profile: Optional[str] = None, features: Optional[List[str]] = None) -> List[str]:
+        """プロファイル名または機能リストから取得する機能を決定"""
+        if features:
+            return [f for f in VISION_FEATURES if f in features]
+        if profile not in VISION_FEATURE_PROFILES:
+            if profile:
+                print(f"⚠️ 不明なVision機能プロファイル: {profile}（{VISION_FEATURE_PROFILE}を使用）")
+            profile = VISION_FEATURE_PROFILE if VISION_FEATURE_PROFILE in VISION_FEATURE_PROFILES else "standard"
+        return list(VISION_FEATURE_PROFILES[profile])
+
+    def missing_features(self, analysis: Dict[str, Any], required: List[str]) -> List[str]:
+        """解析結果（またはその要約）に足りない機能（featuresがない古いデータは全機能取得済みとみなす）"""
+        available = analysis.get("features", list(VISION_FEATURES.keys()))
+        return [f for f in required if f in VISION_FEATURES and f not in available]
+
+    async def ensure_features(self, meta_data: Dict[str, Any], required: List[str],
+                              load_image) -> Tuple[Dict[str, Any], bool]:
+        """meta_dataに足りない機能だけを後から解析してマージする
+
+        Args:
+            meta_data: 保存済みの解析結果（featuresがない古いデータは全機能取得済みとみなす）
+            required: 呼び出し側が必要とする機能
+            load_image: 解析する画像データを返す同期関数（必要な場合のみスレッドで呼ぶ）
+
+        Returns:
+            (マージ後のmeta_data, 追加取得したかどうか)
+        """
+        available = meta_data.get("features", list(VISION_FEATURES.keys()))
+        missing = self.missing_features(meta_data, required)
+        if not missing:
+            return meta_data, False
+
+        print(f"Vision機能を追加取得: {missing}")
+        content = await asyncio.to_thread(load_image)
+        extra = await self.analyze_image_bytes(content, features=missing)
+        if extra.get("error"):
+            print(f"⚠️ Vision機能の追加取得に失敗: {extra['error']}")
+            return meta_data, False
+
+        merged = dict(meta_data)
+        for feature in missing:
+            merged[feature] = extra[feature]
+        merged["features"] = [f for f in VISION_FEATURES if f in available or f in missing]
+        return merged, True
+
+    def _error_result(self, message: str) -> Dict[str, Any]:
+        """解析失敗時の結果（空の解析結果＋エラーメッセージ）"""
+        return {
+            "error": message,
+            "labels": [],
+            "text": [],
+            "objects": [],
+            "faces": [],
+            "safe_search": {},
+            "colors": [],
+            "analysis_timestamp": datetime.now(timezone.utc).isoformat()
+        }
     
-    def _analyze_image_sync(self, image: vision.Image) -> vision.AnnotateImageResponse:
+    def _analyze_image_sync(self, image: vision.Image, features: List[str]) -> vision.AnnotateImageResponse:
         """同期版の画像解析（スレッドプールで実行）"""
+        # タイムアウト＆リトライ設定（修正版）
+        return self.client.annotate_image(
+            request=self._build_request(image, features),
+            retry=gretry.Retry(deadline=30.0)  # リトライのみ設定
+        )
+
+    def _build_request(self, image: vision.Image, features: List[str]) -> vision.AnnotateImageRequest:
+        """解析リクエストを作成（指定した機能のみ）"""
         # 言語ヒント付きのImageContext（日本語OCR安定化）
         image_context = vision.ImageContext(
             language_hints=['ja', 'en']
         )
         
-        # 1回のAPI呼び出しで複数の解析を実行
-        features = [
-            vision.Feature(type_=vision.Feature.Type.LABEL_DETECTION, max_results=10),
-            vision.Feature(type_=vision.Feature.Type.DOCUMENT_TEXT_DETECTION),
-            vision.Feature(type_=vision.Feature.Type.OBJECT_LOCALIZATION, max_results=10),
-            vision.Feature(type_=vision.Feature.Type.FACE_DETECTION, max_results=10),
-            vision.Feature(type_=vision.Feature.Type.SAFE_SEARCH_DETECTION),
-            vision.Feature(type_=vision.Feature.Type.IMAGE_PROPERTIES)  # 色情報取得
-        ]
+        # 1回のAPI呼び出しで必要な解析をまとめて実行
+        features = [vision.Feature(**VISION_FEATURES[name]) for name in features]
         
-        request = vision.AnnotateImageRequest(
+        return vision.AnnotateImageRequest(
             image=image, 
             features=features,
             image_context=image_context
         )
-        
-        # タイムアウト＆リトライ設定（修正版）
-        return self.client.annotate_image(
-            request=request,
-            retry=gretry.Retry(deadline=30.0)  # リトライのみ設定
-        )
     
     def _parse_response(self, response: vision.AnnotateImageResponse) -> Dict[str, Any]:
         """APIレスポンスを解析して構造化データに変換"""
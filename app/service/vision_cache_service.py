@@ -0,0 +1,127 @@
+import copy
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, List
+from app.core.config import VISION_CACHE_MAX_ENTRIES, VISION_CACHE_PERSIST
+
+
+class VisionCacheService:
+    """Vision API解析結果をコンテンツハッシュで再利用するキャッシュ
+
+    メモリ上のLRUを先に引き、なければDB（vision_analysis_cache）を引く。
+    エラーを含む解析結果はキャッシュしない。
+    """
+
+    def __init__(self, max_entries: int = VISION_CACHE_MAX_ENTRIES, persist: bool = VISION_CACHE_PERSIST):
+        self.max_entries = max_entries
+        self.persist = persist
+        self._lock = threading.Lock()
+        self._lru: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._stats = {"memory_hits": 0, "db_hits": 0, "misses": 0, "stores": 0}
+        # DB保存はリクエスト処理をブロックしないよう別スレッドで行う
+        self._persist_executor = ThreadPoolExecutor(max_workers=1) if persist else None
+
+    @staticmethod
+    def compute_hash(content: bytes) -> str:
+        """正規化済み画像バイトのSHA-256"""
+        return hashlib.sha256(content).hexdigest()
+
+    @staticmethod
+    def cache_key(content_hash: str, features: List[str]) -> str:
+        """画像ハッシュと取得機能の組み合わせのキー（機能プロファイルが違う結果を混同しない）"""
+        return hashlib.sha256(f"{content_hash}:{','.join(sorted(features))}".encode("utf-8")).hexdigest()
+
+    def get(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        """キャッシュされた解析結果を取得（DB参照を含むため同期。非同期側からはスレッドで呼ぶ）"""
+        with self._lock:
+            cached = self._lru.get(content_hash)
+            if cached is not None:
+                self._lru.move_to_end(content_hash)
+                self._stats["memory_hits"] += 1
+                return copy.deepcopy(cached)
+
+        cached = self._load(content_hash) if self.persist else None
+        with self._lock:
+            if cached is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats["db_hits"] += 1
+            self._remember(content_hash, cached)
+        return copy.deepcopy(cached)
+
+    def put(self, content_hash: str, analysis_result: Dict[str, Any]) -> None:
+        """解析結果を保存（エラー結果は保存しない）"""
+        if analysis_result.get("error"):
+            return
+        result = copy.deepcopy(analysis_result)
+        with self._lock:
+            self._remember(content_hash, result)
+            self._stats["stores"] += 1
+        if self._persist_executor:
+            self._persist_executor.submit(self._save, content_hash, result)
+
+    def _remember(self, content_hash: str, analysis_result: Dict[str, Any]) -> None:
+        """LRUに追加（ロック内で呼ぶ）"""
+        self._lru[content_hash] = analysis_result
+        self._lru.move_to_end(content_hash)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+
+    def _load(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        """DBから解析結果を取得（失敗してもキャッシュミス扱い）"""
+        try:
+            from app.database.supabase_session import SessionLocal
+            from app.models.images.supabase_vision_cache import SupabaseVisionAnalysisCache
+
+            db = SessionLocal()
+            try:
+                row = db.query(SupabaseVisionAnalysisCache).filter(
+                    SupabaseVisionAnalysisCache.content_hash == content_hash
+                ).first()
+                if not row:
+                    return None
+                row.hit_count = (row.hit_count or 0) + 1
+                db.commit()
+                return json.loads(row.analysis_result)
+            finally:
+                db.close()
+        except Exception as e:
+            print(f"⚠️ Vision解析キャッシュ取得エラー: {e}")
+            return None
+
+    def _save(self, content_hash: str, analysis_result: Dict[str, Any]) -> None:
+        """解析結果をDBに保存（既にあれば上書き）"""
+        try:
+            from app.database.supabase_session import SessionLocal
+            from app.models.images.supabase_vision_cache import SupabaseVisionAnalysisCache
+
+            db = SessionLocal()
+            try:
+                row = db.query(SupabaseVisionAnalysisCache).filter(
+                    SupabaseVisionAnalysisCache.content_hash == content_hash
+                ).first()
+                payload = json.dumps(analysis_result, ensure_ascii=False)
+                if row:
+                    row.analysis_result = payload
+                else:
+                    db.add(SupabaseVisionAnalysisCache(content_hash=content_hash, analysis_result=payload, hit_count=0))
+                db.commit()
+            finally:
+                db.close()
+        except Exception as e:
+            print(f"⚠️ Vision解析キャッシュ保存エラー: {e}")
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """ヒット率などの統計"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._lru)
+        lookups = stats["memory_hits"] + stats["db_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["db_hits"]) / lookups, 3) if lookups else 0.0
+        return stats
+
+# シングルトンインスタンス
+vision_cache_service = VisionCacheService()
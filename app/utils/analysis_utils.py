@@ -0,0 +1,87 @@
+"""
+画像解析結果（meta_data）に関するユーティリティ関数
+"""
+from typing import Dict, Any, List, Optional
+
+# meta_dataに残すテキスト検出結果の件数
+META_TEXT_LIMIT = 5
+
+
+def build_derived_features(analysis_result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    解析結果から物語設定の推定に必要な要約を作成する
+    
+    Args:
+        analysis_result: Vision API解析結果（＋色・性別）
+    
+    Returns:
+        labels / objects（名前のみ）、face_count、text_hint、colors、gender、features を持つ辞書
+    """
+    labels = [
+        label["description"] if isinstance(label, dict) else str(label)
+        for label in analysis_result.get("labels", [])
+        if isinstance(label, (dict, str)) and (not isinstance(label, dict) or "description" in label)
+    ]
+    objects = [
+        obj["name"] if isinstance(obj, dict) else str(obj)
+        for obj in analysis_result.get("objects", [])
+        if isinstance(obj, (dict, str)) and (not isinstance(obj, dict) or "name" in obj)
+    ]
+
+    derived = {
+        "labels": labels[:10],
+        "objects": objects[:20],
+        "face_count": len(analysis_result.get("faces", []) or []),
+        "text_hint": extract_text_hint(analysis_result),
+        "colors": [c.get("rgb") for c in analysis_result.get("colors", [])[:5] if isinstance(c, dict)],
+        "gender": analysis_result.get("gender"),
+    }
+    if "features" in analysis_result:
+        derived["features"] = analysis_result["features"]
+    if analysis_result.get("error"):
+        derived["error"] = analysis_result["error"]
+    return derived
+
+
+def extract_text_hint(analysis_result: Dict[str, Any]) -> Optional[str]:
+    """最初のテキスト検出結果（物語設定の主人公名候補と同じもの）"""
+    for text in analysis_result.get("text", []) or []:
+        if isinstance(text, str):
+            return text[:255]
+        if isinstance(text, dict) and "description" in text:
+            return str(text["description"])[:255]
+    return None
+
+
+def derived_features_to_analysis(derived: Dict[str, Any]) -> Dict[str, Any]:
+    """要約を generate_story_setting_from_analysis が受け付ける形に変換"""
+    return {
+        "labels": derived.get("labels", []),
+        "objects": derived.get("objects", []),
+        "text": [derived["text_hint"]] if derived.get("text_hint") else [],
+        "face_count": derived.get("face_count", 0),
+        "gender": derived.get("gender"),
+    }
+
+
+def trim_analysis_for_meta(analysis_result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    meta_dataに保存する解析結果を軽量化する（キーは変えない）
+    
+    テキスト検出結果は先頭数件に絞り、テキスト・オブジェクト・顔のバウンディングボックスを除く。
+    解析結果全体はGCSに保存する（raw_analysis_path）。
+    """
+    trimmed = dict(analysis_result)
+    trimmed["text"] = _without_bounding_poly((analysis_result.get("text", []) or [])[:META_TEXT_LIMIT])
+    for key in ("objects", "faces"):
+        if key in analysis_result:
+            trimmed[key] = _without_bounding_poly(analysis_result.get(key) or [])
+    return trimmed
+
+
+def _without_bounding_poly(items: List[Any]) -> List[Any]:
+    """検出結果のリストからバウンディングボックスを除く"""
+    return [
+        {k: v for k, v in item.items() if k != "bounding_poly"} if isinstance(item, dict) else item
+        for item in items
+    ]
@@ -0,0 +1,77 @@
+"""
+色情報に関するユーティリティ関数
+"""
+import io
+from typing import List, Dict, Any
+import numpy as np
+from PIL import Image
+from app.core.config import DOMINANT_COLOR_SAMPLE_SIDE
+
+
+def extract_dominant_colors(image_data: bytes, max_colors: int = 8,
+                            sample_side: int = DOMINANT_COLOR_SAMPLE_SIDE, iterations: int = 10) -> List[Dict[str, Any]]:
+    """
+    画像の主要な色をk-meansで抽出する（Vision APIのIMAGE_PROPERTIESの代替）
+    
+    縮小した画像の画素をNumPy配列にしてまとめてクラスタリングする。
+    透明な画素（レターボックスの余白など）は除外する。
+    
+    Args:
+        image_data: 画像のバイトデータ
+        max_colors: 抽出する色の最大数
+        sample_side: クラスタリング前に縮小する長辺のピクセル数
+        iterations: k-meansの最大反復回数
+    
+    Returns:
+        Vision APIと同じ形式の色情報（rgb, score, pixel_fraction）のリスト（割合の大きい順）
+    """
+    try:
+        image = Image.open(io.BytesIO(image_data))
+        if image.format == 'JPEG':
+            image.draft('RGB', (sample_side, sample_side))
+        image.thumbnail((sample_side, sample_side), Image.Resampling.BILINEAR)
+
+        pixels = np.asarray(image.convert('RGBA')).reshape(-1, 4)
+        pixels = pixels[pixels[:, 3] > 0][:, :3].astype(np.float32)
+        if len(pixels) == 0:
+            return []
+
+        # 初期値は明るさ順に並べた画素から等間隔に選ぶ（毎回同じ結果になるように）
+        k = min(max_colors, len(pixels))
+        luminance_order = np.argsort(pixels @ np.array([0.299, 0.587, 0.114], dtype=np.float32))
+        centers = pixels[luminance_order[np.linspace(0, len(pixels) - 1, k).astype(int)]]
+
+        for _ in range(iterations):
+            distances = ((pixels[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2)
+            assignments = distances.argmin(axis=1)
+            counts = np.bincount(assignments, minlength=k)
+            sums = np.zeros_like(centers)
+            np.add.at(sums, assignments, pixels)
+            # 画素が割り当てられなかったクラスタは元の中心を維持
+            new_centers = np.where(counts[:, None] > 0, sums / np.maximum(counts, 1)[:, None], centers)
+            converged = np.abs(new_centers - centers).max() < 0.5
+            centers = new_centers
+            if converged:
+                break
+
+        assignments = ((pixels[:, None, :] - centers[None, :, :]) ** 2).sum(axis=2).argmin(axis=1)
+        counts = np.bincount(assignments, minlength=k)
+        total = float(counts.sum())
+
+        colors = []
+        for index in np.argsort(-counts):
+            if counts[index] == 0:
+                continue
+            fraction = float(counts[index] / total)
+            r, g, b = (int(round(float(v))) for v in centers[index])
+            colors.append({
+                "rgb": {"r": r, "g": g, "b": b},
+                # Visionのscore（顕著度）は再現できないため画素の割合を使う
+                "score": fraction,
+                "pixel_fraction": fraction
+            })
+        return colors
+
+    except Exception as e:
+        print(f"色抽出エラー: {str(e)}")
+        return []
@@ -2,7 +2,21 @@
 画像処理に関するユーティリティ関数
 """
 import io
+from typing import Optional, Tuple
 from PIL import Image, ImageOps
+from app.core.config import (
+    VISION_ANALYSIS_MAX_SIDE, VISION_ANALYSIS_JPEG_QUALITY,
+    UPLOAD_IMAGE_FORMAT, UPLOAD_PNG_COMPRESS_LEVEL, UPLOAD_WEBP_QUALITY, MAX_IMAGE_PIXELS,
+)
+
+# ヘッダー検査をすり抜けた画像もデコード時に弾く（プロセスプールのワーカーにも適用される）
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+# 保存用画像の出力形式ごとの拡張子とContent-Type
+UPLOAD_FORMATS = {
+    "png": {"extension": "png", "content_type": "image/png"},
+    "webp": {"extension": "webp", "content_type": "image/webp"},
+}
 
 
 def resize_image_to_fixed_size(image_data: bytes, target_width: int = 1920, target_height: int = 1080) -> bytes:
@@ -15,61 +29,154 @@ def resize_image_to_fixed_size(image_data: bytes, target_width: int = 1920, targ
         target_height: 目標高さ
     
     Returns:
-        リサイズされた画像のバイトデータ
+        リサイズされた画像のバイトデータ（形式はUPLOAD_IMAGE_FORMAT）
+    """
+    result_data, _ = render_upload_image(image_data, target_width, target_height)
+    return result_data
+
+
+def render_upload_image(image_data: bytes, target_width: int = 1920, target_height: int = 1080,
+                        output_format: str = UPLOAD_IMAGE_FORMAT) -> Tuple[bytes, dict]:
+    """
+    保存用の固定サイズ画像を作成する（縦横比保持、余白は透明）
+    
+    フル解像度でのデコードとリサンプリングを避けるため、
+    - JPEGは draft で目標サイズに近い縮尺でデコードする
+    - それ以外は reducing_gap で整数倍の縮小（reduce）をしてからLANCZOSをかける
+    - 透過のない画像はRGBのままリサイズし、余白がない場合はRGBのまま保存する
+    プロセスプールから呼ぶため、引数と戻り値はpickle可能な値だけにしている。
+    
+    Args:
+        image_data: 元画像のバイトデータ
+        target_width: 目標幅
+        target_height: 目標高さ
+        output_format: 出力形式（png / webp）
+    
+    Returns:
+        (リサイズされた画像のバイトデータ, 出力形式・サイズなどの情報)。失敗時は (元のバイトデータ, {})
     """
     try:
-        print(f"画像リサイズ開始: 目標サイズ {target_width} x {target_height}")
-        print(f"入力データサイズ: {len(image_data)} bytes")
-        
-        # 画像を開く
+        output = UPLOAD_FORMATS.get(output_format)
+        if output is None:
+            print(f"⚠️ 未対応の出力形式のためPNGにします: {output_format}")
+            output_format, output = "png", UPLOAD_FORMATS["png"]
+
         image = Image.open(io.BytesIO(image_data))
-        print(f"元画像サイズ: {image.width} x {image.height}")
-        print(f"元画像形式: {image.format}, モード: {image.mode}")
-        
-        # RGBAモードに変換（透明背景のため）
-        if image.mode != 'RGBA':
-            image = image.convert('RGBA')
-        
-        # 元画像の縦横比を計算
+        source_size = image.size
+
+        # 縦横比を保持してリサイズするサイズを計算
         original_ratio = image.width / image.height
         target_ratio = target_width / target_height
-        
-        # 縦横比を保持してリサイズするサイズを計算
         if original_ratio > target_ratio:
-            # 元画像が横長の場合、幅を基準にリサイズ
             new_width = target_width
-            new_height = int(target_width / original_ratio)
+            new_height = max(1, int(target_width / original_ratio))
         else:
-            # 元画像が縦長の場合、高さを基準にリサイズ
             new_height = target_height
-            new_width = int(target_height * original_ratio)
-        
-        # 画像をリサイズ（高品質なリサンプリングを使用）
-        resized_image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-        
-        # 透明背景の新しいキャンバスを作成
-        canvas = Image.new('RGBA', (target_width, target_height), (0, 0, 0, 0))
-        
-        # リサイズした画像を中央に配置
+            new_width = max(1, int(target_height * original_ratio))
+
+        # JPEGはデコード時に縮小（縮尺は new_width x new_height 以上で最も小さいもの）
+        if image.format == 'JPEG':
+            image.draft('RGB', (new_width, new_height))
+
+        # 透過のある画像だけRGBAにする
+        has_alpha = image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info)
+        mode = 'RGBA' if has_alpha else 'RGB'
+        if image.mode != mode:
+            image = image.convert(mode)
+
+        # 縮小時は reduce で粗く縮めてからLANCZOS（拡大時は reducing_gap は効かない）
+        resized_image = image.resize((new_width, new_height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+        # 余白がなく透過もなければキャンバスへの合成を省く
         x_offset = (target_width - new_width) // 2
         y_offset = (target_height - new_height) // 2
-        canvas.paste(resized_image, (x_offset, y_offset), resized_image)
-        
-        # バイトデータに変換（PNG形式で透明背景を保持）
+        if (new_width, new_height) == (target_width, target_height):
+            canvas = resized_image
+        else:
+            canvas = Image.new('RGBA', (target_width, target_height), (0, 0, 0, 0))
+            canvas.paste(resized_image, (x_offset, y_offset))
+
         output_buffer = io.BytesIO()
-        canvas.save(output_buffer, format='PNG', optimize=True)
-        
+        if output_format == "webp":
+            canvas.save(output_buffer, format='WEBP', quality=UPLOAD_WEBP_QUALITY, method=4)
+        else:
+            # optimize=True は全圧縮設定を試すため遅い。圧縮レベルを固定する
+            canvas.save(output_buffer, format='PNG', compress_level=UPLOAD_PNG_COMPRESS_LEVEL)
         result_data = output_buffer.getvalue()
-        print(f"リサイズ完了: 出力サイズ {len(result_data)} bytes")
-        print(f"最終画像サイズ: {canvas.width} x {canvas.height}")
-        print(f"配置位置: x={x_offset}, y={y_offset}")
-        
-        return result_data
-        
+
+        render_info = {
+            "source_width": source_size[0],
+            "source_height": source_size[1],
+            "width": canvas.width,
+            "height": canvas.height,
+            "offset": [x_offset, y_offset],
+            "mode": canvas.mode,
+            "size_bytes": len(result_data),
+            "format": output_format,
+            "extension": output["extension"],
+            "content_type": output["content_type"],
+        }
+        return result_data, render_info
+
     except Exception as e:
         print(f"画像リサイズエラー: {str(e)}")
         # エラーの場合は元の画像データをそのまま返す
-        return image_data
+        return image_data, {}
+
+
+def create_analysis_rendition(image_data: bytes, max_side: int = VISION_ANALYSIS_MAX_SIDE,
+                              quality: int = VISION_ANALYSIS_JPEG_QUALITY) -> Tuple[Optional[bytes], dict]:
+    """
+    Vision API解析用の縮小画像を作成する（保存用の1920x1080 PNGとは別）
+    
+    元画像から作るため余白（レターボックス）は含まれない。
+    透過部分は白背景に合成し、長辺max_side以下のRGB JPEGにする。
+    
+    Args:
+        image_data: 元画像のバイトデータ（リサイズ前）
+        max_side: 長辺の最大ピクセル数
+        quality: JPEGの品質
+    
+    Returns:
+        (解析用画像のバイトデータ, 元画像と解析用画像のサイズ情報)。失敗時は (None, {})
+    """
+    try:
+        image = Image.open(io.BytesIO(image_data))
+        source_size = image.size
+
+        # JPEGはデコード時に縮小（フル解像度のデコードを避ける）
+        if image.format == 'JPEG':
+            image.draft('RGB', (max_side, max_side))
+
+        # 透過画像は白背景に合成してRGBにする
+        if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+
+        # 縦横比を保持して長辺をmax_side以下に縮小
+        image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+
+        output_buffer = io.BytesIO()
+        image.save(output_buffer, format='JPEG', quality=quality)
+        result_data = output_buffer.getvalue()
+
+        rendition_info = {
+            "source_width": source_size[0],
+            "source_height": source_size[1],
+            "width": image.width,
+            "height": image.height,
+            "size_bytes": len(result_data),
+            "format": "JPEG"
+        }
+        return result_data, rendition_info
+
+    except Exception as e:
+        print(f"解析用画像作成エラー: {str(e)}")
+        return None, {}
 
 
 def get_image_info(image_data: bytes) -> dict:
@@ -0,0 +1,140 @@
+"""
+画像処理のメモリ使用量（推定バイト数）を制限するバジェット
+"""
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional
+from fastapi import HTTPException, status
+from app.core.config import MEMORY_BUDGET_MB, MEMORY_BUDGET_MAX_WAIT_SECONDS
+
+# 保存用画像のキャンバス（1920x1080 RGBA）
+CANVAS_BYTES = 1920 * 1080 * 4
+
+
+class MemoryBudgetExceeded(Exception):
+    """待ち時間内にバジェットを確保できなかった場合の例外（503で返す）"""
+
+    def __init__(self, stage: str, nbytes: int, retry_after: int):
+        super().__init__(f"メモリバジェットを確保できませんでした: {stage} ({nbytes} bytes)")
+        self.stage = stage
+        self.nbytes = nbytes
+        self.retry_after = retry_after
+
+
+class ByteBudget:
+    """処理中の画像データの推定バイト数の合計を capacity 以下に抑える非同期セマフォ
+
+    各ステージは実行前に推定メモリ量を確保し、終わったら返す。
+    空きがなければ確保できるまで待ち、max_wait_seconds を超えたら MemoryBudgetExceeded を送出する。
+    capacity より大きい確保は capacity に切り詰める（他に何も実行していなければ単独で実行できる）。
+    """
+
+    def __init__(self, capacity_bytes: int, max_wait_seconds: float):
+        self.capacity = capacity_bytes
+        self.max_wait_seconds = max_wait_seconds
+        self.in_use = 0
+        self._condition = asyncio.Condition()
+        self._stats = {
+            "acquired": 0,
+            "queued": 0,
+            "rejected": 0,
+            "waiting": 0,
+            "peak_waiting": 0,
+            "peak_in_use": 0,
+            "total_wait_seconds": 0.0,
+            "max_wait_seconds": 0.0,
+        }
+        self._stage_stats: Dict[str, Dict[str, Any]] = {}
+
+    @asynccontextmanager
+    async def reserve(self, nbytes: int, stage: str):
+        """推定メモリ量を確保してブロックを実行（ステージをまたいで入れ子にしないこと）"""
+        nbytes = max(0, min(int(nbytes), self.capacity))
+        await self.acquire(nbytes, stage)
+        try:
+            yield
+        finally:
+            await self.release(nbytes)
+
+    async def acquire(self, nbytes: int, stage: str) -> None:
+        start_time = time.monotonic()
+        async with self._condition:
+            if self.in_use + nbytes > self.capacity:
+                self._stats["queued"] += 1
+                self._stats["waiting"] += 1
+                self._stats["peak_waiting"] = max(self._stats["peak_waiting"], self._stats["waiting"])
+                try:
+                    await asyncio.wait_for(
+                        self._condition.wait_for(lambda: self.in_use + nbytes <= self.capacity),
+                        timeout=self.max_wait_seconds,
+                    )
+                except asyncio.TimeoutError:
+                    self._stats["rejected"] += 1
+                    self._stage(stage)["rejected"] += 1
+                    raise MemoryBudgetExceeded(stage, nbytes, self._retry_after())
+                finally:
+                    self._stats["waiting"] -= 1
+
+            self.in_use += nbytes
+            waited = time.monotonic() - start_time
+            self._stats["acquired"] += 1
+            self._stats["peak_in_use"] = max(self._stats["peak_in_use"], self.in_use)
+            self._stats["total_wait_seconds"] += waited
+            self._stats["max_wait_seconds"] = max(self._stats["max_wait_seconds"], waited)
+            stage_stats = self._stage(stage)
+            stage_stats["acquired"] += 1
+            stage_stats["bytes"] += nbytes
+
+    async def release(self, nbytes: int) -> None:
+        async with self._condition:
+            self.in_use -= nbytes
+            self._condition.notify_all()
+
+    def _stage(self, stage: str) -> Dict[str, Any]:
+        return self._stage_stats.setdefault(stage, {"acquired": 0, "rejected": 0, "bytes": 0})
+
+    def _retry_after(self) -> int:
+        """Retry-Afterの秒数（待ち時間の上限を目安にする）"""
+        return max(1, int(round(self.max_wait_seconds)))
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """使用量・ピーク・待ち行列の統計"""
+        stats = dict(self._stats)
+        acquired = stats["acquired"]
+        stats.update({
+            "capacity_bytes": self.capacity,
+            "in_use_bytes": self.in_use,
+            "peak_in_use_bytes": stats.pop("peak_in_use"),
+            "avg_wait_seconds": round(stats["total_wait_seconds"] / acquired, 4) if acquired else 0.0,
+            "total_wait_seconds": round(stats["total_wait_seconds"], 3),
+            "max_wait_seconds": round(stats["max_wait_seconds"], 3),
+            "stages": {name: dict(values) for name, values in self._stage_stats.items()},
+        })
+        return stats
+
+
+def estimate_image_cost(encoded_bytes: int, width: Optional[int] = None, height: Optional[int] = None) -> int:
+    """画像1枚の処理に必要なメモリの推定値
+
+    元データ＋デコード後のRGBAビットマップ＋保存用キャンバス＋エンコード結果。
+    ヘッダーから解像度が読めなかった場合は圧縮率を10倍と仮定する。
+    """
+    decoded = width * height * 4 if width and height else encoded_bytes * 10
+    return encoded_bytes * 2 + decoded + CANVAS_BYTES
+
+
+# 画像生成1ページあたりの推定（参照画像と生成画像。1920x1080、エンコード後数MBを想定）
+GENERATION_COST = 2 * (4 * 1024 * 1024) + 2 * CANVAS_BYTES
+
+
+def budget_http_exception(error: MemoryBudgetExceeded) -> HTTPException:
+    """バジェット超過を503（Retry-After付き）に変換"""
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="サーバーが混み合っています。しばらくしてから再度お試しください。",
+        headers={"Retry-After": str(error.retry_after)},
+    )
+
+# シングルトンインスタンス（アップロード・リサイズ・Vision・画像生成で共有）
+memory_budget = ByteBudget(MEMORY_BUDGET_MB * 1024 * 1024, MEMORY_BUDGET_MAX_WAIT_SECONDS)
@@ -0,0 +1,178 @@
+"""
+アップロードファイルの読み込みに関するユーティリティ関数
+"""
+import struct
+from typing import Optional, Tuple
+from fastapi import UploadFile
+from app.core.config import UPLOAD_READ_CHUNK_SIZE, MAX_IMAGE_PIXELS
+
+# マジックバイトで判定する画像形式とContent-Type
+IMAGE_CONTENT_TYPES = {
+    "jpeg": "image/jpeg",
+    "png": "image/png",
+    "webp": "image/webp",
+}
+
+# 形式の判定に必要な先頭バイト数（WEBPの "RIFF....WEBP"）
+MAGIC_BYTES_LENGTH = 12
+
+# 画像サイズを探すヘッダー部分の上限（JPEGはEXIFなどの後ろにSOFがある）
+HEADER_SNIFF_LIMIT = 128 * 1024
+
+# JPEGの画像サイズを持つSOFマーカー（DHT=C4, JPG=C8, DAC=CC を除く）
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+class UploadRejectedError(Exception):
+    """アップロードを受け付けられない場合の例外（status_codeはHTTPレスポンスにそのまま使う）"""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.message = message
+
+
+def sniff_image_format(head: bytes) -> Optional[str]:
+    """先頭のマジックバイトから画像形式を判定（jpeg / png / webp、不明ならNone）"""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if len(head) >= 12 and head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def sniff_image_size(head: bytes, image_format: str) -> Optional[Tuple[int, int]]:
+    """ヘッダーから画像の幅・高さを読む（デコードはしない。データが足りなければNone）"""
+    try:
+        if image_format == "png":
+            # シグネチャ(8) + IHDR長さ(4) + "IHDR"(4) + 幅(4) + 高さ(4)
+            if len(head) < 24 or head[12:16] != b"IHDR":
+                return None
+            return struct.unpack(">II", head[16:24])
+        if image_format == "webp":
+            return _sniff_webp_size(head)
+        if image_format == "jpeg":
+            return _sniff_jpeg_size(head)
+    except struct.error:
+        return None
+    return None
+
+
+def _sniff_webp_size(head: bytes) -> Optional[Tuple[int, int]]:
+    if len(head) < 30:
+        return None
+    chunk = head[12:16]
+    if chunk == b"VP8X":
+        # キャンバスサイズ（24bit、1を引いた値）
+        width = int.from_bytes(head[24:27], "little") + 1
+        height = int.from_bytes(head[27:30], "little") + 1
+        return width, height
+    if chunk == b"VP8L":
+        bits = int.from_bytes(head[21:25], "little")
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8 ":
+        width, height = struct.unpack("<HH", head[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    return None
+
+
+def _sniff_jpeg_size(head: bytes) -> Optional[Tuple[int, int]]:
+    """JPEGのマーカーを順にたどってSOFセグメントの幅・高さを読む（EXIFなどは読み飛ばす）"""
+    offset = 2
+    while offset + 4 <= len(head):
+        if head[offset] != 0xFF:
+            return None
+        marker = head[offset + 1]
+        # 詰め物のFFとデータを持たないマーカー
+        if marker == 0xFF:
+            offset += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            offset += 2
+            continue
+        segment_length = struct.unpack(">H", head[offset + 2:offset + 4])[0]
+        if marker in _JPEG_SOF_MARKERS:
+            if offset + 9 > len(head):
+                return None
+            height, width = struct.unpack(">HH", head[offset + 5:offset + 9])
+            return width, height
+        offset += 2 + segment_length
+    return None
+
+
+def check_image_header(head: bytes, max_pixels: int = MAX_IMAGE_PIXELS) -> Tuple[Optional[str], Optional[Tuple[int, int]]]:
+    """マジックバイトと画像サイズを検査（デコード前に展開爆弾を弾く）
+
+    Returns:
+        (画像形式, (幅, 高さ))。形式・サイズがまだ読めない場合はそれぞれNone
+    Raises:
+        UploadRejectedError: 画像でない、またはピクセル数が上限を超える場合
+    """
+    image_format = sniff_image_format(head)
+    if image_format is None and len(head) < MAGIC_BYTES_LENGTH:
+        return None, None
+    if image_format is None:
+        raise UploadRejectedError(400, "画像ファイルとして認識できません（JPEG / PNG / WEBPのみ対応）")
+
+    size = sniff_image_size(head, image_format)
+    if size is not None:
+        width, height = size
+        if width <= 0 or height <= 0:
+            raise UploadRejectedError(400, "画像サイズが不正です")
+        if width * height > max_pixels:
+            raise UploadRejectedError(
+                413, f"画像の解像度が大きすぎます（{width}x{height}）。最大{max_pixels}ピクセルまでです。"
+            )
+    return image_format, size
+
+
+async def read_upload_limited(file: UploadFile, max_size: int, chunk_size: int = UPLOAD_READ_CHUNK_SIZE,
+                              max_pixels: int = MAX_IMAGE_PIXELS) -> Tuple[bytes, dict]:
+    """アップロードファイルを上限付きでチャンクごとに読み込む
+
+    Starlette はハンドラ実行前にアップロードを一時ファイル（一定サイズ以上はディスク）に書き出しているため、
+    ここでは file.read() で全体をメモリに載せず、max_size を超えた時点で読み込みを打ち切る。
+    先頭チャンクでマジックバイトを、ヘッダーが揃った時点で画像サイズを検査する。
+
+    Returns:
+        (ファイル内容, {"format", "content_type", "width", "height"})
+    Raises:
+        UploadRejectedError: サイズ超過・画像でない・ピクセル数超過の場合
+    """
+    too_large = UploadRejectedError(413, f"ファイルサイズが大きすぎます。最大{max_size // (1024*1024)}MBまでです。")
+
+    # マルチパート解析時にサイズが分かっていれば読む前に弾く
+    if file.size is not None and file.size > max_size:
+        raise too_large
+
+    chunks = []
+    total_size = 0
+    head = b""
+    image_format, size = None, None
+    while True:
+        chunk = await file.read(chunk_size)
+        if not chunk:
+            break
+        total_size += len(chunk)
+        if total_size > max_size:
+            raise too_large
+        chunks.append(chunk)
+
+        # 画像サイズが読めるまでヘッダー部分だけを検査
+        if size is None and len(head) < HEADER_SNIFF_LIMIT:
+            head += chunk
+            image_format, size = check_image_header(head, max_pixels)
+
+    if not chunks:
+        raise UploadRejectedError(400, "ファイルが空です")
+    if image_format is None:
+        raise UploadRejectedError(400, "画像ファイルとして認識できません（JPEG / PNG / WEBPのみ対応）")
+
+    return b"".join(chunks), {
+        "format": image_format,
+        "content_type": IMAGE_CONTENT_TYPES[image_format],
+        "width": size[0] if size else None,
+        "height": size[1] if size else None,
+    }
@@ -0,0 +1,62 @@
+"""
+CPU負荷の高い処理を実行するプロセスプール
+"""
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+from app.core.config import WORKER_POOL_SIZE, WORKER_POOL_START_METHOD
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_mp_context():
+    """ワーカーの起動方式（親のスレッドやロックを複製しないforkserver、使えない環境ではspawn）"""
+    method = WORKER_POOL_START_METHOD
+    if method not in multiprocessing.get_all_start_methods():
+        print(f"⚠️ この環境では起動方式 {method} を使えないため spawn を使用します")
+        method = "spawn"
+    return multiprocessing.get_context(method)
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """プロセスプールを取得（初回に作成）"""
+    global _process_pool
+    with _pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(max_workers=WORKER_POOL_SIZE, mp_context=_get_mp_context())
+        return _process_pool
+
+
+def _reset_process_pool() -> None:
+    """壊れたプロセスプールを破棄（次回呼び出し時に作り直す）"""
+    global _process_pool
+    with _pool_lock:
+        if _process_pool is not None:
+            _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+
+
+async def run_in_process(func: Callable, *args: Any) -> Any:
+    """関数をプロセスプールで実行（GILを避けるため。引数と戻り値はpickle可能であること）
+
+    プールが使えない場合はスレッドで実行する。
+    """
+    if WORKER_POOL_SIZE <= 0:
+        return await asyncio.to_thread(func, *args)
+
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(get_process_pool(), func, *args)
+    except BrokenProcessPool as e:
+        print(f"⚠️ プロセスプールが停止したためスレッドで実行します: {e}")
+        _reset_process_pool()
+        return await asyncio.to_thread(func, *args)
+
+
+def shutdown_process_pool() -> None:
+    """アプリ終了時にプロセスプールを停止"""
+    _reset_process_pool()
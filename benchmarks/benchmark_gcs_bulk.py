@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+GCS一括アップロード・削除のベンチマーク（同期クライアントで1件ずつ vs 非同期クライアントで並行）
+
+ローカルのGCSエミュレータ（fake-gcs-serverなど）に対して、google-cloud-storage の同期クライアントで
+1件ずつ処理した場合と、AsyncGCSStorageService の upload_many / delete_many の処理速度（objects/s）を比較します。
+STORAGE_EMULATOR_HOST を設定して実行してください（バケットが無い場合は作成します）。
+
+使用方法:
+STORAGE_EMULATOR_HOST=http://localhost:4443 python benchmarks/benchmark_gcs_bulk.py
+STORAGE_EMULATOR_HOST=http://localhost:4443 python benchmarks/benchmark_gcs_bulk.py --objects 500 --size-kb 256 --concurrency 32
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.auth.credentials import AnonymousCredentials
+from google.cloud import storage
+
+from app.service.async_gcs_storage_service import AsyncGCSStorageService
+
+
+def rate(count, seconds):
+    return round(count / seconds, 1) if seconds else None
+
+
+def run_sync_client(bucket, names, payload):
+    """同期クライアントで1件ずつアップロード・削除（変更前の GCSStorageService と同じ呼び方）"""
+    start_time = time.perf_counter()
+    for name in names:
+        bucket.blob(name).upload_from_string(payload, content_type="application/octet-stream")
+    upload_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    for blob in bucket.list_blobs(prefix=os.path.dirname(names[0]) + "/"):
+        blob.delete()
+    delete_time = time.perf_counter() - start_time
+    return upload_time, delete_time
+
+
+def run_async_client(service, names, payload):
+    """非同期クライアントで並行アップロード・一括削除"""
+    items = [{"gcs_path": name, "content": payload, "content_type": "application/octet-stream"} for name in names]
+
+    start_time = time.perf_counter()
+    results = service.upload_many_sync(items)
+    upload_time = time.perf_counter() - start_time
+    failed = [result for result in results if not result["success"]]
+    if failed:
+        print(f"⚠️ アップロード失敗: {len(failed)}件 {failed[:3]}")
+
+    start_time = time.perf_counter()
+    result = service.delete_prefix_sync(os.path.dirname(names[0]) + "/")
+    delete_time = time.perf_counter() - start_time
+    if result["failed"]:
+        print(f"⚠️ 削除失敗: {len(result['failed'])}件 {result['failed'][:3]}")
+    return upload_time, delete_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GCS一括アップロード・削除の処理速度比較（エミュレータ使用）")
+    parser.add_argument("--bucket", default="benchmark-bucket")
+    parser.add_argument("--objects", type=int, default=200, help="オブジェクト数")
+    parser.add_argument("--size-kb", type=int, default=128, help="1オブジェクトのサイズ（KB）")
+    parser.add_argument("--concurrency", type=int, default=16, help="非同期クライアントの同時実行数")
+    args = parser.parse_args()
+
+    emulator_host = os.getenv("STORAGE_EMULATOR_HOST")
+    if not emulator_host:
+        print("STORAGE_EMULATOR_HOST を設定してください（例: http://localhost:4443）")
+        sys.exit(1)
+
+    sync_client = storage.Client(project="benchmark", credentials=AnonymousCredentials())
+    bucket = sync_client.bucket(args.bucket)
+    if not bucket.exists():
+        bucket = sync_client.create_bucket(args.bucket)
+
+    service = AsyncGCSStorageService(bucket_name=args.bucket, emulator_host=emulator_host,
+                                     max_concurrency=args.concurrency)
+    payload = os.urandom(args.size_kb * 1024)
+    run_id = uuid.uuid4().hex[:8]
+
+    try:
+        sync_names = [f"benchmark/{run_id}/sync/{i:06d}.bin" for i in range(args.objects)]
+        sync_upload, sync_delete = run_sync_client(bucket, sync_names, payload)
+
+        async_names = [f"benchmark/{run_id}/async/{i:06d}.bin" for i in range(args.objects)]
+        async_upload, async_delete = run_async_client(service, async_names, payload)
+    finally:
+        service.shutdown()
+
+    summary = {
+        "objects": args.objects,
+        "size_kb": args.size_kb,
+        "concurrency": args.concurrency,
+        "sync_upload_objects_per_sec": rate(args.objects, sync_upload),
+        "async_upload_objects_per_sec": rate(args.objects, async_upload),
+        "upload_speedup": round(sync_upload / async_upload, 2) if async_upload else None,
+        "sync_delete_objects_per_sec": rate(args.objects, sync_delete),
+        "async_delete_objects_per_sec": rate(args.objects, async_delete),
+        "delete_speedup": round(sync_delete / async_delete, 2) if async_delete else None,
+    }
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+物語設定の推定ルールのベンチマーク（従来のif/elif判定 vs コンパイル済みルール表）
+
+1. 固定シードで作ったコーパスで、ルール表の結果が従来の判定と完全に一致することを確認
+2. ラベル・オブジェクト数の多い入力で1件あたりの判定時間を比較
+
+使用方法:
+python benchmarks/benchmark_story_setting_rules.py
+python benchmarks/benchmark_story_setting_rules.py --corpus 20000 --large-size 500
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.service.story_setting_rules import story_setting_rule_index
+
+DRAWING_LABELS = ["cartoon", "animation", "animated cartoon", "fictional character", "toy", "drawing", "art", "illustration"]
+CARTOON_LABELS = ["cartoon", "animation", "animated cartoon", "fictional character", "toy"]
+ANIMAL_OBJECTS = ["animal", "cat", "dog", "bird", "fish", "bear", "rabbit", "mouse", "lion", "tiger", "elephant", "monkey", "panda", "fox", "wolf", "deer", "horse", "cow", "pig", "sheep", "goat", "duck", "chicken", "frog", "turtle", "snake", "butterfly", "bee", "spider"]
+VEHICLE_OBJECTS = ["robot", "machine", "vehicle", "car", "truck", "airplane", "helicopter", "boat", "ship", "train", "bicycle", "motorcycle"]
+PLACE_OBJECTS = ["house", "home", "forest", "tree", "sea", "ocean", "mountain", "hill"]
+NOISE = ["sky", "smile", "person", "grass", "cloud", "water", "font", "pattern", "happy", "fun", "child", "play"]
+
+
+def legacy_infer(labels, objects, face_count, gender):
+    """ルール表導入前の判定ロジック（比較用にそのまま残したもの）"""
+    protagonist_type = "子供"
+    has_human_face = face_count > 0
+    lower_labels = [l.lower() for l in labels]
+    has_human_face_or_drawing = (
+        has_human_face or
+        any(k in lower_labels for k in DRAWING_LABELS)
+    )
+    if has_human_face_or_drawing and gender in ["男の子", "女の子"]:
+        protagonist_type = gender
+
+    if any(k in lower_labels for k in ["cat", "dog", "animal"]):
+        protagonist_type = "動物"
+    elif any(k in lower_labels for k in ["robot", "machine"]):
+        protagonist_type = "ロボット"
+
+    lower_objects = [o.lower() for o in objects]
+    if has_human_face:
+        if any(k in lower_objects for k in VEHICLE_OBJECTS):
+            protagonist_type = "ロボット"
+        else:
+            protagonist_type = "子供"
+    else:
+        is_cartoon_character = any(k in lower_labels for k in CARTOON_LABELS)
+        if is_cartoon_character and any(k in lower_objects for k in ANIMAL_OBJECTS):
+            protagonist_type = "子供"
+        elif any(k in lower_objects for k in ANIMAL_OBJECTS):
+            protagonist_type = "動物"
+        elif any(k in lower_objects for k in VEHICLE_OBJECTS):
+            protagonist_type = "ロボット"
+
+    setting_place = "公園"
+    if any(k in lower_objects for k in ["house", "home"]):
+        setting_place = "家"
+    elif any(k in lower_objects for k in ["forest", "tree"]):
+        setting_place = "森"
+    elif any(k in lower_objects for k in ["sea", "ocean"]):
+        setting_place = "海"
+    elif any(k in lower_objects for k in ["mountain", "hill"]):
+        setting_place = "山"
+
+    return {"protagonist_type": protagonist_type, "setting_place": setting_place}
+
+
+def random_case(rng: random.Random, size: int):
+    """ラベル・オブジェクト・顔数・性別のランダムな組み合わせ"""
+    label_pool = DRAWING_LABELS + ["cat", "dog", "animal", "robot", "machine"] + NOISE
+    object_pool = ANIMAL_OBJECTS + VEHICLE_OBJECTS + PLACE_OBJECTS + NOISE
+    labels = [w.title() if rng.random() < 0.5 else w for w in rng.sample(label_pool, rng.randint(0, min(size, len(label_pool))))]
+    objects = [w.title() if rng.random() < 0.5 else w for w in rng.sample(object_pool, rng.randint(0, min(size, len(object_pool))))]
+    face_count = rng.choice([0, 0, 1, 2])
+    gender = rng.choice([None, "男の子", "女の子", "子供"])
+    return labels, objects, face_count, gender
+
+
+def main():
+    parser = argparse.ArgumentParser(description="物語設定ルール表の一致確認と速度比較")
+    parser.add_argument("--corpus", type=int, default=5000, help="一致確認に使うケース数")
+    parser.add_argument("--large-size", type=int, default=300, help="速度比較で使うラベル・オブジェクト数")
+    parser.add_argument("--repeat", type=int, default=2000, help="速度比較の繰り返し回数")
+    parser.add_argument("--seed", type=int, default=20240101)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+
+    # 1. 従来の判定との一致確認
+    mismatches = []
+    for _ in range(args.corpus):
+        case = random_case(rng, 6)
+        expected = legacy_infer(*case)
+        actual = story_setting_rule_index.evaluate(*case)
+        if expected != actual:
+            mismatches.append({"case": case, "expected": expected, "actual": actual})
+
+    # 2. 大量のラベル・オブジェクトでの速度比較
+    large_labels = [f"label_{i}" for i in range(args.large_size)] + ["drawing"]
+    large_objects = [f"object_{i}" for i in range(args.large_size)] + ["tree"]
+
+    start_time = time.perf_counter()
+    for _ in range(args.repeat):
+        legacy_infer(large_labels, large_objects, 0, "女の子")
+    legacy_time = (time.perf_counter() - start_time) / args.repeat
+
+    start_time = time.perf_counter()
+    for _ in range(args.repeat):
+        story_setting_rule_index.evaluate(large_labels, large_objects, 0, "女の子")
+    indexed_time = (time.perf_counter() - start_time) / args.repeat
+
+    report = {
+        "corpus_cases": args.corpus,
+        "mismatches": len(mismatches),
+        "large_size": args.large_size,
+        "legacy_us_per_call": round(legacy_time * 1e6, 2),
+        "indexed_us_per_call": round(indexed_time * 1e6, 2),
+        "speedup": round(legacy_time / indexed_time, 2) if indexed_time else None,
+    }
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    for mismatch in mismatches[:10]:
+        print(json.dumps(mismatch, ensure_ascii=False))
+
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
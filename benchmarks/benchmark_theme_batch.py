@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+テーマ案生成のベンチマーク（1件ずつ vs 一括生成）
+
+同じ物語設定のセットに対して generate_theme_options_only を1件ずつ呼ぶ場合と
+generate_theme_options_batch でまとめて呼ぶ場合を比較し、
+所要時間・モデル呼び出し回数・トークン数・推定コストを出力します。
+
+使用方法:
+python benchmarks/benchmark_theme_batch.py --count 20 --batch-size 10
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SAMPLE_NAMES = ["ゆうと", "はるか", "そうた", "みお", "れん", "さくら"]
+SAMPLE_TYPES = ["子供", "動物", "ロボット"]
+SAMPLE_PLACES = ["公園", "森", "海", "山", "家"]
+SAMPLE_TONES = ["gentle", "fun", "adventure", "mystery"]
+
+
+def build_settings(count: int):
+    """ベンチマーク用の物語設定を作成"""
+    return [
+        {
+            "protagonist_name": SAMPLE_NAMES[i % len(SAMPLE_NAMES)],
+            "protagonist_type": SAMPLE_TYPES[i % len(SAMPLE_TYPES)],
+            "setting_place": SAMPLE_PLACES[i % len(SAMPLE_PLACES)],
+            "tone": SAMPLE_TONES[i % len(SAMPLE_TONES)],
+            "target_age": "preschool",
+            "reading_level": "hiragana_only",
+        }
+        for i in range(count)
+    ]
+
+
+def usage_delta(before, after):
+    """使用量サマリーの差分（呼び出し回数・トークン・コスト）"""
+    b = before.get("by_endpoint", {}).get("benchmark/theme_batch", {})
+    a = after.get("by_endpoint", {}).get("benchmark/theme_batch", {})
+    keys = ["calls", "failures", "prompt_tokens", "cached_tokens", "output_tokens", "cost_usd"]
+    return {k: round(a.get(k, 0) - b.get(k, 0), 8) for k in keys}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="テーマ案生成の1件ずつ/一括の比較")
+    parser.add_argument("--count", type=int, default=20, help="物語設定の数")
+    parser.add_argument("--batch-size", type=int, default=10, help="1回の呼び出しにまとめる設定数")
+    args = parser.parse_args()
+
+    from app.service.story_generator_service import story_generator_service
+    from app.service.usage_tracking_service import set_usage_context, usage_tracking_service
+
+    set_usage_context("benchmark/theme_batch")
+    settings = build_settings(args.count)
+    report = {"count": args.count, "batch_size": args.batch_size}
+
+    print(f"▶ 1件ずつ生成: {args.count}件")
+    before = usage_tracking_service.get_summary()
+    start_time = time.time()
+    for setting in settings:
+        story_generator_service.generate_theme_options_only(setting)
+    report["one_by_one"] = {"wall_time_sec": round(time.time() - start_time, 3),
+                            **usage_delta(before, usage_tracking_service.get_summary())}
+
+    print(f"▶ 一括生成: {args.count}件 (batch_size={args.batch_size})")
+    before = usage_tracking_service.get_summary()
+    start_time = time.time()
+    results = story_generator_service.generate_theme_options_batch(settings, batch_size=args.batch_size)
+    report["batched"] = {"wall_time_sec": round(time.time() - start_time, 3),
+                         **usage_delta(before, usage_tracking_service.get_summary())}
+    report["batched"]["valid_items"] = sum(
+        1 for r in results if story_generator_service._is_valid_theme_options((r or {}).get("theme_options"))
+    )
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+保存用画像のリサイズのベンチマーク（従来のRGBA+LANCZOS+optimize PNG vs 高速リサイズ）
+
+写真（大きなJPEG）と絵（透過PNG・べた塗りPNG）の代表的な画像ごとに、
+従来の処理と render_upload_image（PNG / WEBP）の処理時間・出力サイズ・画素差を比較します。
+フィクスチャのディレクトリを省略した場合は合成画像を使います。
+
+使用方法:
+python benchmarks/benchmark_upload_resize.py
+python benchmarks/benchmark_upload_resize.py fixtures/images --repeat 5
+"""
+
+import argparse
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageChops, ImageDraw, ImageStat
+
+from app.utils.image_utils import render_upload_image
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def legacy_resize(image_data: bytes, target_width: int = 1920, target_height: int = 1080) -> bytes:
+    """高速化前のリサイズ処理（比較用にそのまま残したもの）"""
+    image = Image.open(io.BytesIO(image_data))
+    if image.mode != 'RGBA':
+        image = image.convert('RGBA')
+
+    original_ratio = image.width / image.height
+    target_ratio = target_width / target_height
+    if original_ratio > target_ratio:
+        new_width = target_width
+        new_height = int(target_width / original_ratio)
+    else:
+        new_height = target_height
+        new_width = int(target_height * original_ratio)
+
+    resized_image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
+    canvas = Image.new('RGBA', (target_width, target_height), (0, 0, 0, 0))
+    x_offset = (target_width - new_width) // 2
+    y_offset = (target_height - new_height) // 2
+    canvas.paste(resized_image, (x_offset, y_offset), resized_image)
+
+    output_buffer = io.BytesIO()
+    canvas.save(output_buffer, format='PNG', optimize=True)
+    return output_buffer.getvalue()
+
+
+def synthetic_fixtures():
+    """代表的な入力の合成画像（写真相当のJPEG、透過の絵、べた塗りの絵）"""
+    rng = random.Random(20240101)
+    fixtures = {}
+
+    # 写真相当: 4032x3024のグラデーション＋ノイズのJPEG（スマートフォンの写真サイズ）
+    photo = Image.linear_gradient('L').resize((4032, 3024)).convert('RGB')
+    noise = Image.effect_noise((4032, 3024), 40).convert('RGB')
+    photo = Image.blend(photo, noise, 0.35)
+    buffer = io.BytesIO()
+    photo.save(buffer, format='JPEG', quality=92)
+    fixtures["photo_4032x3024.jpg"] = buffer.getvalue()
+
+    # 縦長の写真
+    buffer = io.BytesIO()
+    photo.rotate(90, expand=True).save(buffer, format='JPEG', quality=92)
+    fixtures["photo_3024x4032.jpg"] = buffer.getvalue()
+
+    # 透過の絵: 2048x2048 RGBAに図形
+    drawing = Image.new('RGBA', (2048, 2048), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(drawing)
+    for _ in range(60):
+        x, y = rng.randint(0, 1900), rng.randint(0, 1900)
+        color = tuple(rng.randint(0, 255) for _ in range(3)) + (255,)
+        draw.ellipse([x, y, x + rng.randint(40, 300), y + rng.randint(40, 300)], fill=color, outline=(0, 0, 0, 255), width=6)
+    buffer = io.BytesIO()
+    drawing.save(buffer, format='PNG')
+    fixtures["drawing_rgba_2048.png"] = buffer.getvalue()
+
+    # べた塗りの絵（透過なし・16:9で余白なし）
+    flat = Image.new('RGB', (3840, 2160), (255, 255, 255))
+    draw = ImageDraw.Draw(flat)
+    for _ in range(80):
+        x, y = rng.randint(0, 3700), rng.randint(0, 2000)
+        color = tuple(rng.randint(0, 255) for _ in range(3))
+        draw.rectangle([x, y, x + rng.randint(40, 400), y + rng.randint(40, 400)], fill=color, outline=(0, 0, 0), width=8)
+    buffer = io.BytesIO()
+    flat.save(buffer, format='PNG')
+    fixtures["drawing_flat_3840x2160.png"] = buffer.getvalue()
+
+    return fixtures
+
+
+def load_fixtures(directory):
+    fixtures = {}
+    for name in sorted(os.listdir(directory)):
+        if name.lower().endswith(IMAGE_EXTENSIONS):
+            with open(os.path.join(directory, name), "rb") as f:
+                fixtures[name] = f.read()
+    return fixtures
+
+
+def mean_abs_diff(a: bytes, b: bytes) -> float:
+    """2つの出力画像のRGBA画素差の平均（0〜255）"""
+    image_a = Image.open(io.BytesIO(a)).convert('RGBA')
+    image_b = Image.open(io.BytesIO(b)).convert('RGBA')
+    return statistics.mean(ImageStat.Stat(ImageChops.difference(image_a, image_b)).mean)
+
+
+def timed(func, repeat):
+    """repeat回実行して中央値の秒数と最後の結果を返す"""
+    durations = []
+    result = None
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        result = func()
+        durations.append(time.perf_counter() - start_time)
+    return statistics.median(durations), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="保存用画像リサイズの処理時間・サイズ比較")
+    parser.add_argument("fixtures", nargs="?", help="フィクスチャ画像のディレクトリ（省略時は合成画像）")
+    parser.add_argument("--repeat", type=int, default=3, help="1画像あたりの計測回数（中央値を使用）")
+    args = parser.parse_args()
+
+    fixtures = load_fixtures(args.fixtures) if args.fixtures else synthetic_fixtures()
+    if not fixtures:
+        print(f"フィクスチャ画像が見つかりません: {args.fixtures}")
+        sys.exit(1)
+
+    rows = []
+    for name, data in fixtures.items():
+        legacy_time, legacy_output = timed(lambda: legacy_resize(data), args.repeat)
+        png_time, (png_output, png_info) = timed(lambda: render_upload_image(data, output_format="png"), args.repeat)
+        webp_time, (webp_output, _) = timed(lambda: render_upload_image(data, output_format="webp"), args.repeat)
+
+        row = {
+            "file": name,
+            "input_bytes": len(data),
+            "legacy_sec": round(legacy_time, 3),
+            "fast_png_sec": round(png_time, 3),
+            "fast_webp_sec": round(webp_time, 3),
+            "png_speedup": round(legacy_time / png_time, 2) if png_time else None,
+            "legacy_bytes": len(legacy_output),
+            "fast_png_bytes": len(png_output),
+            "fast_webp_bytes": len(webp_output),
+            "fast_png_mode": png_info.get("mode"),
+            "png_mean_abs_diff": round(mean_abs_diff(legacy_output, png_output), 3),
+        }
+        rows.append(row)
+        print(json.dumps(row, ensure_ascii=False))
+
+    summary = {
+        "files": len(rows),
+        "mean_legacy_sec": round(statistics.mean(row["legacy_sec"] for row in rows), 3),
+        "mean_fast_png_sec": round(statistics.mean(row["fast_png_sec"] for row in rows), 3),
+        "mean_fast_webp_sec": round(statistics.mean(row["fast_webp_sec"] for row in rows), 3),
+        "max_png_mean_abs_diff": max(row["png_mean_abs_diff"] for row in rows),
+    }
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
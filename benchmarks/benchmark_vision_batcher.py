@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Vision APIマイクロバッチャー（VisionMicroBatcher）のスタブクライアントでの確認・ベンチマーク
+
+実際のVision APIは呼ばず、batch_annotate_imagesを模したスタブクライアントで
+- 件数がmax_batch_sizeに達した時点での送信（ウィンドウを待たない）
+- ウィンドウ経過での送信
+- 画像ごとのエラー（部分失敗）がその画像の呼び出し元だけに返ること
+- バッチ全体の失敗が全ての呼び出し元に返ること
+- 最初のイベントループに紐づいた後、別のループからの呼び出しが直接送信されること
+を確認し、最後に同時リクエスト数ごとの平均バッチサイズ・レイテンシを出力します。
+確認に失敗した場合は終了コード1で終了します。
+
+使用方法:
+python benchmarks/benchmark_vision_batcher.py
+python benchmarks/benchmark_vision_batcher.py --requests 200 --latency-ms 80 --window-ms 10
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.cloud import vision
+
+# スタブクライアントに画像ごとのエラー・バッチ全体の失敗を指示する画像データ
+ITEM_ERROR_CONTENT = b"item-error"
+BATCH_ERROR_CONTENT = b"batch-error"
+
+
+class StubVisionClient:
+    """batch_annotate_imagesだけを持つスタブ（呼び出しごとのバッチサイズを記録）"""
+
+    def __init__(self, latency_seconds: float = 0.0):
+        self.latency_seconds = latency_seconds
+        self.batch_sizes = []
+        self._lock = threading.Lock()
+
+    def batch_annotate_images(self, requests, retry=None):
+        with self._lock:
+            self.batch_sizes.append(len(requests))
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        if any(request.image.content == BATCH_ERROR_CONTENT for request in requests):
+            raise RuntimeError("stub batch failure")
+
+        responses = []
+        for request in requests:
+            if request.image.content == ITEM_ERROR_CONTENT:
+                responses.append(vision.AnnotateImageResponse(error={"code": 3, "message": "stub item error"}))
+            else:
+                responses.append(vision.AnnotateImageResponse(
+                    label_annotations=[{"description": request.image.content.decode(), "score": 0.9}]
+                ))
+        return SimpleNamespace(responses=responses)
+
+
+def build_service(latency_seconds: float, max_batch_size: int, window_seconds: float):
+    """スタブクライアントとバッチャーを設定したVisionApiServiceを作成"""
+    from app.service.vision_api_service import VisionApiService, VisionMicroBatcher
+
+    client = StubVisionClient(latency_seconds)
+    service = VisionApiService(client=client, batch_enabled=False)
+    service.batcher = VisionMicroBatcher(client, service.executor, max_batch_size, window_seconds)
+    return service, client
+
+
+def first_label(result) -> str:
+    labels = result.get("labels", [])
+    return labels[0]["description"] if labels else ""
+
+
+class Checker:
+    def __init__(self):
+        self.failures = 0
+
+    def check(self, name: str, ok: bool, detail: str = ""):
+        print(f"{'✅' if ok else '❌'} {name}{f' ({detail})' if detail else ''}")
+        if not ok:
+            self.failures += 1
+
+
+async def check_flush_on_size(checker: Checker):
+    """max_batch_size件たまったらウィンドウ（10秒）を待たずに送信する"""
+    service, client = build_service(0.0, max_batch_size=4, window_seconds=10.0)
+    start_time = time.time()
+    results = await asyncio.wait_for(
+        asyncio.gather(*[service.analyze_image_bytes(f"img{i}".encode(), features=["labels"]) for i in range(4)]),
+        timeout=2.0
+    )
+    elapsed = time.time() - start_time
+    checker.check("件数上限で送信", client.batch_sizes == [4], f"batches={client.batch_sizes} {elapsed:.3f}秒")
+    checker.check("元の順番で結果を返す", [first_label(r) for r in results] == [f"img{i}" for i in range(4)])
+
+
+async def check_flush_on_timeout(checker: Checker):
+    """件数上限未満でもウィンドウ経過で送信する"""
+    window_seconds = 0.05
+    service, client = build_service(0.0, max_batch_size=16, window_seconds=window_seconds)
+    start_time = time.time()
+    await asyncio.wait_for(
+        asyncio.gather(*[service.analyze_image_bytes(f"img{i}".encode(), features=["labels"]) for i in range(3)]),
+        timeout=2.0
+    )
+    elapsed = time.time() - start_time
+    checker.check(
+        "ウィンドウ経過で送信", client.batch_sizes == [3] and elapsed >= window_seconds * 0.9,
+        f"batches={client.batch_sizes} {elapsed:.3f}秒"
+    )
+
+
+async def check_item_errors(checker: Checker):
+    """部分失敗はその画像だけエラーになり、バッチ全体の失敗は全件エラーになる"""
+    service, client = build_service(0.0, max_batch_size=3, window_seconds=10.0)
+    results = await asyncio.gather(*[
+        service.analyze_image_bytes(content, features=["labels"])
+        for content in (b"ok0", ITEM_ERROR_CONTENT, b"ok2")
+    ])
+    errors = [bool(result.get("error")) for result in results]
+    checker.check("画像ごとのエラーを振り分け", errors == [False, True, False], f"errors={errors}")
+
+    results = await asyncio.gather(*[
+        service.analyze_image_bytes(content, features=["labels"])
+        for content in (b"ok0", BATCH_ERROR_CONTENT, b"ok2")
+    ])
+    errors = [bool(result.get("error")) for result in results]
+    checker.check("バッチ全体の失敗を全件に返す", errors == [True, True, True], f"errors={errors}")
+
+
+def check_loop_binding(checker: Checker):
+    """最初のループに紐づいた後、別のループからの呼び出しはバッチ化せず直接送信する"""
+    service, client = build_service(0.0, max_batch_size=16, window_seconds=0.01)
+    first = asyncio.run(service.analyze_image_bytes(b"loop1", features=["labels"]))
+    second = asyncio.run(asyncio.wait_for(service.analyze_image_bytes(b"loop2", features=["labels"]), timeout=2.0))
+    checker.check(
+        "別ループからの呼び出しは直接送信",
+        first_label(first) == "loop1" and first_label(second) == "loop2" and client.batch_sizes == [1, 1],
+        f"batches={client.batch_sizes}"
+    )
+
+
+async def run_benchmark(concurrency: int, total: int, latency_seconds: float, window_seconds: float,
+                        max_batch_size: int):
+    """同時実行数concurrencyでtotal件解析し、平均バッチサイズ・レイテンシを返す"""
+    service, client = build_service(latency_seconds, max_batch_size, window_seconds)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(index: int):
+        async with semaphore:
+            start_time = time.time()
+            await service.analyze_image_bytes(f"img{index}".encode(), features=["labels"])
+            latencies.append(time.time() - start_time)
+
+    start_time = time.time()
+    await asyncio.gather(*[one(i) for i in range(total)])
+    elapsed = time.time() - start_time
+    return {
+        "concurrency": concurrency,
+        "batches": len(client.batch_sizes),
+        "avg_batch_size": round(statistics.mean(client.batch_sizes), 2),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "max_ms": round(max(latencies) * 1000, 1),
+        "throughput_per_sec": round(total / elapsed, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vision APIマイクロバッチャーのスタブ確認・ベンチマーク")
+    parser.add_argument("--requests", type=int, default=100, help="ベンチマークの解析件数")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="スタブのbatch_annotate_imagesの応答時間")
+    parser.add_argument("--window-ms", type=float, default=5.0, help="バッチャーのウィンドウ")
+    parser.add_argument("--max-batch-size", type=int, default=16, help="1バッチの最大件数")
+    parser.add_argument("--concurrency", type=int, action="append", help="同時実行数（複数指定可、既定: 1, 4, 16, 32）")
+    args = parser.parse_args()
+
+    checker = Checker()
+    asyncio.run(check_flush_on_size(checker))
+    asyncio.run(check_flush_on_timeout(checker))
+    asyncio.run(check_item_errors(checker))
+    check_loop_binding(checker)
+
+    print(f"\nスタブ応答 {args.latency_ms}ms / ウィンドウ {args.window_ms}ms / 最大 {args.max_batch_size}件")
+    for concurrency in args.concurrency or [1, 4, 16, 32]:
+        stats = asyncio.run(run_benchmark(
+            concurrency, args.requests, args.latency_ms / 1000, args.window_ms / 1000, args.max_batch_size
+        ))
+        print(f"  {stats}")
+
+    if checker.failures:
+        print(f"\n❌ {checker.failures}件の確認に失敗しました")
+        sys.exit(1)
+    print("\n✅ すべての確認に成功しました")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Vision API解析用画像のベンチマーク（1920x1080 PNG vs 縮小JPEG）
+
+フィクスチャ画像ごとに、現行の保存用画像（1920x1080の透過PNG）と
+解析用画像（長辺VISION_ANALYSIS_MAX_SIDEのRGB JPEG）を作成し、
+ペイロードサイズ・作成時間を比較します。--call-vision を付けると実際にVision APIを呼び、
+レイテンシとラベル・オブジェクトの一致度も出力します。
+
+使用方法:
+python benchmarks/benchmark_vision_rendition.py fixtures/images
+python benchmarks/benchmark_vision_rendition.py fixtures/images --call-vision --top-k 5
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def jaccard(a, b) -> float:
+    """2つの集合の一致度（どちらも空なら1.0）"""
+    a, b = set(a), set(b)
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def top_labels(result, top_k):
+    return [label["description"].lower() for label in result.get("labels", [])[:top_k]]
+
+
+def object_names(result):
+    return [obj["name"].lower() for obj in result.get("objects", [])]
+
+
+async def analyze(vision_service, content: bytes):
+    start_time = time.time()
+    result = await vision_service.analyze_image_bytes(content)
+    return result, time.time() - start_time
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Vision解析用画像のペイロード・レイテンシ比較")
+    parser.add_argument("fixtures", help="フィクスチャ画像のディレクトリ")
+    parser.add_argument("--call-vision", action="store_true", help="実際にVision APIを呼んで比較する")
+    parser.add_argument("--top-k", type=int, default=5, help="ラベル比較に使う上位件数")
+    args = parser.parse_args()
+
+    from app.utils.image_utils import resize_image_to_fixed_size, create_analysis_rendition
+
+    vision_service = None
+    if args.call_vision:
+        from app.service.vision_api_service import vision_service
+
+    files = sorted(
+        os.path.join(args.fixtures, name) for name in os.listdir(args.fixtures)
+        if name.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    if not files:
+        print(f"フィクスチャ画像が見つかりません: {args.fixtures}")
+        sys.exit(1)
+
+    rows = []
+    for path in files:
+        with open(path, "rb") as f:
+            original = f.read()
+
+        start_time = time.time()
+        stored = resize_image_to_fixed_size(original, 1920, 1080)
+        stored_time = time.time() - start_time
+
+        start_time = time.time()
+        rendition, rendition_info = create_analysis_rendition(original)
+        rendition_time = time.time() - start_time
+
+        row = {
+            "file": os.path.basename(path),
+            "stored_png_bytes": len(stored),
+            "rendition_jpeg_bytes": len(rendition or b""),
+            "rendition_size": f"{rendition_info.get('width')}x{rendition_info.get('height')}",
+            "stored_encode_sec": round(stored_time, 3),
+            "rendition_encode_sec": round(rendition_time, 3),
+        }
+
+        if vision_service and rendition:
+            stored_result, stored_latency = await analyze(vision_service, stored)
+            rendition_result, rendition_latency = await analyze(vision_service, rendition)
+            row.update({
+                "stored_vision_sec": round(stored_latency, 3),
+                "rendition_vision_sec": round(rendition_latency, 3),
+                "label_jaccard": round(jaccard(top_labels(stored_result, args.top_k),
+                                               top_labels(rendition_result, args.top_k)), 3),
+                "object_jaccard": round(jaccard(object_names(stored_result), object_names(rendition_result)), 3),
+                "face_count": [len(stored_result.get("faces", [])), len(rendition_result.get("faces", []))],
+            })
+
+        rows.append(row)
+        print(json.dumps(row, ensure_ascii=False))
+
+    def mean(key):
+        values = [row[key] for row in rows if key in row]
+        return round(statistics.mean(values), 3) if values else None
+
+    summary = {
+        "files": len(rows),
+        "mean_stored_png_bytes": mean("stored_png_bytes"),
+        "mean_rendition_jpeg_bytes": mean("rendition_jpeg_bytes"),
+        "mean_stored_vision_sec": mean("stored_vision_sec"),
+        "mean_rendition_vision_sec": mean("rendition_vision_sec"),
+        "mean_label_jaccard": mean("label_jaccard"),
+        "mean_object_jaccard": mean("object_jaccard"),
+    }
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
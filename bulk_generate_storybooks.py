@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+絵本の一括生成スクリプト（QA・マーケティング用のサンプル作成）
+
+物語設定のJSONLまたはCSVを読み込み、テーマ案 → 物語本文 → ページ画像 を
+既存のサービス経由で生成します。ステージごとにチェックポイントを書き出すため、
+途中で落ちても同じコマンドで再実行すれば続きから再開できます。
+
+使用方法:
+python bulk_generate_storybooks.py settings.jsonl --output-dir bulk_output
+python bulk_generate_storybooks.py settings.csv --concurrency 4 --rate 2 --skip-images
+python bulk_generate_storybooks.py settings.jsonl --theme-batch-size 10
+
+入力の各行（CSVは各列）:
+    id（任意）, protagonist_name, protagonist_type, setting_place, tone, target_age, reading_level,
+    selected_theme（任意: theme1〜theme3、省略時はtheme1）, user_id（任意）
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Dict, Any, List, Optional
+
+STAGES = ["themes", "story", "images"]
+
+
+class AsyncRateLimiter:
+    """モデル呼び出しの開始間隔を一定以上に保つレートリミッター"""
+
+    def __init__(self, rate_per_sec: float):
+        self.interval = 1.0 / rate_per_sec if rate_per_sec > 0 else 0.0
+        self._next_time = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.interval <= 0:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next_time - now
+            self._next_time = max(now, self._next_time) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class Checkpoint:
+    """ステージ完了ごとに1行追記するチェックポイントファイル"""
+
+    def __init__(self, path: str):
+        self.path = path
+        # {item_id: {stage: data}}
+        self.state: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 書き込み途中で落ちた最終行は無視
+                        continue
+                    self.state.setdefault(record["id"], {})[record["stage"]] = record["data"]
+        self._file = open(path, "a", encoding="utf-8")
+
+    def get(self, item_id: str, stage: str) -> Optional[Any]:
+        return self.state.get(item_id, {}).get(stage)
+
+    def save(self, item_id: str, stage: str, data: Any):
+        self.state.setdefault(item_id, {})[stage] = data
+        self._file.write(json.dumps({"id": item_id, "stage": stage, "data": data}, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+def load_settings(path: str) -> List[Dict[str, Any]]:
+    """JSONLまたはCSVから物語設定を読み込む"""
+    items = []
+    if path.lower().endswith(".csv"):
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            rows = list(csv.DictReader(f))
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+
+    for index, row in enumerate(rows):
+        row = {k: v for k, v in row.items() if v not in (None, "")}
+        row["id"] = str(row.get("id", index))
+        items.append(row)
+    return items
+
+
+def build_page_prompt(page_content: str, setting: Dict[str, Any]) -> str:
+    """ページ画像用のプロンプトを作成（共通指示は画像サービス側で付与）"""
+    return (
+        f"Create a beautiful children's book illustration for: {page_content}. "
+        f"Character: {setting.get('protagonist_name', '主人公')} (a {setting.get('protagonist_type', '子供')}), "
+        f"Setting: {setting.get('setting_place', '公園')}. "
+        f"Style: children's book illustration, warm and friendly, bright colors, "
+        f"simple and clean design, suitable for children, consistent character design."
+    )
+
+
+def percentile(values: List[float], ratio: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * ratio))]
+
+
+class BulkRunner:
+    """テーマ案 → 物語本文 → 画像 を並列数とレートを制限して実行"""
+
+    def __init__(self, args: argparse.Namespace, checkpoint: Checkpoint):
+        from app.service.story_generator_service import story_generator_service
+        from app.service.image_generator_service import image_generator_service
+
+        self.args = args
+        self.checkpoint = checkpoint
+        self.story_service = story_generator_service
+        self.image_service = image_generator_service
+        self.limiter = AsyncRateLimiter(args.rate)
+        self.semaphore = asyncio.Semaphore(args.concurrency)
+        self.stage_latencies: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+        self.item_latencies: List[float] = []
+        self.counts = {"succeeded": 0, "failed": 0, "resumed": 0}
+        self.results_file = open(os.path.join(args.output_dir, "results.jsonl"), "a", encoding="utf-8")
+
+    async def _call(self, func, *args, **kwargs):
+        """レート制限を守ってスレッドでサービスを呼び出す"""
+        await self.limiter.acquire()
+        return await asyncio.to_thread(func, *args, **kwargs)
+
+    async def prefetch_themes(self, items: List[Dict[str, Any]]):
+        """テーマ案が未生成の設定をまとめて一括生成し、チェックポイントに保存"""
+        pending = [item for item in items
+                   if not self.checkpoint.get(item["id"], "done") and self.checkpoint.get(item["id"], "themes") is None]
+        batch_size = self.args.theme_batch_size
+        for start in range(0, len(pending), batch_size):
+            chunk = pending[start:start + batch_size]
+            settings = [{k: v for k, v in item.items() if k not in ("id", "selected_theme", "user_id")} for item in chunk]
+            stage_start = time.time()
+            results = await self._call(
+                self.story_service.generate_theme_options_batch, settings, batch_size, raise_on_error=True
+            )
+            # 1件あたりの所要時間として記録
+            elapsed = (time.time() - stage_start) / len(chunk)
+            for item, themes in zip(chunk, results):
+                self.stage_latencies["themes"].append(elapsed)
+                # 生成できなかった項目は保存せず、run_item で1件ずつ再試行する
+                if themes is not None:
+                    self.checkpoint.save(item["id"], "themes", themes)
+
+    async def run_item(self, item: Dict[str, Any]):
+        item_id = item["id"]
+        if self.checkpoint.get(item_id, "done"):
+            self.counts["resumed"] += 1
+            return
+
+        async with self.semaphore:
+            start_time = time.time()
+            try:
+                result = await self._run_stages(item)
+                self.checkpoint.save(item_id, "done", True)
+                self.results_file.write(json.dumps(result, ensure_ascii=False) + "\n")
+                self.results_file.flush()
+                self.counts["succeeded"] += 1
+                self.item_latencies.append(time.time() - start_time)
+                print(f"✅ {item_id} 完了 ({time.time() - start_time:.1f}秒)")
+            except Exception as e:
+                self.counts["failed"] += 1
+                print(f"❌ {item_id} 失敗: {e}")
+
+    async def _run_stages(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        item_id = item["id"]
+        setting = {k: v for k, v in item.items() if k not in ("id", "selected_theme", "user_id")}
+
+        # 1. テーマ案
+        themes = self.checkpoint.get(item_id, "themes")
+        if themes is None:
+            stage_start = time.time()
+            # 失敗時の定型文をチェックポイントに残さないよう例外で受け取る（項目は失敗として次回再試行）
+            themes = await self._call(self.story_service.generate_theme_options_only, setting, raise_on_error=True)
+            self.stage_latencies["themes"].append(time.time() - stage_start)
+            self.checkpoint.save(item_id, "themes", themes)
+
+        # 2. 選択したテーマの物語本文
+        story = self.checkpoint.get(item_id, "story")
+        if story is None:
+            theme_key = item.get("selected_theme", "theme1")
+            theme_title = themes.get("theme_options", {}).get(theme_key, {}).get("title", "物語")
+            stage_start = time.time()
+            story = await self._call(self.story_service.generate_single_story, setting, theme_title, raise_on_error=True)
+            self.stage_latencies["story"].append(time.time() - stage_start)
+            self.checkpoint.save(item_id, "story", story)
+
+        # 3. ページ画像（ページ単位でチェックポイント）
+        images = []
+        if not self.args.skip_images:
+            stage_start = time.time()
+            user_id = int(item.get("user_id", self.args.user_id))
+            for page_index, page in enumerate(story.get("story_pages", []), 1):
+                stage_key = f"image_page_{page_index}"
+                image_info = self.checkpoint.get(item_id, stage_key)
+                if image_info is None:
+                    page_content = next(iter(page.values()), "")
+                    image_info = await self._call(
+                        self.image_service.generate_single_image,
+                        build_page_prompt(page_content, setting),
+                        f"bulk_{item_id}_page_{page_index}",
+                        user_id,
+                    )
+                    if image_info.get("error"):
+                        raise RuntimeError(f"ページ{page_index}の画像生成に失敗: {image_info['error']}")
+                    # tupleなどJSON化できない値を除く
+                    image_info = json.loads(json.dumps(image_info, default=str))
+                    self.checkpoint.save(item_id, stage_key, image_info)
+                images.append(image_info)
+            self.stage_latencies["images"].append(time.time() - stage_start)
+
+        return {"id": item_id, "setting": setting, "themes": themes, "story": story, "images": images}
+
+    def build_report(self, total_items: int, wall_time: float) -> Dict[str, Any]:
+        processed = self.counts["succeeded"]
+
+        def summarize(values: List[float]) -> Dict[str, float]:
+            return {
+                "count": len(values),
+                "mean_sec": round(statistics.mean(values), 3) if values else 0.0,
+                "p50_sec": round(percentile(values, 0.5), 3),
+                "p95_sec": round(percentile(values, 0.95), 3),
+                "max_sec": round(max(values), 3) if values else 0.0,
+            }
+
+        return {
+            "total_items": total_items,
+            **self.counts,
+            "wall_time_sec": round(wall_time, 3),
+            "throughput_items_per_min": round(processed / wall_time * 60, 3) if wall_time > 0 else 0.0,
+            "concurrency": self.args.concurrency,
+            "rate_per_sec": self.args.rate,
+            "item_latency": summarize(self.item_latencies),
+            "stage_latency": {stage: summarize(values) for stage, values in self.stage_latencies.items()},
+        }
+
+    def close(self):
+        self.results_file.close()
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    from app.service.usage_tracking_service import set_usage_context, usage_tracking_service
+
+    set_usage_context("cli/bulk_generate_storybooks")
+    os.makedirs(args.output_dir, exist_ok=True)
+    items = load_settings(args.input)
+    checkpoint = Checkpoint(args.checkpoint or os.path.join(args.output_dir, "checkpoint.jsonl"))
+    runner = BulkRunner(args, checkpoint)
+
+    print(f"🚀 一括生成開始: {len(items)}件 (並列数: {args.concurrency}, レート: {args.rate}/秒)")
+    start_time = time.time()
+    try:
+        if args.theme_batch_size > 1:
+            await runner.prefetch_themes(items)
+        await asyncio.gather(*(runner.run_item(item) for item in items))
+    finally:
+        runner.close()
+        checkpoint.close()
+
+    report = runner.build_report(len(items), time.time() - start_time)
+    report["model_usage"] = usage_tracking_service.get_summary()
+    report_path = args.report or os.path.join(args.output_dir, "report.json")
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"📊 レポート: {report_path}")
+    print(json.dumps({k: v for k, v in report.items() if k != "model_usage"}, ensure_ascii=False, indent=2))
+    return report
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="物語設定から絵本を一括生成します")
+    parser.add_argument("input", help="物語設定のJSONLまたはCSVファイル")
+    parser.add_argument("--output-dir", default="bulk_output", help="結果・チェックポイント・レポートの出力先")
+    parser.add_argument("--checkpoint", help="チェックポイントファイル（省略時は output-dir/checkpoint.jsonl）")
+    parser.add_argument("--report", help="レポートファイル（省略時は output-dir/report.json）")
+    parser.add_argument("--concurrency", type=int, default=2, help="同時に処理する設定の数")
+    parser.add_argument("--rate", type=float, default=1.0, help="モデル呼び出しの上限（回/秒、0で無制限）")
+    parser.add_argument("--user-id", type=int, default=2, help="画像を保存するユーザーID（入力にuser_idがない場合）")
+    parser.add_argument("--theme-batch-size", type=int, default=1,
+                        help="テーマ案を1回の呼び出しでまとめて生成する設定数（1で1件ずつ）")
+    parser.add_argument("--skip-images", action="store_true", help="画像生成をスキップ")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.concurrency < 1:
+        print("--concurrency は1以上を指定してください")
+        sys.exit(1)
+    report = asyncio.run(run(args))
+    sys.exit(0 if report["failed"] == 0 else 1)
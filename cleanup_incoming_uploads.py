@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+finalizeされなかった直接アップロードの削除スクリプト
+
+/upload/direct で発行したURLにアップロードされたまま /upload/finalize されなかった画像
+（users/{id}/uploads/incoming/）と、処理中に残ったfinalizeの目印（users/{id}/uploads/finalizing/）のうち、
+一定時間（既定: INCOMING_UPLOAD_MAX_AGE_HOURS）より古いものを削除します。既定はドライラン（件数の表示のみ）です。
+GCSのライフサイクルルールはユーザーごとのパスにワイルドカードで一致させられないため、このスクリプトを定期実行してください。
+
+使用方法:
+python cleanup_incoming_uploads.py
+python cleanup_incoming_uploads.py --apply
+python cleanup_incoming_uploads.py --apply --max-age-hours 6
+"""
+
+import argparse
+from datetime import datetime, timedelta, timezone
+
+from app.core.config import INCOMING_UPLOAD_MAX_AGE_HOURS
+from app.service.gcs_storage_service import GCSStorageService
+from app.service.object_manifest_service import object_manifest_service
+
+# 直接アップロードの元画像とfinalizeの目印
+INCOMING_GLOBS = ["users/*/uploads/incoming/**", "users/*/uploads/finalizing/**"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="finalizeされなかった直接アップロードの削除")
+    parser.add_argument("--apply", action="store_true", help="実際に削除する（省略時はドライラン）")
+    parser.add_argument("--max-age-hours", type=float, default=INCOMING_UPLOAD_MAX_AGE_HOURS,
+                        help="これより古いオブジェクトを削除する（時間）")
+    parser.add_argument("--page-size", type=int, default=1000, help="バケット一覧の1回あたりの件数")
+    args = parser.parse_args()
+
+    gcs = GCSStorageService()
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=args.max_age_hours)
+    stats = {"listed": 0, "expired": 0, "deleted": 0, "failed": 0}
+
+    for match_glob in INCOMING_GLOBS:
+        pages = gcs.client.list_blobs(
+            gcs.bucket_name, prefix="users/", match_glob=match_glob, page_size=args.page_size
+        ).pages
+        for page in pages:
+            expired = []
+            for blob in page:
+                stats["listed"] += 1
+                if blob.time_created and blob.time_created < cutoff:
+                    expired.append(blob.name)
+            stats["expired"] += len(expired)
+            if not expired:
+                continue
+            if not args.apply:
+                for name in expired:
+                    print(f"  [dry-run] 削除: {name}")
+                continue
+
+            result = gcs.async_storage.delete_many_sync(expired)
+            failed = {failure["gcs_path"] for failure in result["failed"]}
+            stats["deleted"] += len(expired) - len(failed)
+            stats["failed"] += len(failed)
+            # 直接アップロードはアプリを通らないが、reconcile_gcs_manifest.pyで台帳に取り込まれている場合があるため外す
+            object_manifest_service.remove_many([name for name in expired if name not in failed])
+            print(f"  {match_glob}: {stats['deleted']}件 削除済み")
+
+    print(f"{'✅ 削除完了' if args.apply else '📝 ドライラン完了'}: {stats}")
+
+
+if __name__ == "__main__":
+    main()
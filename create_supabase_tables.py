@@ -6,13 +6,18 @@ Supabase用のテーブル作成スクリプト
 python create_supabase_tables.py
 """
 
+from sqlalchemy import inspect, text
 from app.database.supabase_base import SupabaseBase
 from app.database.supabase_session import engine
 from app.models.users.supabase_users import SupabaseUsers
 from app.models.images.supabase_images import SupabaseUploadImages
+from app.models.images.supabase_vision_cache import SupabaseVisionAnalysisCache
+from app.models.images.supabase_object_refs import SupabaseImageObjectRef
+from app.models.images.supabase_object_manifest import SupabaseGCSObjectManifest
 from app.models.story.supabase_story_setting import SupabaseStorySetting
 from app.models.story.supabase_story_plot import SupabaseStoryPlot
 from app.models.story.supabase_generated_story_book import SupabaseGeneratedStoryBook
+from app.models.usage.supabase_model_usage import SupabaseModelUsageLog
 
 def create_supabase_tables():
     """Supabase用のテーブルを作成"""
@@ -21,6 +26,7 @@ def create_supabase_tables():
         
         # テーブルを作成
         SupabaseBase.metadata.create_all(bind=engine)
+        add_missing_columns()
         
         print("Supabase用テーブルの作成が完了しました")
         print("作成されたテーブル:")
@@ -33,6 +39,21 @@ def create_supabase_tables():
     
     return True
 
+def add_missing_columns():
+    """既存テーブルに後から追加されたNULL許可カラムを追加（create_allは既存テーブルを変更しないため）"""
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in SupabaseBase.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                print(f"  + {table.name}.{column.name} ({column_type}) を追加しました")
+
 def test_supabase_connection():
     """Supabase接続テスト"""
     try:
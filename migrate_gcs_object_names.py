@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+GCSオブジェクト名の移行スクリプト（年月形式 → シャード付き形式）
+
+users/{id}/{type}/{yyyy}/{mm}/... のオブジェクトを users/{id}/{type}/{シャード}/{yyyy}/{mm}/... にコピーし、
+DBの参照（upload_images の file_path / public_url / raw_analysis_path、
+generated_story_books の page_N_image_url）を書き換えます。
+既定はドライラン（変更内容の表示のみ）です。GCS_OBJECT_NAMING=sharded に切り替えた後に実行してください。
+移行前のパスやURLも GCSStorageService.resolve_object_path で読めるため、--delete-old を付けるまで元のオブジェクトは残ります。
+
+使用方法:
+python migrate_gcs_object_names.py
+python migrate_gcs_object_names.py --apply --batch-size 200
+python migrate_gcs_object_names.py --apply --delete-old --table upload_images
+"""
+
+import argparse
+import os
+import sys
+from typing import Optional
+
+from app.database.supabase_session import SessionLocal
+from app.models.images.supabase_images import SupabaseUploadImages
+from app.models.story.supabase_generated_story_book import SupabaseGeneratedStoryBook
+from app.service.gcs_storage_service import GCSStorageService
+from app.service.object_manifest_service import object_manifest_service
+
+PAGE_URL_COLUMNS = [f"page_{page}_image_url" for page in range(1, 6)]
+
+
+class ObjectNameMigrator:
+    """オブジェクトのコピーと参照の書き換え（同じオブジェクトは1回だけコピー）"""
+
+    def __init__(self, gcs_service: GCSStorageService, apply: bool):
+        self.gcs = gcs_service
+        self.apply = apply
+        self.copied = {}
+        self.old_paths = []
+        self.stats = {"rows": 0, "references": 0, "copied": 0, "missing": 0, "skipped": 0}
+
+    def move(self, old_path: str, new_path: str) -> bool:
+        """オブジェクトを新しい名前にコピー（元が無い場合はFalse）"""
+        if old_path in self.copied:
+            return self.copied[old_path]
+        if not self.apply:
+            print(f"  [dry-run] {old_path} -> {new_path}")
+            self.copied[old_path] = True
+            return True
+
+        source = self.gcs.bucket.get_blob(old_path)
+        if source is None:
+            print(f"  ⚠️ オブジェクトがありません: {old_path}")
+            self.stats["missing"] += 1
+            self.copied[old_path] = False
+            return False
+        if self.gcs.bucket.get_blob(new_path) is None:
+            self.gcs.bucket.copy_blob(source, self.gcs.bucket, new_path)
+            object_manifest_service.copy_entry(old_path, new_path)
+            self.stats["copied"] += 1
+        self.old_paths.append(old_path)
+        self.copied[old_path] = True
+        return True
+
+    def migrate_path(self, path: Optional[str], new_path: Optional[str] = None) -> Optional[str]:
+        """パスを移行して新しいパスを返す（対象外・失敗時はNone）"""
+        if not path:
+            return None
+        new_path = new_path or self.gcs.sharded_path_for(path)
+        if not new_path:
+            self.stats["skipped"] += 1
+            return None
+        if not self.move(path, new_path):
+            return None
+        self.stats["references"] += 1
+        return new_path
+
+    def migrate_url(self, url: Optional[str]) -> Optional[str]:
+        """公開URLを移行して新しいURLを返す"""
+        if not url:
+            return None
+        new_path = self.migrate_path(self.gcs.resolve_object_path(url))
+        return self.gcs.get_public_url(new_path) if new_path else None
+
+    def migrate_upload_image(self, image: SupabaseUploadImages) -> bool:
+        new_file_path = self.migrate_path(image.file_path)
+        if not new_file_path:
+            return False
+        image.file_path = new_file_path
+        image.public_url = self.gcs.get_public_url(new_file_path)
+        # 解析結果のJSONは画像と同じ場所に置く
+        if image.raw_analysis_path:
+            new_raw_path = f"{os.path.splitext(new_file_path)[0]}.analysis.json"
+            if self.migrate_path(image.raw_analysis_path, new_raw_path):
+                image.raw_analysis_path = new_raw_path
+        return True
+
+    def migrate_storybook(self, storybook: SupabaseGeneratedStoryBook) -> bool:
+        changed = False
+        for column in PAGE_URL_COLUMNS:
+            new_url = self.migrate_url(getattr(storybook, column))
+            if new_url:
+                setattr(storybook, column, new_url)
+                changed = True
+        return changed
+
+    def delete_old_objects(self):
+        result = self.gcs.async_storage.delete_many_sync(self.old_paths)
+        failed = {failure["gcs_path"] for failure in result["failed"]}
+        object_manifest_service.remove_many([path for path in self.old_paths if path not in failed])
+        print(f"🗑️ 元のオブジェクトを削除しました: {result['deleted']}件（失敗 {len(result['failed'])}件）")
+
+
+def migrate_table(db, model, migrate_row, migrator: ObjectNameMigrator, batch_size: int):
+    """主キー順にbatch_size件ずつ処理し、バッチごとにコミット（途中で止めても再実行できる）"""
+    last_id = 0
+    while True:
+        rows = db.query(model).filter(model.id > last_id).order_by(model.id).limit(batch_size).all()
+        if not rows:
+            break
+        for row in rows:
+            if migrate_row(row):
+                migrator.stats["rows"] += 1
+        last_id = rows[-1].id
+        if migrator.apply:
+            db.commit()
+        else:
+            db.rollback()
+        print(f"  {model.__tablename__}: id {last_id} まで処理")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GCSオブジェクト名をシャード付き形式に移行")
+    parser.add_argument("--apply", action="store_true", help="実際にコピーとDB更新を行う（省略時はドライラン）")
+    parser.add_argument("--delete-old", action="store_true", help="DB更新後に元のオブジェクトを削除する（--applyと併用）")
+    parser.add_argument("--table", choices=["all", "upload_images", "generated_story_books"], default="all")
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+
+    if args.delete_old and not args.apply:
+        print("--delete-old は --apply と一緒に指定してください")
+        sys.exit(1)
+
+    gcs_service = GCSStorageService()
+    migrator = ObjectNameMigrator(gcs_service, args.apply)
+    db = SessionLocal()
+    try:
+        if args.table in ("all", "upload_images"):
+            migrate_table(db, SupabaseUploadImages, migrator.migrate_upload_image, migrator, args.batch_size)
+        if args.table in ("all", "generated_story_books"):
+            migrate_table(db, SupabaseGeneratedStoryBook, migrator.migrate_storybook, migrator, args.batch_size)
+    finally:
+        db.close()
+
+    if args.delete_old:
+        migrator.delete_old_objects()
+
+    print(f"{'✅ 移行完了' if args.apply else '📝 ドライラン完了'}: {migrator.stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+GCSオブジェクト台帳（gcs_object_manifest）とバケットの突き合わせスクリプト
+
+バケットをプレフィックスごとにページ単位で一覧し、
+- 台帳にないオブジェクトを追加（アプリ外で作られたもの、台帳導入前の既存オブジェクト）
+- サイズ・Content-Typeが違う行を更新
+- バケットにない行（削除済み）を台帳から削除
+します。既定はドライラン（件数の表示のみ）です。
+GCS_MANIFEST_LISTING=true にする前に --apply で既存オブジェクトを取り込んでください。
+実行中にアップロードされたオブジェクトの行は削除対象にしません（開始時刻より後に作られた行は除外）。
+バケットにあったオブジェクト名は削除判定のためメモリに保持します。
+
+使用方法:
+python reconcile_gcs_manifest.py
+python reconcile_gcs_manifest.py --apply
+python reconcile_gcs_manifest.py --apply --prefix users/12/ --with-dimensions
+"""
+
+import argparse
+from datetime import datetime, timezone
+
+from app.database.supabase_session import SessionLocal
+from app.models.images.supabase_object_manifest import SupabaseGCSObjectManifest
+from app.service.gcs_storage_service import GCSStorageService
+from app.service.object_manifest_service import object_manifest_service
+from app.utils.upload_utils import HEADER_SNIFF_LIMIT
+
+DEFAULT_PREFIXES = ["users/", "cas/"]
+
+
+class ManifestReconciler:
+    """1プレフィックス分のバケット一覧と台帳を突き合わせる"""
+
+    def __init__(self, gcs_service: GCSStorageService, apply: bool, with_dimensions: bool):
+        self.gcs = gcs_service
+        self.apply = apply
+        self.with_dimensions = with_dimensions
+        self.started_at = datetime.now(timezone.utc)
+        self.stats = {"listed": 0, "inserted": 0, "updated": 0, "unchanged": 0, "stale": 0, "dimensions_read": 0}
+
+    def read_dimensions(self, blob):
+        """画像の先頭だけを取得して幅・高さを読む"""
+        if not self.with_dimensions or not (blob.content_type or "").startswith("image/"):
+            return None, None
+        head = blob.download_as_bytes(start=0, end=HEADER_SNIFF_LIMIT - 1)
+        self.stats["dimensions_read"] += 1
+        return object_manifest_service.image_dimensions(head)
+
+    def reconcile_page(self, db, blobs):
+        """1ページ分のオブジェクトを台帳に反映"""
+        rows = {
+            row.object_path: row for row in db.query(SupabaseGCSObjectManifest).filter(
+                SupabaseGCSObjectManifest.object_path.in_([blob.name for blob in blobs])
+            )
+        }
+        entries = []
+        for blob in blobs:
+            row = rows.get(blob.name)
+            if row is None:
+                self.stats["inserted"] += 1
+            elif row.size_bytes != blob.size or row.content_type != blob.content_type:
+                self.stats["updated"] += 1
+            elif row.width is None and self.with_dimensions and (blob.content_type or "").startswith("image/"):
+                self.stats["updated"] += 1
+            else:
+                self.stats["unchanged"] += 1
+                if self.apply:
+                    row.reconciled_at = self.started_at
+                continue
+
+            if not self.apply:
+                print(f"  [dry-run] {'追加' if row is None else '更新'}: {blob.name}")
+                continue
+            width, height = self.read_dimensions(blob)
+            entry = object_manifest_service.build_entry(
+                blob.name, blob.size, blob.content_type, width, height, object_created_at=blob.time_created
+            )
+            entry["reconciled_at"] = self.started_at
+            entries.append(entry)
+
+        if self.apply:
+            object_manifest_service.upsert(db, entries)
+            db.commit()
+        else:
+            db.rollback()
+
+    def reconcile_prefix(self, db, prefix: str, page_size: int):
+        """バケットを一覧して反映し、一覧になかった行を削除"""
+        seen = set()
+        pages = self.gcs.client.list_blobs(self.gcs.bucket_name, prefix=prefix, page_size=page_size).pages
+        for page in pages:
+            blobs = list(page)
+            if not blobs:
+                continue
+            seen.update(blob.name for blob in blobs)
+            self.stats["listed"] += len(blobs)
+            self.reconcile_page(db, blobs)
+            print(f"  {prefix}: {self.stats['listed']}件 一覧済み")
+        self.remove_stale(db, prefix, seen, page_size)
+
+    def remove_stale(self, db, prefix: str, seen: set, batch_size: int):
+        """バケットにない行を主キー順に確認して削除（実行開始後に作られた行は対象外）"""
+        last_id = 0
+        while True:
+            rows = db.query(SupabaseGCSObjectManifest.id, SupabaseGCSObjectManifest.object_path).filter(
+                SupabaseGCSObjectManifest.id > last_id,
+                SupabaseGCSObjectManifest.object_path.startswith(prefix, autoescape=True),
+                SupabaseGCSObjectManifest.created_at < self.started_at
+            ).order_by(SupabaseGCSObjectManifest.id).limit(batch_size).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            stale_ids = [row.id for row in rows if row.object_path not in seen]
+            self.stats["stale"] += len(stale_ids)
+            if not stale_ids:
+                continue
+            if not self.apply:
+                for row in rows:
+                    if row.object_path not in seen:
+                        print(f"  [dry-run] 削除: {row.object_path}")
+                continue
+            db.query(SupabaseGCSObjectManifest).filter(
+                SupabaseGCSObjectManifest.id.in_(stale_ids)
+            ).delete(synchronize_session=False)
+            db.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GCSオブジェクト台帳とバケットの突き合わせ")
+    parser.add_argument("--apply", action="store_true", help="実際に台帳を更新する（省略時はドライラン）")
+    parser.add_argument("--prefix", action="append", help=f"対象のプレフィックス（複数指定可、既定: {DEFAULT_PREFIXES}）")
+    parser.add_argument("--page-size", type=int, default=1000, help="バケット一覧・台帳確認の1回あたりの件数")
+    parser.add_argument("--with-dimensions", action="store_true", help="追加する画像の先頭を読み込んで幅・高さを記録する")
+    args = parser.parse_args()
+
+    reconciler = ManifestReconciler(GCSStorageService(), args.apply, args.with_dimensions)
+    db = SessionLocal()
+    try:
+        for prefix in args.prefix or DEFAULT_PREFIXES:
+            reconciler.reconcile_prefix(db, prefix, args.page_size)
+    finally:
+        db.close()
+
+    print(f"{'✅ 突き合わせ完了' if args.apply else '📝 ドライラン完了'}: {reconciler.stats}")
+
+
+if __name__ == "__main__":
+    main()